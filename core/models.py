@@ -11,4 +11,10 @@ from datetime import datetime
 class User(AbstractUser):
     email = models.EmailField(unique=True)
     birth_date = models.DateField(null=True)
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Staff and customer lists are ordered by user name.
+            models.Index(fields=['first_name', 'last_name']),
+        ]
     
\ No newline at end of file
@@ -4,6 +4,9 @@ from django.db.models import Count
 from django.urls import reverse
 from django.utils.html import urlencode
 from django.utils.html import format_html
+from django.utils import timezone
+from .rollups import rebuild_rollups
+from .totals import refresh_order_totals
 # Register your models here.
 
 ################################################################################## |
@@ -139,7 +142,16 @@ class OrderAdmin(admin.ModelAdmin):
     list_select_related =['restaurant','customer']
     inlines  = [OrderItemInline]
     list_filter = ['customer']
-    list_display = ['id', 'placed_at', 'customer']  
+    list_display = ['id', 'placed_at', 'customer', 'item_count', 'subtotal']
+    readonly_fields = ['subtotal', 'item_count']
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        refresh_order_totals(models.Order.objects.filter(pk=form.instance.pk))
+        # Items edited here bypass checkout, so the order's day is recomputed.
+        order = form.instance
+        day = timezone.localdate(order.placed_at)
+        rebuild_rollups(restaurant_id=order.restaurant_id, date_from=day, date_to=day)
 ##################################################################################
 ##################################################################################
 ##################################################################################
@@ -0,0 +1,12 @@
+from django.urls import re_path
+from gastro import async_views
+
+# Same paths and names as the router's, so reverse() is unchanged under ASGI.
+urlpatterns = [
+    re_path(r'^restaurants/$', async_views.restaurant_list, name='restaurants-list'),
+    re_path(r'^restaurants/(?P<pk>[^/.]+)/$', async_views.restaurant_detail, name='restaurants-detail'),
+    re_path(r'^restaurants/(?P<pk>[^/.]+)/menu/$', async_views.restaurant_menu, name='restaurants-menu'),
+    re_path(r'^products/$', async_views.product_list, name='products-list'),
+    re_path(r'^tables/$', async_views.table_list, name='tables-list'),
+    re_path(r'^orders/me/$', async_views.customer_orders, name='orders-me'),
+]
@@ -0,0 +1,240 @@
+"""
+Native async versions of the busiest read endpoints, served in place of their DRF
+viewsets by the ASGI application (GASTRO_ASGI_URLCONF, see gastroApi/asgi_urls.py).
+
+They authenticate, query and cache through Django's async APIs, so a request waiting
+on the database does not hold a worker thread, and answer with the same JSON,
+status codes and ETags as the sync views. Everything off that path (other methods,
+?search=, ?ordering=, the browsable API, a token or filter value the sync view
+would reject) is handed to the sync view, which answers as it always has.
+"""
+import functools
+from decimal import Decimal, InvalidOperation
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import Count, Max
+from django.http import HttpResponse
+from django.urls import resolve, set_urlconf
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.exceptions import APIException, AuthenticationFailed, NotFound
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from . import views
+from .authentication import RoleClaimsAuthentication, RoleTokenUser, ais_revoked, has_role_claims
+from .conditional import alast_deleted, conditional_validators, latest, list_last_modified
+from .menu import aget_menu_document
+from .models import Collection, Order, Product, Restaurant, RestaurantTable
+from .pagination import KeysetPagination
+from .roles import aget_role_context
+from .read_serializers import (ORDER_FIELDS, PRODUCT_FIELDS, TABLE_FIELDS, order_item_rows, serialize_orders,
+                               serialize_products, serialize_tables)
+from .serializers import RestaurantSerializer
+
+
+class Delegate(Exception):
+    """Raised by an async view to have the sync view answer the request instead."""
+
+
+async def delegate(request):
+    # Under ROOT_URLCONF, so the sync view's links and breadcrumbs are what WSGI would give.
+    set_urlconf(settings.ROOT_URLCONF)
+    match = resolve(request.path_info)
+    return await sync_to_async(match.func)(request, *match.args, **match.kwargs)
+
+
+async def authenticate(request):
+    """The user of the request's JWT, or None without one. Raises Delegate for a token DRF would reject."""
+    authenticator = RoleClaimsAuthentication()
+    try:
+        header = authenticator.get_header(request)
+        raw_token = authenticator.get_raw_token(header) if header else None
+        if raw_token is None:
+            return None
+        token = authenticator.get_validated_token(raw_token)
+        user_id = token[jwt_settings.USER_ID_CLAIM]
+    except (InvalidToken, AuthenticationFailed, KeyError):
+        raise Delegate
+    if has_role_claims(token):
+        if await ais_revoked(token):
+            raise Delegate
+        return RoleTokenUser(token)
+    user = await get_user_model().objects.filter(**{jwt_settings.USER_ID_FIELD: user_id}).afirst()
+    if user is None or not user.is_active:
+        raise Delegate
+    return user
+
+
+def render(data, status_code=status.HTTP_200_OK, headers=None):
+    response = HttpResponse(JSONRenderer().render(data), content_type='application/json', status=status_code)
+    return add_validators(response, headers)
+
+
+def add_validators(response, headers):
+    # Same as ConditionalGetMixin.finalize_response.
+    if headers and response.status_code in (200, 304):
+        for header, value in headers.items():
+            response[header] = value
+    return response
+
+
+def wants_browsable_api(request):
+    return 'format' in request.GET or 'text/html' in request.headers.get('Accept', '')
+
+
+def async_read_view(view_class, action, public=False):
+    """
+    Serves GETs with the decorated coroutine, called with the authenticated user,
+    and every other request with the sync view. ``cls`` and ``actions`` stand in for
+    the DRF view's own, for query budgets and read-replica routing.
+    """
+    def decorator(func):
+        @csrf_exempt
+        @functools.wraps(func)
+        async def view(request, *args, **kwargs):
+            if request.method != 'GET' or wants_browsable_api(request):
+                return await delegate(request)
+            try:
+                user = await authenticate(request)
+                if user is None and not public:
+                    raise Delegate
+                response = await func(request, user, *args, **kwargs)
+            except Delegate:
+                return await delegate(request)
+            except APIException as exc:
+                response = render({'detail': exc.detail}, exc.status_code)
+            # DRF's content negotiation adds this to every response of the sync view.
+            patch_vary_headers(response, ['Accept'])
+            return response
+
+        view.cls, view.actions = view_class, {'get': action}
+        return view
+    return decorator
+
+
+async def check_not_modified(request, view_class, user, queryset):
+    """ConditionalGetMixin's list validators, with the ETag the sync view would send."""
+    state = await queryset.aaggregate(last_modified=Max(view_class.conditional_field), count=Count('pk'))
+    last_modified = list_last_modified(state, await alast_deleted(queryset.model))
+    related = view_class.conditional_related(queryset)
+    if related is not None:
+        related = await related.aaggregate(last_modified=Max(view_class.conditional_field))
+        last_modified = latest(last_modified, related['last_modified'])
+    return conditional_validators(request, last_modified, view_class.__name__, user.id,
+                                  request.get_full_path(), state['count'])
+
+
+async def restaurant_scope(request, user):
+    role = await aget_role_context(user)
+    return request.GET.get('restaurant', None) or role.restaurant_id
+
+
+@async_read_view(views.RestaurantViewSet, 'list', public=True)
+async def restaurant_list(request, user):
+    restaurants = [restaurant async for restaurant in Restaurant.objects.all()]
+    return render(RestaurantSerializer(restaurants, many=True).data)
+
+
+@async_read_view(views.RestaurantViewSet, 'retrieve', public=True)
+async def restaurant_detail(request, user, pk):
+    try:
+        restaurant = await Restaurant.objects.aget(pk=pk)
+    except Restaurant.DoesNotExist:
+        raise NotFound('No Restaurant matches the given query.')
+    except (TypeError, ValueError):
+        raise NotFound()
+    return render(RestaurantSerializer(restaurant).data)
+
+
+@async_read_view(views.RestaurantViewSet, 'menu', public=True)
+async def restaurant_menu(request, user, pk):
+    try:
+        restaurant_id = int(pk)
+    except ValueError:
+        return render({"error": "Restaurant does not exist."}, status.HTTP_404_NOT_FOUND)
+
+    document = await aget_menu_document(restaurant_id)
+    if document is None:
+        return render({"error": "Restaurant does not exist."}, status.HTTP_404_NOT_FOUND)
+    return HttpResponse(document, content_type='application/json')
+
+
+async def filter_products(request, queryset):
+    # ProductFilter's lookups. A value it would reject goes to the sync view for its 400.
+    params = request.GET
+    try:
+        if params.get('collection_id'):
+            collection_id = int(params['collection_id'])
+            if not await Collection.objects.filter(pk=collection_id).aexists():
+                raise Delegate
+            queryset = queryset.filter(collection_id=collection_id)
+        for lookup in ('unit_price__gt', 'unit_price__lt'):
+            if params.get(lookup):
+                value = Decimal(params[lookup])
+                if not value.is_finite():
+                    raise Delegate
+                queryset = queryset.filter(**{lookup: value})
+    except (ValueError, InvalidOperation):
+        raise Delegate
+    return queryset
+
+
+@async_read_view(views.ProductViewSet, 'list')
+async def product_list(request, user):
+    if request.GET.get('search') or request.GET.get('ordering'):
+        raise Delegate
+
+    restaurant_id = await restaurant_scope(request, user)
+    queryset = Product.objects.filter(restaurant_id=restaurant_id) if restaurant_id else Product.objects.none()
+    queryset = await filter_products(request, queryset)
+
+    headers, response = await check_not_modified(request, views.ProductViewSet, user, queryset)
+    if response is not None:
+        return add_validators(response, headers)
+
+    paginator = KeysetPagination()
+    page = await paginator.apaginate_queryset(queryset, Request(request), views.ProductViewSet, PRODUCT_FIELDS)
+    return render(paginator.get_paginated_data(serialize_products(page)), headers=headers)
+
+
+@async_read_view(views.RestaurantTableView, 'list')
+async def table_list(request, user):
+    if request.GET.get('search'):
+        raise Delegate
+
+    restaurant_id = await restaurant_scope(request, user)
+    if restaurant_id:
+        queryset = RestaurantTable.objects.filter(restaurant_id=restaurant_id)
+    else:
+        queryset = RestaurantTable.objects.none()
+
+    headers, response = await check_not_modified(request, views.RestaurantTableView, user, queryset)
+    if response is not None:
+        return add_validators(response, headers)
+
+    tables = [table async for table in queryset.values(*TABLE_FIELDS)]
+    return render(serialize_tables(tables), headers=headers)
+
+
+@async_read_view(views.OrderViewSet, 'me')
+async def customer_orders(request, user):
+    role = await aget_role_context(user)
+    if role.customer_id is None:
+        # IsUserCustomer's 403, or the 400 staff get.
+        raise Delegate
+
+    orders = Order.objects.filter(customer_id=role.customer_id)
+    headers, response = await check_not_modified(request, views.OrderViewSet, user, orders)
+    if response is not None:
+        return add_validators(response, headers)
+
+    paginator = KeysetPagination()
+    page = await paginator.apaginate_queryset(orders, Request(request), views.OrderViewSet, ORDER_FIELDS)
+    items = [item async for item in order_item_rows([order['id'] for order in page])]
+    return render(paginator.get_paginated_data(serialize_orders(page, items)), headers=headers)
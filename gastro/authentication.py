@@ -0,0 +1,159 @@
+"""
+Stateless JWT authentication from role claims.
+
+Access tokens issued through djoser/simplejwt (/auth/jwt/create/ and /refresh/,
+via the serializers below) carry the user's roles as claims next to user_id::
+
+    {"roles": ["owner"], "restaurant_id": 3, "is_staff": false,
+     "owner_id": 1, "owner_restaurant_id": 3, "waiter_id": null,
+     "waiter_restaurant_id": null, "customer_id": null, ...}
+
+RoleClaimsAuthentication trusts them on gastro's views: request.user is a
+RoleTokenUser and request.role is built from the claims, without a query. Claims
+are read from the database when the token is issued or refreshed, so they can go
+stale for at most ACCESS_TOKEN_LIFETIME. A role, staff or active flag change
+puts the user's new claims on the revocation list (the cache, for that long),
+and tokens carrying others are rejected until the client refreshes.
+
+Tokens without role claims (issued before, or by AccessToken.for_user) are
+authenticated from the User row as JWTAuthentication does.
+"""
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from .replicas import primary
+from .roles import RoleContext, role_row
+
+ROLES = ('owner', 'waiter', 'customer')
+ROLE_FIELDS = RoleContext.__slots__[1:]
+LEEWAY = api_settings.LEEWAY
+# Long enough for every token issued before a change to expire.
+REVOCATION_TIMEOUT = int((api_settings.ACCESS_TOKEN_LIFETIME + (
+    LEEWAY if isinstance(LEEWAY, timedelta) else timedelta(seconds=LEEWAY))).total_seconds())
+
+
+def role_claims(role, is_staff):
+    return {
+        'roles': [name for name in ROLES if getattr(role, f'is_{name}')],
+        'restaurant_id': role.restaurant_id,
+        'is_staff': is_staff,
+        **{field: getattr(role, field) for field in ROLE_FIELDS},
+    }
+
+
+def load_role_claims(user_id):
+    """The user's claims, or None for a missing or inactive user."""
+    with primary():
+        row = role_row(user_id, 'is_staff', 'is_active').first()
+    if row is None or not row[-1]:
+        return None
+    return role_claims(RoleContext(user_id, *row[:len(ROLE_FIELDS)]), row[len(ROLE_FIELDS)])
+
+
+def has_role_claims(token):
+    return 'roles' in token
+
+
+class RoleAccessToken(AccessToken):
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token.payload.update(load_role_claims(user.pk) or {})
+        return token
+
+
+class RoleRefreshToken(RefreshToken):
+    access_token_class = RoleAccessToken
+
+    @property
+    def access_token(self):
+        # Fresh claims on every refresh, rather than a copy of the refresh token's.
+        access = super().access_token
+        access.payload.update(load_role_claims(self[api_settings.USER_ID_CLAIM]) or {})
+        return access
+
+
+class RoleTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = RoleRefreshToken
+
+
+class RoleTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = RoleRefreshToken
+
+
+class RoleTokenUser(TokenUser):
+    @cached_property
+    def id(self):
+        # The same type as User.pk, as views compare and cache by it.
+        return get_user_model()._meta.pk.to_python(self.token[api_settings.USER_ID_CLAIM])
+
+    @cached_property
+    def role(self):
+        return RoleContext(self.id, *(self.token.get(field) for field in ROLE_FIELDS))
+
+
+def revocation_key(user_id):
+    return f'gastro:revoked:{user_id}'
+
+
+def revoke_role_claims(user_id):
+    # False: no token of the user is valid any more.
+    cache.set(revocation_key(user_id), load_role_claims(user_id) or False, REVOCATION_TIMEOUT)
+
+
+def schedule_revocation(user_id):
+    # After commit, so the claims recorded are the committed ones.
+    transaction.on_commit(lambda: revoke_role_claims(user_id))
+
+
+def claims_revoked(token, current):
+    if current is None:
+        return False
+    return current is False or any(token.get(claim) != value for claim, value in current.items())
+
+
+def is_revoked(token):
+    return claims_revoked(token, cache.get(revocation_key(token[api_settings.USER_ID_CLAIM])))
+
+
+async def ais_revoked(token):
+    return claims_revoked(token, await cache.aget(revocation_key(token[api_settings.USER_ID_CLAIM])))
+
+
+def stateless_view(request):
+    view = getattr(request, 'parser_context', {}).get('view')
+    return view is not None and type(view).__module__.startswith('gastro.')
+
+
+class RoleClaimsAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication without the User query for tokens with role claims. Other
+    apps' views (djoser's /auth/users/me/) still get the User row.
+    """
+
+    def authenticate(self, request):
+        result = super().authenticate(request)
+        if result is None:
+            return None
+        user, token = result
+        if isinstance(user, RoleTokenUser) and not stateless_view(request):
+            user = super().get_user(token)
+        return user, token
+
+    def get_user(self, validated_token):
+        if not has_role_claims(validated_token):
+            return super().get_user(validated_token)
+        if is_revoked(validated_token):
+            raise AuthenticationFailed(_('Token claims are out of date, refresh the token.'), code='token_revoked')
+        return RoleTokenUser(validated_token)
@@ -0,0 +1,199 @@
+"""
+In-process latency benchmarks over the real URL routes, run by ``manage.py benchmark``.
+
+Every scenario is a request factory called once per iteration: untimed setup
+(creating a cart to check out, say) happens in the factory, and only the returned
+request is timed. Requests go through the full middleware stack and JWT
+authentication with django.test.Client against a freshly seeded test database.
+"""
+import itertools
+import json
+import statistics
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.test import Client
+
+from core.models import User
+
+from .authentication import RoleAccessToken
+from .instrumentation import QueryRecorder
+from .models import Collection, Customer, Owner, Product, Restaurant, RestaurantTable, Waiter
+
+
+class Dataset:
+    """Users, tokens and ids the scenarios work with."""
+
+    def __init__(self, restaurant, tables, products, owner, waiter, customer):
+        self.restaurant = restaurant
+        self.tables = tables
+        self.products = products
+        self.owner = owner
+        self.waiter = waiter
+        self.customer = customer
+        self.tokens = {user.pk: str(RoleAccessToken.for_user(user)) for user in (owner, waiter, customer)}
+
+    def headers(self, user):
+        return {'HTTP_AUTHORIZATION': f'JWT {self.tokens[user.pk]}'}
+
+
+def seed(products=200, tables=30, orders=500):
+    """A single restaurant with a menu, tables and order history to benchmark against."""
+    restaurant = Restaurant.objects.create(table_grid_width=10, table_grid_height=10, restaurant_title='Benchmark')
+    owner = User.objects.create(username='bench-owner', email='bench-owner@example.com')
+    waiter = User.objects.create(username='bench-waiter', email='bench-waiter@example.com')
+    customer = User.objects.create(username='bench-customer', email='bench-customer@example.com')
+    Owner.objects.create(user=owner, restaurant=restaurant)
+    Waiter.objects.create(user=waiter, restaurant=restaurant)
+    Customer.objects.create(user=customer, phone='0')
+
+    table_objects = RestaurantTable.objects.bulk_create(
+        RestaurantTable(restaurant=restaurant, seats=2 + i % 5, row=i // 10, column=i % 10) for i in range(tables))
+    collections = Collection.objects.bulk_create(
+        Collection(title=f'Collection {i}', restaurant=restaurant) for i in range(10))
+    product_objects = Product.objects.bulk_create(
+        Product(title=f'Dish {i}', slug=f'dish-{i}', description=f'Dish number {i}', unit_price=Decimal(5 + i % 20),
+                collection=collections[i % len(collections)], restaurant=restaurant)
+        for i in range(products))
+
+    dataset = Dataset(restaurant, table_objects, product_objects, owner, waiter, customer)
+    client = Client()
+    for i in range(orders):
+        checkout(client, dataset, i)()
+    return dataset
+
+
+def add_items(client, dataset, i, count=3):
+    cart = client.post('/api/carts/', **dataset.headers(dataset.customer)).json()['id']
+    items = [{'product_id': dataset.products[(i + n) % len(dataset.products)].id, 'quantity': 1} for n in range(count)]
+    client.post(f'/api/carts/{cart}/items/bulk/', {'items': items}, content_type='application/json',
+                **dataset.headers(dataset.customer))
+    return cart
+
+
+def checkout(client, dataset, i):
+    cart = add_items(client, dataset, i)
+    table = dataset.tables[i % len(dataset.tables)]
+    return lambda: client.post('/api/orders/', {
+        'cart_id': cart, 'restaurant_id': dataset.restaurant.id, 'table_id': table.id}, **dataset.headers(dataset.customer))
+
+
+def cart_add(client, dataset, i):
+    cart = client.post('/api/carts/', **dataset.headers(dataset.customer)).json()['id']
+    product = dataset.products[i % len(dataset.products)]
+    return lambda: client.post(f'/api/carts/{cart}/items/', {'product_id': product.id, 'quantity': 1},
+                               **dataset.headers(dataset.customer))
+
+
+def reserve(client, dataset, i):
+    # Every iteration books a different hour so none of them conflict.
+    start = datetime(2100, 1, 1, tzinfo=dt_timezone.utc) + timedelta(hours=i)
+    table = dataset.tables[i % len(dataset.tables)]
+    return lambda: client.post('/api/reservations/', {
+        'table': table.id, 'date_time_from': start.isoformat(),
+        'date_time_to': (start + timedelta(minutes=45)).isoformat()}, **dataset.headers(dataset.customer))
+
+
+def get(path, role=None):
+    def factory(client, dataset, i):
+        headers = dataset.headers(getattr(dataset, role)) if role else {}
+        url = path.format(restaurant=dataset.restaurant.id)
+        return lambda: client.get(url, **headers)
+    return factory
+
+
+SCENARIOS = {
+    'menu': get('/api/restaurants/{restaurant}/menu/'),
+    'menu.products': get('/api/products/?restaurant={restaurant}', 'customer'),
+    'menu.search': get('/api/products/?restaurant={restaurant}&search=dish', 'customer'),
+    'cart.add': cart_add,
+    'checkout': checkout,
+    'reservations.create': reserve,
+    'reservations.list.owner': get('/api/reservations/', 'owner'),
+    'orders.list.owner': get('/api/orders/', 'owner'),
+    'orders.list.waiter': get('/api/orders/', 'waiter'),
+    'orders.list.customer': get('/api/orders/me/', 'customer'),
+    'tables.list': get('/api/tables/', 'owner'),
+}
+
+
+def percentile(samples, q):
+    return statistics.quantiles(samples, n=100, method='inclusive')[q - 1] if len(samples) > 1 else samples[0]
+
+
+def run_scenario(factory, dataset, iterations, warmup):
+    client = Client()
+    latencies, queries, errors = [], [], 0
+    counter = itertools.count()
+    for _ in range(warmup):
+        factory(client, dataset, next(counter))()
+
+    total = 0.0
+    for _ in range(iterations):
+        request = factory(client, dataset, next(counter))
+        recorder = QueryRecorder()
+        with recorder.record():
+            start = time.perf_counter()
+            response = request()
+            elapsed = time.perf_counter() - start
+        total += elapsed
+        latencies.append(elapsed * 1000)
+        queries.append(recorder.count)
+        if response.status_code >= 400:
+            errors += 1
+
+    return {
+        'iterations': iterations,
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'throughput_rps': round(iterations / total, 1) if total else None,
+        'queries_per_request': round(statistics.mean(queries), 2),
+    }
+
+
+def run(dataset, names=None, iterations=200, warmup=20):
+    results = {}
+    for name, factory in SCENARIOS.items():
+        if names and name not in names:
+            continue
+        cache.clear()
+        results[name] = run_scenario(factory, dataset, iterations, warmup)
+    return results
+
+
+def compare(results, baseline, tolerance=0.2):
+    """
+    Per scenario: the relative change of p50/p95 and the change in queries per request
+    against the baseline, and whether it counts as a regression (slower than
+    ``tolerance`` or more queries).
+    """
+    comparison = {}
+    for name, current in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        change = {
+            metric: round((current[metric] - before[metric]) / before[metric], 3) if before[metric] else None
+            for metric in ('p50_ms', 'p95_ms')
+        }
+        change['queries_per_request'] = round(current['queries_per_request'] - before['queries_per_request'], 2)
+        change['regression'] = (
+            any(value is not None and value > tolerance for value in (change['p50_ms'], change['p95_ms']))
+            or change['queries_per_request'] > 0)
+        comparison[name] = change
+    return comparison
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)['results']
+
+
+def save(path, results):
+    with open(path, 'w') as f:
+        json.dump({'generated_at': datetime.now(dt_timezone.utc).isoformat(), 'results': results}, f, indent=2)
+        f.write('\n')
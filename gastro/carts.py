@@ -0,0 +1,406 @@
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .models import Cart, CartItem, Product
+from .totals import cart_total
+
+DEFAULT_CART_TTL = 60 * 60 * 24
+
+
+class CartBusy(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'The cart is being changed by another request, try again.'
+    default_code = 'cart_busy'
+
+
+def touch_cart(cart_id, live_since=None, using=connection):
+    """
+    Bumps the cart's last_activity, returning False when the cart is missing or
+    was last active before ``live_since``. On databases with row locks the UPDATE
+    also holds the cart against a concurrent purge or checkout until commit.
+    """
+    carts = Cart.objects.using(using.alias).filter(pk=cart_id)
+    if live_since is not None:
+        carts = carts.filter(last_activity__gte=live_since)
+    return bool(carts.update(last_activity=timezone.now()))
+
+
+def upsert_cart_items(cart_id, quantities, live_since=None, using=connection):
+    """
+    Adds ``quantities`` ({product_id: quantity}) to the cart in a single
+    INSERT ... ON CONFLICT statement, incrementing existing rows in the database
+    so concurrent adds of the same product neither lose an increment nor hit
+    the (cart, product) unique constraint.
+
+    The cart's last_activity is bumped in the same transaction; returns False,
+    adding nothing, for a missing cart or one idle since before ``live_since``.
+    """
+    qn = using.ops.quote_name
+    table = qn(CartItem._meta.db_table)
+    cart_column = qn(CartItem._meta.get_field('cart').column)
+    product_column = qn(CartItem._meta.get_field('product').column)
+    quantity_column = qn(CartItem._meta.get_field('quantity').column)
+
+    cart_value = CartItem._meta.get_field('cart').get_db_prep_value(cart_id, using)
+    params = []
+    for product_id, quantity in quantities.items():
+        params += [cart_value, product_id, quantity]
+    values = ', '.join(['(%s, %s, %s)'] * len(quantities))
+
+    sql = f'INSERT INTO {table} ({cart_column}, {product_column}, {quantity_column}) VALUES {values} '
+    if using.vendor == 'mysql':
+        sql += f'ON DUPLICATE KEY UPDATE {quantity_column} = {quantity_column} + VALUES({quantity_column})'
+    else:
+        sql += (f'ON CONFLICT ({cart_column}, {product_column}) '
+                f'DO UPDATE SET {quantity_column} = {table}.{quantity_column} + excluded.{quantity_column}')
+
+    with transaction.atomic(using=using.alias):
+        if not touch_cart(cart_id, live_since, using):
+            return False
+        if quantities:
+            with using.cursor() as cursor:
+                cursor.execute(sql, params)
+    return True
+
+
+def set_prefetched(instance, related_name, objects):
+    # Make instance.<related_name>.all() return ``objects`` without a query, as prefetch_related would.
+    queryset = getattr(instance, related_name).all()
+    queryset._result_cache = list(objects)
+    queryset._prefetch_done = True
+    if not hasattr(instance, '_prefetched_objects_cache'):
+        instance._prefetched_objects_cache = {}
+    instance._prefetched_objects_cache[related_name] = queryset
+
+
+def parse_cart_id(cart_id):
+    try:
+        return uuid.UUID(str(cart_id))
+    except ValueError:
+        return None
+
+
+class BaseCartStore:
+    """
+    Storage for carts and their items, used by the cart views and checkout.
+
+    Carts idle for more than ``ttl`` seconds (counted from the last change to
+    their items) are treated as missing and removed by ``purge_expired``. Items are returned as CartItem
+    instances with ``product`` loaded; carts as Cart instances whose
+    ``items.all()`` is already populated.
+    """
+
+    def __init__(self, ttl=DEFAULT_CART_TTL):
+        self.ttl = ttl
+
+    def create_cart(self):
+        raise NotImplementedError
+
+    def get_cart(self, cart_id):
+        raise NotImplementedError
+
+    def get_items(self, cart_id):
+        """Returns the cart's items, or None if the cart does not exist or has expired."""
+        raise NotImplementedError
+
+    def add_items(self, cart_id, quantities):
+        """Increments {product_id: quantity} and returns the affected items, or None for a missing cart."""
+        raise NotImplementedError
+
+    def update_item(self, cart_id, item_id, quantity):
+        raise NotImplementedError
+
+    def remove_item(self, cart_id, item_id):
+        raise NotImplementedError
+
+    def delete_cart(self, cart_id):
+        raise NotImplementedError
+
+    @contextmanager
+    def checkout(self, cart_id):
+        """
+        Claims the cart for an order placed in the current transaction: yields
+        its items as of the claim, or None for a missing cart. The cart is gone
+        once the transaction commits, and kept if it rolls back.
+        """
+        items = self.get_items(cart_id)
+        yield items if items is not None and self.delete_cart(cart_id) else None
+
+    def purge_expired(self, batch_size=500):
+        return 0
+
+    def get_item(self, cart_id, item_id):
+        items = self.get_items(cart_id)
+        if items is None:
+            return None
+        return next((item for item in items if str(item.id) == str(item_id)), None)
+
+
+class DatabaseCartStore(BaseCartStore):
+    """Default store: carts live in the Cart/CartItem tables."""
+
+    def expiry_cutoff(self):
+        return timezone.now() - timedelta(seconds=self.ttl)
+
+    def live_carts(self):
+        return Cart.objects.filter(last_activity__gte=self.expiry_cutoff())
+
+    def create_cart(self):
+        cart = Cart.objects.create()
+        set_prefetched(cart, 'items', [])
+        return cart
+
+    def get_cart(self, cart_id):
+        cart_id = parse_cart_id(cart_id)
+        if cart_id is None:
+            return None
+        return self.live_carts().prefetch_related('items__product') \
+            .annotate(total_price=cart_total()).filter(pk=cart_id).first()
+
+    def get_items(self, cart_id):
+        cart_id = parse_cart_id(cart_id)
+        if cart_id is None:
+            return None
+        items = list(CartItem.objects.select_related('product').filter(
+            cart_id=cart_id, cart__last_activity__gte=self.expiry_cutoff()))
+        if not items and not self.live_carts().filter(pk=cart_id).exists():
+            return None
+        return items
+
+    def add_items(self, cart_id, quantities):
+        cart_id = parse_cart_id(cart_id)
+        if cart_id is None or not upsert_cart_items(cart_id, quantities, live_since=self.expiry_cutoff()):
+            return None
+        return list(CartItem.objects.select_related('product').filter(cart_id=cart_id, product_id__in=quantities))
+
+    def update_item(self, cart_id, item_id, quantity):
+        cart_id = parse_cart_id(cart_id)
+        if cart_id is None:
+            return None
+        with transaction.atomic():
+            item = CartItem.objects.select_related('product').filter(cart_id=cart_id, pk=item_id).first()
+            if item is None or not touch_cart(cart_id, live_since=self.expiry_cutoff()):
+                return None
+            item.quantity = quantity
+            item.save(update_fields=['quantity'])
+        return item
+
+    def remove_item(self, cart_id, item_id):
+        cart_id = parse_cart_id(cart_id)
+        if cart_id is None:
+            return False
+        with transaction.atomic():
+            if not touch_cart(cart_id, live_since=self.expiry_cutoff()):
+                return False
+            deleted, _ = CartItem.objects.filter(cart_id=cart_id, pk=item_id).delete()
+        return bool(deleted)
+
+    def delete_cart(self, cart_id):
+        cart_id = parse_cart_id(cart_id)
+        if cart_id is None:
+            return False
+        deleted, _ = Cart.objects.filter(pk=cart_id).delete()
+        return bool(deleted)
+
+    @contextmanager
+    def checkout(self, cart_id):
+        # Touching the cart first holds it against concurrent changes (the write
+        # lock on SQLite, the row lock elsewhere), so the items read are the ones ordered.
+        cart_id = parse_cart_id(cart_id)
+        if cart_id is None or not touch_cart(cart_id, live_since=self.expiry_cutoff()):
+            yield None
+            return
+        items = self.get_items(cart_id)
+        self.delete_cart(cart_id)
+        yield items
+
+    def purge_expired(self, batch_size=500):
+        # Small batches, each in its own transaction, so the purge never holds the write lock for long.
+        cutoff = self.expiry_cutoff()
+        purged = 0
+        while True:
+            ids = list(Cart.objects.filter(last_activity__lt=cutoff).values_list('id', flat=True)[:batch_size])
+            if not ids:
+                return purged
+            # Re-checked on delete: a cart touched since the ids were read is live again.
+            with transaction.atomic():
+                CartItem.objects.filter(cart_id__in=ids, cart__last_activity__lt=cutoff).delete()
+                _, deleted = Cart.objects.filter(pk__in=ids, last_activity__lt=cutoff).delete()
+            purged += deleted.get(Cart._meta.label, 0)
+
+
+class CacheCartStore(BaseCartStore):
+    """
+    Keeps carts in a Django cache instead of the database, so browsing never
+    writes to the main database; only checkout does. Each cart is one cache
+    entry, stored again with a fresh TTL on every change so it expires on its
+    own once idle for that long, and item ids are the product ids.
+
+    Changes are read-modify-write on that entry under a per-cart lock (a cache
+    add), so the cache backend must be shared by all workers (e.g. Redis or
+    Memcached) rather than local memory.
+    """
+    # A crashed holder keeps the cart locked this long; a waiter gives up after lock_wait.
+    lock_timeout = 10
+    lock_wait = 5
+
+    def __init__(self, ttl=DEFAULT_CART_TTL, cache_alias='default', prefix='gastro:cart:'):
+        super().__init__(ttl)
+        self.cache_alias = cache_alias
+        self.prefix = prefix
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def key(self, cart_id):
+        return f'{self.prefix}{cart_id}'
+
+    def load(self, cart_id):
+        cart_id = parse_cart_id(cart_id)
+        if cart_id is None:
+            return None, None
+        return cart_id, self.cache.get(self.key(cart_id))
+
+    def store(self, cart_id, data):
+        self.cache.set(self.key(cart_id), data, self.ttl)
+
+    def acquire(self, cart_id):
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.lock_wait
+        while not self.cache.add(f'{self.key(cart_id)}:lock', token, self.lock_timeout):
+            if time.monotonic() >= deadline:
+                raise CartBusy()
+            time.sleep(0.01)
+        return token
+
+    def release(self, cart_id, token):
+        # Unless the lock timed out and another request holds it now.
+        if self.cache.get(f'{self.key(cart_id)}:lock') == token:
+            self.cache.delete(f'{self.key(cart_id)}:lock')
+
+    @contextmanager
+    def locked(self, cart_id):
+        """Loads the cart's data (None if missing) and holds the cart's lock until the block ends."""
+        cart_id = parse_cart_id(cart_id)
+        if cart_id is None:
+            yield None, None
+            return
+        token = self.acquire(cart_id)
+        try:
+            yield cart_id, self.cache.get(self.key(cart_id))
+        finally:
+            self.release(cart_id, token)
+
+    def build_items(self, cart_id, quantities):
+        products = Product.objects.in_bulk(list(quantities)) if quantities else {}
+        return [
+            CartItem(id=product_id, cart_id=cart_id, product=products[product_id], quantity=quantity)
+            for product_id, quantity in quantities.items() if product_id in products
+        ]
+
+    def create_cart(self):
+        cart = Cart(id=uuid.uuid4(), created_at=timezone.now())
+        self.store(cart.id, {'created_at': cart.created_at, 'items': {}})
+        set_prefetched(cart, 'items', [])
+        return cart
+
+    def get_cart(self, cart_id):
+        cart_id, data = self.load(cart_id)
+        if data is None:
+            return None
+        cart = Cart(id=cart_id, created_at=data['created_at'])
+        set_prefetched(cart, 'items', self.build_items(cart_id, data['items']))
+        return cart
+
+    def get_items(self, cart_id):
+        cart_id, data = self.load(cart_id)
+        if data is None:
+            return None
+        return self.build_items(cart_id, data['items'])
+
+    def add_items(self, cart_id, quantities):
+        with self.locked(cart_id) as (cart_id, data):
+            if data is None:
+                return None
+            for product_id, quantity in quantities.items():
+                data['items'][product_id] = data['items'].get(product_id, 0) + quantity
+            self.store(cart_id, data)
+        return self.build_items(cart_id, {product_id: data['items'][product_id] for product_id in quantities})
+
+    def update_item(self, cart_id, item_id, quantity):
+        try:
+            item_id = int(item_id)
+        except (TypeError, ValueError):
+            return None
+        with self.locked(cart_id) as (cart_id, data):
+            if data is None or item_id not in data['items']:
+                return None
+            data['items'][item_id] = quantity
+            self.store(cart_id, data)
+        items = self.build_items(cart_id, {item_id: quantity})
+        return items[0] if items else None
+
+    def remove_item(self, cart_id, item_id):
+        try:
+            item_id = int(item_id)
+        except (TypeError, ValueError):
+            return False
+        with self.locked(cart_id) as (cart_id, data):
+            if data is None or data['items'].pop(item_id, None) is None:
+                return False
+            self.store(cart_id, data)
+        return True
+
+    def delete_cart(self, cart_id):
+        with self.locked(cart_id) as (cart_id, data):
+            return data is not None and bool(self.cache.delete(self.key(cart_id)))
+
+    @contextmanager
+    def checkout(self, cart_id):
+        # The cart stays locked until the order commits, so it can be neither
+        # changed nor checked out twice meanwhile; it is only deleted then, so a
+        # rolled back order keeps it. A rollback after the block leaves the lock
+        # to time out.
+        cart_id = parse_cart_id(cart_id)
+        if cart_id is None:
+            yield False
+            return
+        token = self.acquire(cart_id)
+        try:
+            data = self.cache.get(self.key(cart_id))
+            yield None if data is None else self.build_items(cart_id, data['items'])
+        except BaseException:
+            self.release(cart_id, token)
+            raise
+
+        def finish():
+            self.cache.delete(self.key(cart_id))
+            self.release(cart_id, token)
+        transaction.on_commit(finish)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_cart_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                config = getattr(settings, 'GASTRO_CARTS', {})
+                backend = import_string(config.get('BACKEND', 'gastro.carts.DatabaseCartStore'))
+                _store = backend(ttl=config.get('TTL', DEFAULT_CART_TTL), **config.get('OPTIONS', {}))
+    return _store
@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+PER_PROCESS_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches, Tags.security, deploy=True)
+def check_revocation_cache(app_configs, **kwargs):
+    # The revocation list of role-claim tokens (gastro.authentication) is only seen by workers sharing the cache.
+    classes = getattr(settings, 'REST_FRAMEWORK', {}).get('DEFAULT_AUTHENTICATION_CLASSES', ())
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if 'gastro.authentication.RoleClaimsAuthentication' in classes and backend in PER_PROCESS_CACHES:
+        return [Error(
+            f'RoleClaimsAuthentication keeps its token revocation list in the default cache, and {backend} '
+            'is per process: a role change would not revoke tokens used against other workers.',
+            hint='Use a shared cache backend, e.g. set GASTRO_REDIS_URL.',
+            id='gastro.E001',
+        )]
+    return []
+
+
+@register(Tags.caches, deploy=True)
+def check_cart_cache(app_configs, **kwargs):
+    # CacheCartStore's carts and per-cart locks must be the same for every worker.
+    config = getattr(settings, 'GASTRO_CARTS', {})
+    if config.get('BACKEND') != 'gastro.carts.CacheCartStore':
+        return []
+    alias = config.get('OPTIONS', {}).get('cache_alias', 'default')
+    backend = settings.CACHES.get(alias, {}).get('BACKEND')
+    if backend in PER_PROCESS_CACHES:
+        return [Error(
+            f'CacheCartStore keeps carts in the {alias!r} cache, and {backend} is per process: '
+            'each worker would see its own carts and lock them separately.',
+            hint='Use a shared cache backend, e.g. set GASTRO_REDIS_URL.',
+            id='gastro.E002',
+        )]
+    return []
@@ -0,0 +1,170 @@
+"""
+Concurrency benchmark of the WSGI and ASGI request paths, run by ``manage.py benchmark_concurrency``.
+
+``clients`` concurrent clients request the endpoints gastro.async_views serves
+natively, each sending its next request as soon as the last one is answered, in
+process against a freshly seeded test database:
+
+* wsgi: a pool of ``threads`` worker threads with django.test.Client, as a threaded
+  WSGI server (gunicorn gthread) serves. Requests beyond the pool wait for a thread,
+  and that wait counts in their latency.
+* asgi-sync: one event loop running every client with django.test.AsyncClient, each
+  request in its own ThreadSensitiveContext as ASGIHandler does, served by the sync
+  DRF views (GASTRO_ASGI_URLCONF unset), each in a thread of the request's own.
+* asgi: the same, served by the native async views, whose queries go through the
+  async ORM.
+
+``db_latency`` adds a blocking sleep to every query, standing in for the round trip
+to a database server: that wait is what a sync worker thread is held for.
+"""
+import asyncio
+import statistics
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from asgiref.sync import ThreadSensitiveContext
+from django.conf import settings
+from django.core.cache import cache
+from django.db.backends.signals import connection_created
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+
+from .benchmarks import percentile
+
+PATHS = [
+    ('/api/restaurants/', None),
+    ('/api/restaurants/{restaurant}/', None),
+    ('/api/restaurants/{restaurant}/menu/', None),
+    ('/api/products/?restaurant={restaurant}', 'customer'),
+    ('/api/tables/', 'owner'),
+    ('/api/orders/me/', 'customer'),
+]
+
+
+def requests(dataset):
+    """(path, headers) pairs the clients cycle through."""
+    for path, role in PATHS:
+        token = dataset.tokens[getattr(dataset, role).pk] if role else None
+        headers = {'Authorization': f'JWT {token}'} if token else {}
+        yield path.format(restaurant=dataset.restaurant.id), headers
+
+
+class DatabaseLatency:
+    """Sleeps ``seconds`` before every query on connections opened while active."""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def __call__(self, execute, sql, params, many, context):
+        time.sleep(self.seconds)
+        return execute(sql, params, many, context)
+
+    def add(self, sender, connection, **kwargs):
+        # Outermost, so the stack other wrappers push and pop around a request stays intact.
+        connection.execute_wrappers.insert(0, self)
+
+    def __enter__(self):
+        if self.seconds:
+            connection_created.connect(self.add)
+        return self
+
+    def __exit__(self, *exc_info):
+        connection_created.disconnect(self.add)
+
+
+def summary(latencies, errors, seconds, in_flight):
+    return {
+        'requests': len(latencies),
+        'per_second': round(len(latencies) / seconds, 1),
+        'p50_ms': round(statistics.median(latencies), 2) if latencies else None,
+        'p95_ms': round(percentile(latencies, 95), 2) if latencies else None,
+        'p99_ms': round(percentile(latencies, 99), 2) if latencies else None,
+        'errors': errors,
+        'max_in_flight': in_flight,
+    }
+
+
+def run_wsgi(dataset, clients, threads, seconds):
+    local = threading.local()
+    lock = threading.Lock()
+    state = {'in_flight': 0, 'max_in_flight': 0}
+
+    def send(path, headers):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = Client()
+        with lock:
+            state['in_flight'] += 1
+            state['max_in_flight'] = max(state['max_in_flight'], state['in_flight'])
+        try:
+            return client.get(path, headers=headers).status_code
+        finally:
+            with lock:
+                state['in_flight'] -= 1
+
+    pending = list(requests(dataset))
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + seconds
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        futures = {}
+        for n in range(clients):
+            futures[pool.submit(send, *pending[n % len(pending)])] = (n, time.perf_counter())
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                n, start = futures.pop(future)
+                now = time.perf_counter()
+                latencies.append((now - start) * 1000)
+                if future.result() >= 400:
+                    errors += 1
+                if now < deadline:
+                    n += clients
+                    futures[pool.submit(send, *pending[n % len(pending)])] = (n, time.perf_counter())
+    return summary(latencies, errors, seconds, state['max_in_flight'])
+
+
+def run_asgi(dataset, clients, seconds, native=True):
+    pending = list(requests(dataset))
+    latencies, state = [], {'errors': 0, 'in_flight': 0, 'max_in_flight': 0}
+
+    async def client_loop(n, deadline):
+        client = AsyncClient()
+        while time.perf_counter() < deadline:
+            path, headers = pending[n % len(pending)]
+            start = time.perf_counter()
+            state['in_flight'] += 1
+            state['max_in_flight'] = max(state['max_in_flight'], state['in_flight'])
+            try:
+                async with ThreadSensitiveContext():
+                    response = await client.get(path, headers=headers)
+            finally:
+                state['in_flight'] -= 1
+            latencies.append((time.perf_counter() - start) * 1000)
+            if response.status_code >= 400:
+                state['errors'] += 1
+            n += clients
+
+    async def main():
+        deadline = time.perf_counter() + seconds
+        await asyncio.gather(*(client_loop(n, deadline) for n in range(clients)))
+
+    urlconf = settings.GASTRO_ASGI_URLCONF if native else None
+    with override_settings(GASTRO_ASGI_URLCONF=urlconf):
+        asyncio.run(main())
+    return summary(latencies, state['errors'], seconds, state['max_in_flight'])
+
+
+def run(dataset, clients=(1, 8, 32, 128), threads=8, seconds=5.0, db_latency=0.002):
+    """Per client count: the summary of every path."""
+    results = {}
+    with DatabaseLatency(db_latency):
+        for count in clients:
+            results[count] = {}
+            cache.clear()
+            results[count]['wsgi'] = run_wsgi(dataset, count, threads, seconds)
+            cache.clear()
+            results[count]['asgi-sync'] = run_asgi(dataset, count, seconds, native=False)
+            cache.clear()
+            results[count]['asgi'] = run_asgi(dataset, count, seconds)
+    return results
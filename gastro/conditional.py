@@ -0,0 +1,119 @@
+import hashlib
+
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def deleted_cache_key(model):
+    return f'gastro:deleted:{model._meta.label_lower}'
+
+
+def mark_deleted(model):
+    cache.set(deleted_cache_key(model), timezone.now(), None)
+
+
+def last_deleted(model):
+    return cache.get(deleted_cache_key(model))
+
+
+async def alast_deleted(model):
+    return await cache.aget(deleted_cache_key(model))
+
+
+def conditional_validators(request, last_modified, *parts):
+    """
+    The ETag / Last-Modified headers for a representation identified by ``parts`` and
+    ``last_modified``, and the 304 (or 412) response to send instead of it, if any.
+    """
+    parts = parts + (last_modified.isoformat() if last_modified else '',)
+    etag = quote_etag(hashlib.md5(repr(parts).encode()).hexdigest())
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+
+    headers = {'ETag': etag}
+    if timestamp is not None:
+        headers['Last-Modified'] = http_date(timestamp)
+    return headers, get_conditional_response(request, etag=etag, last_modified=timestamp)
+
+
+def latest(*timestamps):
+    return max((timestamp for timestamp in timestamps if timestamp is not None), default=None)
+
+
+def list_last_modified(state, deleted_at):
+    # ``state`` is the list's aggregate of the max timestamp and the row count.
+    return latest(state['last_modified'], deleted_at)
+
+
+class ConditionalResponse(Exception):
+    def __init__(self, response):
+        self.response = response
+
+
+class ConditionalGetMixin:
+    """
+    ETag / Last-Modified validators for list and retrieve, computed from
+    ``conditional_field`` without serializing anything.
+
+    Lists are validated by the max timestamp and row count of the filtered
+    queryset; the time of the last delete of the model is folded in so that
+    removing a row also changes Last-Modified. Rows of other models that the
+    representation includes are folded in through ``conditional_related()``.
+    """
+    conditional_field = 'last_update'
+
+    @staticmethod
+    def conditional_related(queryset):
+        """Other rows (with a ``conditional_field``) serialized along with ``queryset``'s, or None."""
+        return None
+
+    def related_last_modified(self, queryset):
+        related = self.conditional_related(queryset)
+        if related is None:
+            return None
+        return related.aggregate(last_modified=Max(self.conditional_field))['last_modified']
+
+    def list(self, request, *args, **kwargs):
+        if request.method in ('GET', 'HEAD'):
+            self.check_list_not_modified(self.get_list_queryset())
+        return super().list(request, *args, **kwargs)
+
+    def check_list_not_modified(self, queryset):
+        # Also for list-like actions (OrderViewSet.me), which pass their own queryset.
+        state = queryset.aggregate(last_modified=Max(self.conditional_field), count=Count('pk'))
+        last_modified = latest(list_last_modified(state, last_deleted(queryset.model)), self.related_last_modified(queryset))
+        self.check_not_modified(last_modified, self.request.get_full_path(), state['count'])
+
+    def get_list_queryset(self):
+        # Filtered once per request and shared with the page, as filters may query (ProductFilter's collection_id).
+        if getattr(self, '_list_queryset', None) is None:
+            self._list_queryset = self.filter_queryset(self.get_queryset())
+        return self._list_queryset
+
+    def get_object(self):
+        instance = super().get_object()
+        if self.request.method in ('GET', 'HEAD') and self.action == 'retrieve':
+            related = self.related_last_modified(type(instance).objects.filter(pk=instance.pk))
+            self.check_not_modified(latest(getattr(instance, self.conditional_field), related), instance.pk)
+        return instance
+
+    def check_not_modified(self, last_modified, *parts):
+        self.conditional_headers, response = conditional_validators(
+            self.request, last_modified, type(self).__name__, self.request.user.id, *parts)
+        if response is not None:
+            raise ConditionalResponse(response)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, ConditionalResponse):
+            return exc.response
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        headers = getattr(self, 'conditional_headers', None)
+        if headers and response.status_code in (200, 304):
+            for header, value in headers.items():
+                response[header] = value
+        return response
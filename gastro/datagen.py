@@ -0,0 +1,294 @@
+"""
+Deterministic, production-sized datasets for local load and query-plan work, run by
+``manage.py generate_dataset``.
+
+Everything is drawn from one ``random.Random(seed)``, so the same seed, sizes and
+end date always produce the same rows, apart from the auto_now ``last_update``
+stamps of the catalog. Rows get explicitly allocated primary keys (no RETURNING
+round trip, and order items can point at orders still in the same batch). The small
+tables go through bulk_create; orders, order items and reservations are inserted as
+plain value tuples with executemany(), each chunk of history in one large
+transaction. Bulk inserts send no signals, so the search index and sales rollups
+are rebuilt at the end.
+"""
+import random
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils.text import slugify
+
+from core.models import User
+
+from . import search
+from .models import (Collection, Customer, Order, OrderItem, Owner, Product, Restaurant, RestaurantTable,
+                     TableReservation, Waiter)
+from .rollups import rebuild_rollups
+
+FIRST_NAMES = ['Adam', 'Eva', 'Jana', 'Peter', 'Lucia', 'Martin', 'Zuzana', 'Tomas', 'Maria', 'Jakub',
+               'Katarina', 'Michal', 'Petra', 'Lukas', 'Veronika', 'Matej', 'Simona', 'Filip', 'Monika', 'Samuel']
+LAST_NAMES = ['Novak', 'Horvath', 'Kovac', 'Varga', 'Toth', 'Nagy', 'Balaz', 'Molnar', 'Szabo', 'Baran',
+              'Turna', 'Turcan', 'Kral', 'Lukac', 'Urban', 'Polak', 'Kucera', 'Hudak', 'Blaho', 'Sykora']
+RESTAURANT_WORDS = ['Golden', 'Old Town', 'Green', 'Corner', 'River', 'Harbour', 'Garden', 'Little', 'Royal', 'Blue']
+RESTAURANT_KINDS = ['Bistro', 'Kitchen', 'Grill', 'Trattoria', 'Brasserie', 'Tavern', 'Diner', 'Eatery']
+# Collection title and the median price of its dishes.
+COLLECTIONS = [('Starters', 6), ('Soups', 4), ('Salads', 7), ('Mains', 13), ('Pasta', 10), ('Pizza', 9),
+               ('Grill', 16), ('Sides', 3), ('Desserts', 5), ('Drinks', 3), ('Wine', 6), ('Beer', 3), ('Coffee', 2)]
+DISH_ADJECTIVES = ['Roasted', 'Grilled', 'Crispy', 'Smoked', 'Spicy', 'Creamy', 'Garlic', 'Homemade', 'Classic',
+                   'Seasonal', 'Wild', 'Stuffed', 'Braised', 'Fresh', 'Sweet']
+DISH_NOUNS = ['Chicken', 'Salmon', 'Beef', 'Mushrooms', 'Dumplings', 'Risotto', 'Halloumi', 'Pork Belly', 'Duck',
+              'Lentils', 'Tomatoes', 'Goulash', 'Trout', 'Cheese', 'Pancakes', 'Aubergine']
+
+SEATS_WEIGHTS = {2: 40, 4: 40, 6: 15, 8: 5}
+# Relative number of orders per hour of day, around lunch and dinner.
+HOUR_WEIGHTS = {11: 4, 12: 10, 13: 9, 14: 4, 15: 2, 16: 2, 17: 4, 18: 8, 19: 10, 20: 8, 21: 4, 22: 2}
+# Monday first; Friday and Saturday are the busy days.
+WEEKDAY_WEIGHTS = [0.8, 0.85, 0.9, 1.0, 1.4, 1.5, 1.1]
+ITEMS_PER_ORDER_WEIGHTS = {1: 30, 2: 30, 3: 20, 4: 10, 5: 6, 6: 4}
+QUANTITY_WEIGHTS = {1: 75, 2: 18, 3: 5, 4: 2}
+FAILED_SHARE = 0.03
+RUSH_SHARE = 0.05
+
+# Column order of the raw order, order item and reservation inserts.
+ORDER_COLUMNS = ['id', 'restaurant', 'table', 'customer', 'order', 'placed_at', 'payment_status', 'last_update',
+                 'subtotal', 'item_count', 'rush', 'acknowledged_at', 'bumped_at']
+ORDER_ITEM_COLUMNS = ['order', 'product', 'quantity', 'unit_price']
+RESERVATION_COLUMNS = ['id', 'table', 'customer', 'date_time_from', 'date_time_to', 'last_update']
+
+
+def weighted(weights):
+    return list(weights), list(weights.values())
+
+
+def zipf_weights(count, exponent=1.0):
+    # A few dishes and regulars account for most orders.
+    return [1 / (rank + 1) ** exponent for rank in range(count)]
+
+
+def next_id(model):
+    return (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+
+def allocate_ids(model, objects):
+    for pk, instance in enumerate(objects, next_id(model)):
+        instance.pk = pk
+    return objects
+
+
+def reset_sequences(models):
+    # Explicit primary keys don't advance the backend's sequences (a no-op on SQLite).
+    statements = connection.ops.sequence_reset_sql(no_style(), models)
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+class Generator:
+    def __init__(self, seed=0, restaurants=10, customers=5000, products=60, orders=20000, days=365,
+                 reservation_rate=0.3, end_date=None, batch_size=5000, commit_every=100000,
+                 password='gastro-dataset', log=None):
+        self.rng = random.Random(seed)
+        self.prefix = f'gen{seed}-'
+        self.restaurants = restaurants
+        self.customers = customers
+        self.products = products
+        self.orders = orders
+        self.days = days
+        self.reservation_rate = reservation_rate
+        self.end_date = end_date or datetime.now(dt_timezone.utc).date()
+        self.batch_size = batch_size
+        self.commit_every = commit_every
+        self.password = password
+        self.log = log or (lambda message: None)
+        self.counts = dict.fromkeys(('restaurants', 'tables', 'users', 'products', 'orders', 'order_items',
+                                     'reservations'), 0)
+
+    def exists(self):
+        return User.objects.filter(username__startswith=self.prefix).exists()
+
+    def generate(self):
+        password = make_password(self.password)
+        with transaction.atomic():
+            customer_ids = self.create_customers(password)
+        for n in range(self.restaurants):
+            with transaction.atomic():
+                restaurant, table_ids, menu = self.create_restaurant(n, password)
+            self.log(f'{restaurant.restaurant_title}: {len(table_ids)} tables, {len(menu)} products')
+            self.create_orders(restaurant, table_ids, menu, customer_ids)
+            self.create_reservations(table_ids, customer_ids)
+            rebuild_rollups(restaurant.pk)
+        reset_sequences([User, Customer, Owner, Waiter, Restaurant, RestaurantTable, Collection, Product, Order,
+                         OrderItem, TableReservation])
+        search.rebuild_index()
+        return self.counts
+
+    def insert_rows(self, model, columns, rows):
+        # At this volume building model instances costs more than the inserts themselves.
+        sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+            connection.ops.quote_name(model._meta.db_table),
+            ', '.join(connection.ops.quote_name(model._meta.get_field(name).column) for name in columns),
+            ', '.join(['%s'] * len(columns)))
+        with connection.cursor() as cursor:
+            for start in range(0, len(rows), self.batch_size):
+                cursor.executemany(sql, rows[start:start + self.batch_size])
+
+    def bulk_create(self, model, objects):
+        model.objects.bulk_create(allocate_ids(model, objects), batch_size=self.batch_size)
+        return objects
+
+    def user(self, role, n, password):
+        username = f'{self.prefix}{role}-{n}'
+        return User(username=username, email=f'{username}@example.com', password=password,
+                    first_name=self.rng.choice(FIRST_NAMES), last_name=self.rng.choice(LAST_NAMES))
+
+    def create_users(self, role, count, password):
+        users = self.bulk_create(User, [self.user(role, n, password) for n in range(count)])
+        self.counts['users'] += count
+        return [user.pk for user in users]
+
+    def create_customers(self, password):
+        user_ids = self.create_users('customer', self.customers, password)
+        customers = self.bulk_create(Customer, [
+            Customer(user_id=user_id, phone=f'+4219{self.rng.randrange(10 ** 8):08d}') for user_id in user_ids])
+        return [customer.pk for customer in customers]
+
+    def create_restaurant(self, n, password):
+        rng = self.rng
+        width, height = rng.randint(6, 12), rng.randint(6, 12)
+        title = f'{rng.choice(RESTAURANT_WORDS)} {rng.choice(RESTAURANT_KINDS)} {n + 1}'
+        restaurant = self.bulk_create(Restaurant, [Restaurant(
+            table_grid_width=width, table_grid_height=height, restaurant_title=title,
+            restaurant_status=Restaurant.RESTAURANT_OPEN)])[0]
+        self.counts['restaurants'] += 1
+
+        owner_id, *waiter_ids = self.create_users(f'r{n}-staff', 1 + rng.randint(3, 8), password)
+        self.bulk_create(Owner, [Owner(restaurant=restaurant, user_id=owner_id)])
+        self.bulk_create(Waiter, [Waiter(restaurant=restaurant, user_id=user_id) for user_id in waiter_ids])
+
+        cells = rng.sample([(row, column) for row in range(height) for column in range(width)],
+                           k=max(1, width * height // 2))
+        seats, seat_weights = weighted(SEATS_WEIGHTS)
+        tables = self.bulk_create(RestaurantTable, [
+            RestaurantTable(restaurant=restaurant, row=row, column=column,
+                            seats=rng.choices(seats, seat_weights)[0])
+            for row, column in sorted(cells)])
+        self.counts['tables'] += len(tables)
+
+        kinds = sorted(rng.sample(COLLECTIONS, k=rng.randint(5, 10)))
+        collections = self.bulk_create(Collection, [
+            Collection(title=title, restaurant=restaurant) for title, _ in kinds])
+        products = []
+        for i in range(self.products):
+            collection = rng.randrange(len(collections))
+            median = kinds[collection][1]
+            dish = f'{rng.choice(DISH_ADJECTIVES)} {rng.choice(DISH_NOUNS)}'
+            price = Decimal(str(round(max(1.0, median * rng.lognormvariate(0, 0.3)), 1))).quantize(Decimal('0.01'))
+            products.append(Product(
+                title=dish, slug=f'{slugify(dish)}-{i}', description=f'{dish} from our {kinds[collection][0].lower()}.',
+                unit_price=price, collection=collections[collection], restaurant=restaurant))
+        self.bulk_create(Product, products)
+        self.counts['products'] += len(products)
+        for collection in collections:
+            featured = next((product for product in products if product.collection_id == collection.pk), None)
+            collection.featured_product = featured
+        Collection.objects.bulk_update(collections, ['featured_product'])
+
+        # Popularity rank is independent of the order the dishes were created in.
+        rng.shuffle(products)
+        return restaurant, [table.pk for table in tables], [(product.pk, product.unit_price) for product in products]
+
+    def daily_counts(self):
+        """Orders per day over the history, following the weekday pattern and a slow growth trend."""
+        first = self.end_date - timedelta(days=self.days - 1)
+        days = [first + timedelta(days=offset) for offset in range(self.days)]
+        weights = [WEEKDAY_WEIGHTS[day.weekday()] * (0.7 + 0.6 * offset / max(1, self.days - 1))
+                   * self.rng.uniform(0.85, 1.15) for offset, day in enumerate(days)]
+        scale = self.orders / sum(weights)
+        return [(day, round(weight * scale)) for day, weight in zip(days, weights)]
+
+    def create_orders(self, restaurant, table_ids, menu, customer_ids):
+        rng = self.rng
+        stamp = connection.ops.adapt_datetimefield_value
+        hours, hour_weights = weighted(HOUR_WEIGHTS)
+        sizes, size_weights = weighted(ITEMS_PER_ORDER_WEIGHTS)
+        quantities, quantity_weights = weighted(QUANTITY_WEIGHTS)
+        product_weights = list(accumulate(zipf_weights(len(menu))))
+        customer_weights = list(accumulate(zipf_weights(len(customer_ids), 0.5)))
+
+        orders, items = [], []
+        order_id = next_id(Order)
+        for day, count in self.daily_counts():
+            stamps = sorted(
+                datetime.combine(day, time(rng.choices(hours, hour_weights)[0], rng.randrange(60), rng.randrange(60)),
+                                 dt_timezone.utc)
+                for _ in range(count))
+            for placed_at in stamps:
+                lines = {}
+                for product in rng.choices(menu, cum_weights=product_weights, k=rng.choices(sizes, size_weights)[0]):
+                    lines[product] = lines.get(product, 0) + rng.choices(quantities, quantity_weights)[0]
+                status = self.payment_status(day)
+                acknowledged_at = bumped_at = None
+                if status == Order.ORDER_COMPLETE:
+                    acknowledged_at = placed_at + timedelta(seconds=rng.randint(30, 300))
+                    bumped_at = acknowledged_at + timedelta(seconds=rng.randint(300, 1500))
+                orders.append((
+                    order_id, restaurant.pk, rng.choice(table_ids),
+                    rng.choices(customer_ids, cum_weights=customer_weights)[0], '', stamp(placed_at), status,
+                    stamp(bumped_at or placed_at), sum(quantity * price for (_, price), quantity in lines.items()),
+                    sum(lines.values()), rng.random() < RUSH_SHARE, stamp(acknowledged_at), stamp(bumped_at)))
+                items.extend((order_id, product_id, quantity, price) for (product_id, price), quantity in lines.items())
+                order_id += 1
+            if len(orders) >= self.commit_every:
+                self.write_orders(orders, items)
+                orders, items = [], []
+        self.write_orders(orders, items)
+
+    def payment_status(self, day):
+        if self.rng.random() < FAILED_SHARE:
+            return Order.ORDER_FAILED
+        # Only the last day still has open tabs.
+        if day == self.end_date and self.rng.random() < 0.4:
+            return Order.ORDER_PENDING
+        return Order.ORDER_COMPLETE
+
+    def write_orders(self, orders, items):
+        if not orders:
+            return
+        with transaction.atomic():
+            self.insert_rows(Order, ORDER_COLUMNS, orders)
+            self.insert_rows(OrderItem, ORDER_ITEM_COLUMNS, items)
+        self.counts['orders'] += len(orders)
+        self.counts['order_items'] += len(items)
+        self.log(f'  {self.counts["orders"]} orders, {self.counts["order_items"]} order items')
+
+    def create_reservations(self, table_ids, customer_ids):
+        """Evening bookings over the history and two weeks ahead, never overlapping on a table."""
+        rng = self.rng
+        stamp = connection.ops.adapt_datetimefield_value
+        first = self.end_date - timedelta(days=self.days - 1)
+        reservation_id = next_id(TableReservation)
+        reservations = []
+        for offset in range(self.days + 14):
+            day = first + timedelta(days=offset)
+            for table_id in table_ids:
+                if rng.random() >= self.reservation_rate * WEEKDAY_WEIGHTS[day.weekday()]:
+                    continue
+                start = datetime.combine(day, time(17), dt_timezone.utc) + timedelta(minutes=30 * rng.randrange(6))
+                for _ in range(rng.choices([1, 2], [3, 1])[0]):
+                    end = start + timedelta(minutes=rng.choice([60, 90, 120, 150]))
+                    booked_at = start - timedelta(days=rng.randint(1, 14))
+                    reservations.append(
+                        (reservation_id, table_id, rng.choice(customer_ids), stamp(start), stamp(end), stamp(booked_at)))
+                    reservation_id += 1
+                    start = end + timedelta(minutes=30 * rng.randint(0, 2))
+        with transaction.atomic():
+            self.insert_rows(TableReservation, RESERVATION_COLUMNS, reservations)
+        self.counts['reservations'] += len(reservations)
+
+
+def generate(**options):
+    return Generator(**options).generate()
@@ -0,0 +1,120 @@
+"""
+Concurrent-writer benchmark of SQLite connection profiles, run by ``manage.py benchmark_database``.
+
+Each profile gets a fresh database file, registered as an extra connection alias so
+every thread goes through Django's backend (gastro.sqlite's pragmas and BEGIN IMMEDIATE,
+CONN_MAX_AGE) exactly as requests would. Writer threads run checkout-shaped
+transactions (read the table, insert an order and its items); reader threads run the
+list query. Without CONN_MAX_AGE a thread reconnects after every transaction, as a
+request would.
+"""
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.db import OperationalError, connections, transaction
+
+from .benchmarks import percentile
+
+ALIAS = 'gastro-db-benchmark'
+
+SCHEMA = [
+    'CREATE TABLE bench_order (id INTEGER PRIMARY KEY, table_id INTEGER NOT NULL, placed_at REAL NOT NULL)',
+    'CREATE TABLE bench_item (id INTEGER PRIMARY KEY, order_id INTEGER NOT NULL, product_id INTEGER NOT NULL, '
+    'quantity INTEGER NOT NULL)',
+    'CREATE INDEX bench_order_table ON bench_order (table_id, placed_at)',
+]
+
+
+def profiles():
+    return {
+        'default': {},
+        'production': getattr(settings, 'GASTRO_SQLITE_PRODUCTION', {}),
+    }
+
+
+def checkout(cursor, n):
+    cursor.execute('SELECT COUNT(*) FROM bench_order WHERE table_id = %s', [n % 30])
+    cursor.execute('INSERT INTO bench_order (table_id, placed_at) VALUES (%s, %s)', [n % 30, time.time()])
+    order_id = cursor.lastrowid
+    cursor.executemany('INSERT INTO bench_item (order_id, product_id, quantity) VALUES (%s, %s, %s)',
+                       [(order_id, product, 1) for product in range(3)])
+
+
+def list_orders(cursor, n):
+    cursor.execute('SELECT id, table_id, placed_at FROM bench_order WHERE table_id = %s '
+                   'ORDER BY placed_at DESC LIMIT 10', [n % 30])
+    cursor.fetchall()
+
+
+class Worker(threading.Thread):
+    def __init__(self, work, writes, deadline):
+        super().__init__(daemon=True)
+        self.work, self.writes, self.deadline = work, writes, deadline
+        self.latencies, self.errors = [], 0
+
+    def run(self):
+        connection = connections[ALIAS]
+        n = 0
+        try:
+            while time.perf_counter() < self.deadline:
+                start = time.perf_counter()
+                try:
+                    if self.writes:
+                        with transaction.atomic(using=ALIAS), connection.cursor() as cursor:
+                            self.work(cursor, n)
+                    else:
+                        with connection.cursor() as cursor:
+                            self.work(cursor, n)
+                    self.latencies.append((time.perf_counter() - start) * 1000)
+                except OperationalError:
+                    # "database is locked": the request would have failed.
+                    self.errors += 1
+                # What request_finished does at the end of every request.
+                connection.close_if_unusable_or_obsolete()
+                n += 1
+        finally:
+            connection.close()
+
+
+def run_profile(overrides, writers=8, readers=4, seconds=5.0):
+    with tempfile.TemporaryDirectory() as directory:
+        database = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': os.path.join(directory, 'bench.sqlite3')}
+        database.update(overrides)
+        connections.settings[ALIAS] = connections.configure_settings({'default': database})['default']
+        try:
+            with connections[ALIAS].cursor() as cursor:
+                for sql in SCHEMA:
+                    cursor.execute(sql)
+            connections[ALIAS].close()
+
+            deadline = time.perf_counter() + seconds
+            threads = [Worker(checkout, True, deadline) for _ in range(writers)]
+            threads += [Worker(list_orders, False, deadline) for _ in range(readers)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            connections[ALIAS].close()
+            del connections[ALIAS]
+            del connections.settings[ALIAS]
+
+    def summary(workers):
+        latencies = [latency for worker in workers for latency in worker.latencies]
+        return {
+            'per_second': round(len(latencies) / seconds, 1),
+            'errors': sum(worker.errors for worker in workers),
+            'p50_ms': round(statistics.median(latencies), 3) if latencies else None,
+            'p95_ms': round(percentile(latencies, 95), 3) if latencies else None,
+        }
+
+    return {'writes': summary(threads[:writers]), 'reads': summary(threads[writers:])}
+
+
+def run(names=None, writers=8, readers=4, seconds=5.0):
+    return {name: run_profile(overrides, writers, readers, seconds)
+            for name, overrides in profiles().items() if not names or name in names}
@@ -0,0 +1,181 @@
+import asyncio
+import json
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+ORDER_CREATED = 'order.created'
+ORDER_PAYMENT_STATUS_CHANGED = 'order.payment_status_changed'
+TABLE_STATUS_CHANGED = 'table.status_changed'
+RESERVATION_CREATED = 'reservation.created'
+RESERVATION_CANCELLED = 'reservation.cancelled'
+KITCHEN_TICKETS_UPDATED = 'kitchen.tickets_updated'
+
+
+def restaurant_channel(restaurant_id):
+    return f'restaurant:{restaurant_id}'
+
+
+def customer_channel(customer_id):
+    return f'customer:{customer_id}'
+
+
+class BaseBroadcaster:
+    """
+    Fan-out of events to subscribers of named channels.
+
+    ``publish`` is called synchronously from model signal handlers (any thread);
+    ``subscribe`` is used by the async event stream view and returns an object
+    with ``async get(timeout)`` (a message, or None on timeout) and ``async close()``.
+    """
+
+    def publish(self, channel, message):
+        raise NotImplementedError
+
+    def subscribe(self, channels):
+        raise NotImplementedError
+
+
+class InProcessSubscription:
+    def __init__(self, broadcaster, channels, max_queue_size):
+        self.broadcaster = broadcaster
+        self.channels = channels
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=max_queue_size)
+
+    def deliver(self, message):
+        # Runs on the subscriber's event loop. A client that stops reading loses the
+        # oldest events instead of growing the queue without bound.
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+    async def get(self, timeout=None):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def close(self):
+        self.broadcaster.unregister(self)
+
+
+class InProcessBroadcaster(BaseBroadcaster):
+    """Single-process backend. Every worker only sees events raised in that worker."""
+
+    def __init__(self, max_queue_size=100):
+        self.max_queue_size = max_queue_size
+        self._subscriptions = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, message)
+            except RuntimeError:
+                # The subscriber's loop is already closed.
+                self.unregister(subscription)
+
+    def subscribe(self, channels):
+        subscription = InProcessSubscription(self, channels, self.max_queue_size)
+        with self._lock:
+            for channel in channels:
+                self._subscriptions[channel].add(subscription)
+        return subscription
+
+    def unregister(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscriptions.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscriptions[channel]
+
+
+class RedisSubscription:
+    def __init__(self, pubsub, channels):
+        self.pubsub = pubsub
+        self.channels = channels
+
+    async def get(self, timeout=None):
+        # Subscribing is deferred to the first get() so that subscribe() stays synchronous.
+        if not self.pubsub.subscribed:
+            await self.pubsub.subscribe(*self.channels)
+        message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=timeout)
+        if message is None:
+            return None
+        return json.loads(message['data'])
+
+    async def close(self):
+        await self.pubsub.unsubscribe()
+        await self.pubsub.aclose()
+
+
+class RedisBroadcaster(BaseBroadcaster):
+    """Redis pub/sub backend for deployments with several workers. Requires the ``redis`` package."""
+
+    def __init__(self, url='redis://localhost:6379/0', prefix='gastro:events:'):
+        try:
+            import redis
+            import redis.asyncio
+        except ImportError as e:
+            raise ImproperlyConfigured('RedisBroadcaster requires the "redis" package.') from e
+        self.url = url
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+        self._async_client = redis.asyncio.Redis.from_url(url)
+
+    def publish(self, channel, message):
+        self._client.publish(self.prefix + channel, json.dumps(message, cls=DjangoJSONEncoder))
+
+    def subscribe(self, channels):
+        return RedisSubscription(self._async_client.pubsub(), [self.prefix + channel for channel in channels])
+
+
+_broadcaster = None
+_broadcaster_lock = threading.Lock()
+
+
+def get_broadcaster():
+    global _broadcaster
+    if _broadcaster is None:
+        with _broadcaster_lock:
+            if _broadcaster is None:
+                config = getattr(settings, 'GASTRO_EVENTS', {})
+                backend = import_string(config.get('BACKEND', 'gastro.events.InProcessBroadcaster'))
+                _broadcaster = backend(**config.get('OPTIONS', {}))
+    return _broadcaster
+
+
+def publish_event(event_type, data, restaurant_id=None, customer_id=None):
+    message = json.loads(json.dumps({'type': event_type, 'data': data}, cls=DjangoJSONEncoder))
+    channels = []
+    if restaurant_id is not None:
+        channels.append(restaurant_channel(restaurant_id))
+    if customer_id is not None:
+        channels.append(customer_channel(customer_id))
+
+    def send():
+        broadcaster = get_broadcaster()
+        for channel in channels:
+            broadcaster.publish(channel, message)
+
+    # Only announce changes that actually made it to the database.
+    transaction.on_commit(send)
+
+
+def format_sse(message, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f"event: {message['type']}")
+    lines.append(f'data: {json.dumps(message, cls=DjangoJSONEncoder)}')
+    return '\n'.join(lines) + '\n\n'
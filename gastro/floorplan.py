@@ -0,0 +1,85 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, DecimalField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Order, Restaurant, RestaurantTable, TableReservation
+from .replicas import primary
+
+# Snapshots are invalidated on every table/order/reservation change; the timeout only
+# bounds how long "next_reservation" can lag behind a reservation that has just ended.
+FLOOR_PLAN_CACHE_TIMEOUT = getattr(settings, 'GASTRO_FLOOR_PLAN_CACHE_TIMEOUT', 60)
+
+
+def floor_plan_cache_key(restaurant_id):
+    return f'gastro:floor-plan:{restaurant_id}'
+
+
+def build_floor_plan(restaurant_id):
+    restaurant = Restaurant.objects.filter(pk=restaurant_id).values(
+        'id', 'restaurant_title', 'restaurant_status', 'table_grid_width', 'table_grid_height').first()
+    if restaurant is None:
+        return None
+
+    now = timezone.now()
+    open_orders = Order.objects \
+        .filter(table_id=OuterRef('pk'), payment_status=Order.ORDER_PENDING) \
+        .order_by().values('table_id') \
+        .annotate(count=Count('pk')).values('count')
+    open_total = Order.objects \
+        .filter(table_id=OuterRef('pk'), payment_status=Order.ORDER_PENDING) \
+        .order_by().values('table_id') \
+        .annotate(total=Sum('subtotal')).values('total')
+    next_reservation = TableReservation.objects \
+        .filter(table_id=OuterRef('pk'), date_time_to__gt=now) \
+        .order_by('date_time_from').values('pk')[:1]
+
+    money = DecimalField(max_digits=12, decimal_places=2)
+    tables = list(RestaurantTable.objects
+        .filter(restaurant_id=restaurant_id)
+        .order_by('row', 'column', 'id')
+        .annotate(
+            open_orders=Coalesce(Subquery(open_orders), 0),
+            open_total=Coalesce(Subquery(open_total, output_field=money), Value(0), output_field=money),
+            next_reservation_id=Subquery(next_reservation),
+        )
+        .values('id', 'row', 'column', 'seats', 'table_status', 'open_orders', 'open_total', 'next_reservation_id'))
+
+    reservation_ids = [table['next_reservation_id'] for table in tables if table['next_reservation_id']]
+    reservations = TableReservation.objects.in_bulk(reservation_ids) if reservation_ids else {}
+
+    for table in tables:
+        reservation = reservations.get(table.pop('next_reservation_id'))
+        table['next_reservation'] = None if reservation is None else {
+            'id': reservation.id,
+            'customer': reservation.customer_id,
+            'date_time_from': reservation.date_time_from,
+            'date_time_to': reservation.date_time_to,
+        }
+
+    return {
+        'restaurant': restaurant,
+        'tables': tables,
+        'generated_at': now,
+    }
+
+
+def get_floor_plan(restaurant_id):
+    key = floor_plan_cache_key(restaurant_id)
+    snapshot = cache.get(key)
+    if snapshot is None:
+        with primary():
+            snapshot = build_floor_plan(restaurant_id)
+        if snapshot is not None:
+            cache.set(key, snapshot, FLOOR_PLAN_CACHE_TIMEOUT)
+    return snapshot
+
+
+def invalidate_floor_plan(restaurant_id):
+    key = floor_plan_cache_key(restaurant_id)
+    cache.delete(key)
+    # Drop it again once the surrounding transaction commits, so a snapshot rebuilt from
+    # half-written data (e.g. an order whose items are not inserted yet) doesn't stick.
+    transaction.on_commit(lambda: cache.delete(key))
@@ -0,0 +1,72 @@
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+N_PLUS_ONE_THRESHOLD = getattr(settings, 'GASTRO_N_PLUS_ONE_THRESHOLD', 3)
+
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+PLACEHOLDER_LIST_RE = re.compile(r'\((?:\s*(?:%s|\?)\s*,)+\s*(?:%s|\?)\s*\)')
+SPACE_RE = re.compile(r'\s+')
+TRANSACTION_RE = re.compile(r'\s*(SAVEPOINT|RELEASE SAVEPOINT|ROLLBACK TO SAVEPOINT)\b', re.IGNORECASE)
+
+
+def sql_shape(sql):
+    """SQL with literals and parameter lists collapsed, so repeats of one query compare equal."""
+    shape = STRING_RE.sub('?', sql)
+    shape = NUMBER_RE.sub('?', shape)
+    shape = shape.replace('%s', '?')
+    shape = PLACEHOLDER_LIST_RE.sub('(...)', shape)
+    return SPACE_RE.sub(' ', shape).strip()
+
+
+def view_query_budget(view_func, method):
+    """
+    The ``query_budget`` declared on a DRF view: an int for every action, or a dict
+    keyed by action name (``'*'`` for the rest). None if the view declares none.
+    """
+    view_class = getattr(view_func, 'cls', None)
+    budget = getattr(view_class, 'query_budget', None)
+    if not isinstance(budget, dict):
+        return budget
+    actions = getattr(view_func, 'actions', None) or {}
+    action = actions.get(method.lower(), method.lower())
+    return budget.get(action, budget.get('*'))
+
+
+class QueryRecorder:
+    """Database execute wrapper that keeps the SQL and timing of every query it sees."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - start))
+
+    def record(self):
+        # Wraps every configured database until the returned context exits.
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(self))
+        return stack
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def duration(self):
+        return sum(duration for _, duration in self.queries)
+
+    def repeated(self, threshold=N_PLUS_ONE_THRESHOLD):
+        """SQL shapes run at least ``threshold`` times: the usual signature of an N+1."""
+        shapes = Counter(sql_shape(sql) for sql, _ in self.queries if not TRANSACTION_RE.match(sql))
+        return {shape: count for shape, count in shapes.items() if count >= threshold}
@@ -0,0 +1,67 @@
+from django.db import transaction
+from django.utils import timezone
+
+from . import events
+from .models import Order, OrderItem
+
+# Rush tickets first, then oldest first; the table breaks ties between orders placed together.
+# Kept in step with the (restaurant, payment_status, -rush, placed_at, table) index on Order,
+# which then returns the tickets already sorted.
+TICKET_ORDERING = ['-rush', 'placed_at', 'table_id', 'id']
+
+
+def queued_orders(restaurant_id):
+    return Order.objects.filter(
+        restaurant_id=restaurant_id, payment_status=Order.ORDER_PENDING, bumped_at__isnull=True)
+
+
+def kitchen_queue(restaurant_id):
+    """Pending, not yet bumped orders as compact tickets, in priority order. Two queries."""
+    tickets = list(queued_orders(restaurant_id)
+        .order_by(*TICKET_ORDERING)
+        .values('id', 'table_id', 'placed_at', 'rush', 'acknowledged_at'))
+    if not tickets:
+        return []
+
+    items = {}
+    for item in OrderItem.objects \
+            .filter(order_id__in=[ticket['id'] for ticket in tickets]) \
+            .order_by('order_id', 'id') \
+            .values('order_id', 'product_id', 'product__title', 'quantity'):
+        items.setdefault(item['order_id'], []).append({
+            'product': item['product_id'],
+            'title': item['product__title'],
+            'quantity': item['quantity'],
+        })
+
+    for ticket in tickets:
+        ticket['table'] = ticket.pop('table_id')
+        ticket['items'] = items.get(ticket['id'], [])
+    return tickets
+
+
+def update_tickets(restaurant_id, order_ids, exclude=None, **values):
+    """Applies ``values`` to the queued orders among ``order_ids`` in one UPDATE and returns the ids changed."""
+    with transaction.atomic():
+        queryset = queued_orders(restaurant_id).filter(pk__in=order_ids)
+        if exclude:
+            queryset = queryset.exclude(**exclude)
+        updated = list(queryset.values_list('id', flat=True))
+        if updated:
+            # QuerySet.update() skips auto_now, so last_update is set explicitly for conditional GETs.
+            Order.objects.filter(pk__in=updated).update(last_update=timezone.now(), **values)
+            events.publish_event(events.KITCHEN_TICKETS_UPDATED, {'orders': updated, **values}, restaurant_id=restaurant_id)
+    return updated
+
+
+def acknowledge_tickets(restaurant_id, order_ids):
+    # Acknowledging again keeps the original time.
+    return update_tickets(restaurant_id, order_ids, exclude={'acknowledged_at__isnull': False}, acknowledged_at=timezone.now())
+
+
+def bump_tickets(restaurant_id, order_ids):
+    return update_tickets(restaurant_id, order_ids, bumped_at=timezone.now())
+
+
+def set_rush(restaurant_id, order_ids, rush=True):
+    return update_tickets(restaurant_id, order_ids, rush=rush)
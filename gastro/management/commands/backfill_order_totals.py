@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from gastro.models import Order
+from gastro.totals import refresh_order_totals
+
+
+class Command(BaseCommand):
+    help = 'Recomputes Order.subtotal and Order.item_count from the order items, in batches of orders.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = 0
+        updated = 0
+        while True:
+            ids = list(Order.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                break
+            with transaction.atomic():
+                updated += refresh_order_totals(Order.objects.filter(pk__in=ids))
+            last_id = ids[-1]
+        self.stdout.write(self.style.SUCCESS(f'Updated totals of {updated} orders.'))
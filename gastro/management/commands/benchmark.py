@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings, setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+
+from gastro import benchmarks
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks the main API endpoints in-process against a freshly seeded test database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*', help=f'Scenarios to run (default: all of {", ".join(benchmarks.SCENARIOS)}).')
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument('--warmup', type=int, default=20)
+        parser.add_argument('--products', type=int, default=200)
+        parser.add_argument('--orders', type=int, default=500)
+        parser.add_argument('--output', help='Write the results to this JSON file.')
+        parser.add_argument('--baseline', help='Compare against results previously written with --output.')
+        parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed relative p50/p95 slowdown (default 0.2).')
+        parser.add_argument('--fail-on-regression', action='store_true')
+
+    def handle(self, *args, **options):
+        unknown = set(options['scenarios']) - set(benchmarks.SCENARIOS)
+        if unknown:
+            raise CommandError(f'Unknown scenarios: {", ".join(sorted(unknown))}')
+
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            # DEBUG would record every query on the connection and enable the query instrumentation middleware.
+            with override_settings(DEBUG=False):
+                dataset = benchmarks.seed(products=options['products'], orders=options['orders'])
+                results = benchmarks.run(dataset, options['scenarios'], options['iterations'], options['warmup'])
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        comparison = {}
+        if options['baseline']:
+            comparison = benchmarks.compare(results, benchmarks.load(options['baseline']), options['tolerance'])
+        self.report(results, comparison)
+        if options['output']:
+            benchmarks.save(options['output'], results)
+
+        if options['fail_on_regression'] and any(change['regression'] for change in comparison.values()):
+            raise CommandError('Benchmarks regressed against the baseline.')
+
+    def report(self, results, comparison):
+        header = f"{'scenario':<26}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>9}{'queries':>9}{'errors':>8}"
+        self.stdout.write(header + ('  vs baseline' if comparison else ''))
+        for name, result in results.items():
+            line = (f"{name:<26}{result['p50_ms']:>9.2f}{result['p95_ms']:>9.2f}{result['p99_ms']:>9.2f}"
+                    f"{result['throughput_rps']:>9.1f}{result['queries_per_request']:>9.2f}{result['errors']:>8}")
+            change = comparison.get(name)
+            if change:
+                note = (f"  p50 {self.relative(change['p50_ms'])} p95 {self.relative(change['p95_ms'])}"
+                        f" queries {change['queries_per_request']:+.2f}")
+                line += note
+                if change['regression']:
+                    line = self.style.ERROR(line + '  REGRESSION')
+            self.stdout.write(line)
+
+    @staticmethod
+    def relative(change):
+        # compare() has no relative change against a baseline of 0.
+        return 'n/a' if change is None else f'{change:+.0%}'
@@ -0,0 +1,49 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings, setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+
+from gastro import benchmarks, concurrency_benchmarks
+
+
+class Command(BaseCommand):
+    help = ('Compares how the WSGI path (a fixed pool of worker threads) and the ASGI path (sync views, and the '
+            'native async views) hold up as concurrent clients grow, in-process against a freshly seeded test database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, nargs='+', default=[1, 8, 32, 128], help='Concurrent client counts.')
+        parser.add_argument('--threads', type=int, default=8, help='WSGI worker threads.')
+        parser.add_argument('--seconds', type=float, default=5.0, help='Per client count and path.')
+        parser.add_argument('--db-latency', type=float, default=2.0, help='Milliseconds added to every query.')
+        parser.add_argument('--products', type=int, default=200)
+        parser.add_argument('--orders', type=int, default=200)
+        parser.add_argument('--output', help='Write the results to this JSON file.')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            # As in production: the query instrumentation middleware is sync-only and would put every
+            # ASGI request through a thread.
+            with override_settings(DEBUG=False, GASTRO_QUERY_INSTRUMENTATION=False):
+                dataset = benchmarks.seed(products=options['products'], orders=options['orders'])
+                results = concurrency_benchmarks.run(dataset, options['clients'], options['threads'],
+                                                     options['seconds'], options['db_latency'] / 1000)
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        self.stdout.write(f"{'clients':<9}{'path':<11}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+                          f"{'in flight':>11}{'errors':>8}")
+        for clients, result in results.items():
+            label = str(clients)
+            for path in ('wsgi', 'asgi-sync', 'asgi'):
+                row = result[path]
+                self.stdout.write(f"{label:<9}{path:<11}{row['per_second']:>9.1f}{row['p50_ms'] or 0:>9.2f}"
+                                  f"{row['p95_ms'] or 0:>9.2f}{row['p99_ms'] or 0:>9.2f}"
+                                  f"{row['max_in_flight']:>11}{row['errors']:>8}")
+                label = ''
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+                f.write('\n')
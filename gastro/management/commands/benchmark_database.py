@@ -0,0 +1,37 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from gastro import db_benchmarks
+
+
+class Command(BaseCommand):
+    help = ('Compares SQLite connection profiles (default vs GASTRO_SQLITE_PRODUCTION) under concurrent '
+            'writers and readers, each against a scratch database file.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('profiles', nargs='*', help=f'Profiles to run (default: all of {", ".join(db_benchmarks.profiles())}).')
+        parser.add_argument('--writers', type=int, default=8)
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--seconds', type=float, default=5.0)
+        parser.add_argument('--output', help='Write the results to this JSON file.')
+
+    def handle(self, *args, **options):
+        unknown = set(options['profiles']) - set(db_benchmarks.profiles())
+        if unknown:
+            raise CommandError(f'Unknown profiles: {", ".join(sorted(unknown))}')
+
+        results = db_benchmarks.run(options['profiles'], options['writers'], options['readers'], options['seconds'])
+
+        self.stdout.write(f"{'profile':<12}{'':<8}{'per s':>10}{'p50 ms':>9}{'p95 ms':>9}{'errors':>8}")
+        for name, result in results.items():
+            for kind in ('writes', 'reads'):
+                row = result[kind]
+                p50 = f"{row['p50_ms']:>9.2f}" if row['p50_ms'] is not None else f"{'-':>9}"
+                p95 = f"{row['p95_ms']:>9.2f}" if row['p95_ms'] is not None else f"{'-':>9}"
+                self.stdout.write(f"{name:<12}{kind:<8}{row['per_second']:>10.1f}{p50}{p95}{row['errors']:>8}")
+                name = ''
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+                f.write('\n')
@@ -0,0 +1,46 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from gastro.datagen import Generator
+
+
+class Command(BaseCommand):
+    help = ('Generates a deterministic, seeded dataset of restaurants, staff, customers, menus and order and '
+            'reservation history. The same seed, sizes and --end-date always produce the same rows.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--restaurants', type=int, default=10)
+        parser.add_argument('--customers', type=int, default=5000)
+        parser.add_argument('--products', type=int, default=60, help='Products per restaurant.')
+        parser.add_argument('--orders', type=int, default=20000, help='Orders per restaurant, spread over --days.')
+        parser.add_argument('--days', type=int, default=365)
+        parser.add_argument('--end-date', type=date.fromisoformat, help='Last day of the history (default: today).')
+        parser.add_argument('--reservation-rate', type=float, default=0.3,
+                            help='Share of tables booked on an average evening.')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per INSERT.')
+        parser.add_argument('--commit-every', type=int, default=100000, help='Orders per transaction.')
+        parser.add_argument('--password', default='gastro-dataset', help='Password of every generated user.')
+
+    def handle(self, *args, **options):
+        generator = Generator(
+            seed=options['seed'],
+            restaurants=options['restaurants'],
+            customers=options['customers'],
+            products=options['products'],
+            orders=options['orders'],
+            days=options['days'],
+            reservation_rate=options['reservation_rate'],
+            end_date=options['end_date'],
+            batch_size=options['batch_size'],
+            commit_every=options['commit_every'],
+            password=options['password'],
+            log=self.stdout.write if options['verbosity'] > 1 else None,
+        )
+        if generator.exists():
+            raise CommandError(f'A dataset with seed {options["seed"]} has already been generated; pick another seed.')
+
+        counts = generator.generate()
+        self.stdout.write(self.style.SUCCESS(
+            'Generated ' + ', '.join(f'{count} {name.replace("_", " ")}' for name, count in counts.items()) + '.'))
@@ -0,0 +1,36 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from gastro import menu_io
+from gastro.models import Restaurant
+from gastro.serializers import MenuImportSerializer
+
+
+class Command(BaseCommand):
+    help = 'Creates or updates a restaurant\'s products and collections from a CSV or JSON file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('restaurant', type=int)
+        parser.add_argument('path')
+
+    def handle(self, *args, **options):
+        if not Restaurant.objects.filter(pk=options['restaurant']).exists():
+            raise CommandError(f"Restaurant {options['restaurant']} does not exist.")
+
+        with open(options['path'], encoding='utf-8-sig') as f:
+            text = f.read()
+        if options['path'].lower().endswith('.json'):
+            rows = json.loads(text)
+        else:
+            rows = menu_io.parse_csv(text)
+        if isinstance(rows, list):
+            rows = {'products': rows}
+
+        serializer = MenuImportSerializer(data=rows)
+        if not serializer.is_valid():
+            raise CommandError(json.dumps(serializer.errors, indent=2))
+        result = menu_io.import_menu(options['restaurant'], serializer.validated_data['products'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {result['created']} and updated {result['updated']} products, "
+            f"created {result['collections_created']} collections."))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from gastro.carts import get_cart_store
+
+
+class Command(BaseCommand):
+    help = 'Deletes carts idle for longer than GASTRO_CARTS["TTL"], in small batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        purged = get_cart_store().purge_expired(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Purged {purged} expired carts.'))
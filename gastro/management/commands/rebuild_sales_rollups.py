@@ -0,0 +1,24 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from gastro.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the daily sales rollups from the orders, optionally for one restaurant and a range of days.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--restaurant', type=int)
+        parser.add_argument('--date-from', type=date.fromisoformat)
+        parser.add_argument('--date-to', type=date.fromisoformat)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        rebuild_rollups(
+            restaurant_id=options['restaurant'],
+            date_from=options['date_from'],
+            date_to=options['date_to'],
+            batch_size=options['batch_size'],
+        )
+        self.stdout.write(self.style.SUCCESS('Sales rollups rebuilt.'))
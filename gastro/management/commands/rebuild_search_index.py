@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from gastro import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the product full-text search index from the product table.'
+
+    def handle(self, *args, **options):
+        if not search.is_supported(connection):
+            self.stdout.write(self.style.WARNING('Full-text search index is only used on SQLite; nothing to do.'))
+            return
+        search.create_index(connection)
+        search.rebuild_index(connection)
+        self.stdout.write(self.style.SUCCESS('Product search index rebuilt.'))
@@ -0,0 +1,40 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+
+class Command(BaseCommand):
+    help = ('Copies the primary SQLite database into the local replicas in GASTRO_READ_REPLICAS with the online '
+            'backup API, once or every --interval seconds. A stand-in for replication in development and tests.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, help='Keep copying, this many seconds apart.')
+
+    def handle(self, *args, **options):
+        primary = settings.DATABASES[DEFAULT_DB_ALIAS]
+        replicas = [settings.DATABASES[alias] for alias in getattr(settings, 'GASTRO_READ_REPLICAS', [])]
+        if not replicas:
+            raise CommandError('GASTRO_READ_REPLICAS lists no replicas.')
+        for database in [primary, *replicas]:
+            if database['ENGINE'] != 'django.db.backends.sqlite3':
+                raise CommandError(f'{database["NAME"]} is not an SQLite database.')
+
+        while True:
+            start = time.perf_counter()
+            source = sqlite3.connect(primary['NAME'])
+            try:
+                for replica in replicas:
+                    target = sqlite3.connect(replica['NAME'])
+                    try:
+                        source.backup(target)
+                    finally:
+                        target.close()
+            finally:
+                source.close()
+            self.stdout.write(f'Replicas synced in {(time.perf_counter() - start) * 1000:.0f} ms.')
+            if options['interval'] is None:
+                break
+            time.sleep(options['interval'])
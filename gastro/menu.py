@@ -0,0 +1,82 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from .models import Collection, Product, Restaurant
+from .pricing import price_with_tax
+from .replicas import primary
+
+# Saves rebuild the document in the worker that made them; the timeout bounds how long
+# a worker with its own cache (LocMemCache) serves a menu changed elsewhere.
+MENU_CACHE_TIMEOUT = getattr(settings, 'GASTRO_MENU_CACHE_TIMEOUT', 60 * 5)
+
+
+def menu_cache_key(restaurant_id):
+    return f'gastro:menu:{restaurant_id}'
+
+
+def build_menu(restaurant_id):
+    restaurant = Restaurant.objects.filter(pk=restaurant_id).values(
+        'id', 'restaurant_title', 'restaurant_status').first()
+    if restaurant is None:
+        return None
+
+    products = {}
+    products_by_collection = {}
+    for product in Product.objects.filter(restaurant_id=restaurant_id).order_by('title', 'id').values(
+            'id', 'title', 'slug', 'description', 'unit_price', 'collection_id'):
+        collection_id = product.pop('collection_id')
+        product['price_with_tax'] = price_with_tax(product['unit_price'])
+        products[product['id']] = product
+        products_by_collection.setdefault(collection_id, []).append(product)
+
+    collections = []
+    for collection in Collection.objects.filter(restaurant_id=restaurant_id).order_by('title', 'id').values(
+            'id', 'title', 'featured_product_id'):
+        collections.append({
+            'id': collection['id'],
+            'title': collection['title'],
+            'featured_product': products.get(collection['featured_product_id']),
+            'products': products_by_collection.get(collection['id'], []),
+        })
+
+    return {
+        'restaurant': restaurant,
+        'collections': collections,
+        'generated_at': timezone.now(),
+    }
+
+
+def rebuild_menu(restaurant_id):
+    # The document is cached until the next menu change or MENU_CACHE_TIMEOUT, so it must not be built
+    # from a lagging replica.
+    with primary():
+        menu = build_menu(restaurant_id)
+    if menu is None:
+        cache.delete(menu_cache_key(restaurant_id))
+        return None
+    document = JSONRenderer().render(menu)
+    cache.set(menu_cache_key(restaurant_id), document, MENU_CACHE_TIMEOUT)
+    return document
+
+
+def get_menu_document(restaurant_id):
+    document = cache.get(menu_cache_key(restaurant_id))
+    if document is None:
+        # After a cold start, expiry or eviction; saves rebuild the document eagerly.
+        document = rebuild_menu(restaurant_id)
+    return document
+
+
+async def aget_menu_document(restaurant_id):
+    document = await cache.aget(menu_cache_key(restaurant_id))
+    if document is None:
+        document = await sync_to_async(rebuild_menu)(restaurant_id)
+    return document
+
+
+def schedule_menu_rebuild(restaurant_id):
+    transaction.on_commit(lambda: rebuild_menu(restaurant_id))
@@ -0,0 +1,117 @@
+import csv
+import io
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+
+from . import search
+from .menu import schedule_menu_rebuild
+from .models import Collection, Product
+
+FIELDS = ['collection', 'title', 'slug', 'description', 'unit_price']
+EXPORT_CHUNK_SIZE = 2000
+
+
+def parse_csv(text):
+    # Rows come back as dicts keyed by the header line; validation happens in MenuImportSerializer.
+    return [{key: value for key, value in row.items() if key is not None}
+            for row in csv.DictReader(io.StringIO(text))]
+
+
+def parse_upload(upload):
+    """Reads an uploaded .csv or .json file into a list of row dicts."""
+    text = upload.read().decode('utf-8-sig')
+    if upload.name.lower().endswith('.json') or text.lstrip().startswith(('[', '{')):
+        data = json.loads(text)
+        return data.get('products', []) if isinstance(data, dict) else data
+    return parse_csv(text)
+
+
+def import_menu(restaurant_id, rows):
+    """
+    Creates or updates the restaurant's products from validated import rows in a
+    single transaction. Products are matched by slug and collections by title;
+    missing collections are created. Bulk writes skip the model signals, so the
+    menu document and the search index are refreshed here.
+    """
+    titles = {row['collection'] for row in rows}
+    slugs = [row['slug'] for row in rows]
+
+    collections = {}
+    for collection_id, title in Collection.objects.filter(restaurant_id=restaurant_id, title__in=titles) \
+            .order_by('-id').values_list('id', 'title'):
+        collections[title] = collection_id
+    existing = {product.slug: product for product in
+                Product.objects.filter(restaurant_id=restaurant_id, slug__in=slugs).order_by('-id')}
+
+    now = timezone.now()
+    with transaction.atomic():
+        new_collections = [Collection(title=title, restaurant_id=restaurant_id)
+                           for title in sorted(titles - collections.keys())]
+        Collection.objects.bulk_create(new_collections)
+        if new_collections and new_collections[0].pk is None:
+            # Backends that cannot return ids from a bulk insert.
+            new_collections = Collection.objects.filter(restaurant_id=restaurant_id, title__in=titles - collections.keys())
+        collections.update({collection.title: collection.pk for collection in new_collections})
+
+        to_create, to_update = [], []
+        for row in rows:
+            product = existing.get(row['slug'])
+            if product is None:
+                product = Product(slug=row['slug'], restaurant_id=restaurant_id)
+                to_create.append(product)
+            else:
+                product.last_update = now
+                to_update.append(product)
+            product.title = row['title']
+            product.description = row.get('description')
+            product.unit_price = row['unit_price']
+            product.collection_id = collections[row['collection']]
+
+        Product.objects.bulk_create(to_create, batch_size=500)
+        Product.objects.bulk_update(
+            to_update, ['title', 'description', 'unit_price', 'collection', 'last_update'], batch_size=500)
+
+        if to_create and to_create[0].pk is None:
+            changed = Product.objects.filter(restaurant_id=restaurant_id, slug__in=slugs).values_list('id', flat=True)
+        else:
+            changed = [product.pk for product in to_create + to_update]
+        search.reindex_products(list(changed))
+        schedule_menu_rebuild(restaurant_id)
+
+    return {
+        'created': len(to_create),
+        'updated': len(to_update),
+        'collections_created': len(new_collections),
+    }
+
+
+def export_rows(restaurant_id):
+    products = Product.objects.filter(restaurant_id=restaurant_id).order_by('collection__title', 'title', 'id') \
+        .values_list('collection__title', 'title', 'slug', 'description', 'unit_price')
+    for values in products.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield dict(zip(FIELDS, values))
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def stream_csv(restaurant_id):
+    writer = csv.DictWriter(Echo(), fieldnames=FIELDS)
+    yield writer.writeheader()
+    for row in export_rows(restaurant_id):
+        yield writer.writerow(row)
+
+
+def stream_json(restaurant_id):
+    # A JSON array written row by row, so memory use doesn't grow with the menu size.
+    yield '['
+    separator = ''
+    for row in export_rows(restaurant_id):
+        yield separator + json.dumps(row, cls=DjangoJSONEncoder)
+        separator = ','
+    yield ']'
@@ -0,0 +1,144 @@
+import logging
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.functional import SimpleLazyObject
+
+from . import replicas
+from .instrumentation import QueryRecorder, view_query_budget
+from .roles import get_role_context
+
+logger = logging.getLogger('gastro.queries')
+
+
+class RoleContextMiddleware:
+    """
+    Attaches ``request.role`` (a RoleContext) to every request.
+
+    The context is resolved lazily, so it picks up the user set by DRF's
+    JWT authentication rather than the session user seen at middleware time.
+    """
+
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        # Async views resolve the role themselves (roles.aget_role_context); only sync views read this one.
+        request.role = SimpleLazyObject(lambda: get_role_context(request.user))
+        return self.get_response(request)
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Counts the queries of each request, logs repeated query shapes as likely N+1s
+    and requests that exceed their view's ``query_budget`` to the ``gastro.queries``
+    logger, and reports the count in the X-Query-Count header.
+
+    Enabled by GASTRO_QUERY_INSTRUMENTATION (defaults to DEBUG). Queries run while
+    a streaming response is being consumed are not counted.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'GASTRO_QUERY_INSTRUMENTATION', settings.DEBUG):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        request.query_budget = None
+        with recorder.record():
+            response = self.get_response(request)
+
+        budget = request.query_budget
+        response['X-Query-Count'] = str(recorder.count)
+        if budget is not None:
+            response['X-Query-Budget'] = str(budget)
+            if recorder.count > budget:
+                logger.warning('%s %s ran %d queries, over its budget of %d',
+                               request.method, request.path, recorder.count, budget)
+        for shape, count in recorder.repeated().items():
+            logger.warning('Possible N+1 in %s %s: %d x %s', request.method, request.path, count, shape)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = view_query_budget(view_func, request.method)
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Routes the reads of safe-method requests to gastro views to a read replica (see
+    gastro.replicas), and pins clients that have just written to the primary.
+
+    Only active when GASTRO_READ_REPLICAS lists at least one database alias. Queries
+    run while a streaming response is being consumed go to the primary.
+    """
+
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not replicas.READ_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+            # A sync process_view would run in a thread on every async request.
+            self.process_view = self.aprocess_view
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        request.replica_token = None
+        try:
+            response = self.get_response(request)
+        finally:
+            if request.replica_token is not None:
+                replicas.reset_reads(request.replica_token)
+        return self.pin(request, response)
+
+    async def __acall__(self, request):
+        request.replica_token = None
+        try:
+            response = await self.get_response(request)
+        finally:
+            if request.replica_token is not None:
+                replicas.reset_reads(request.replica_token)
+        return self.pin(request, response)
+
+    def pin(self, request, response):
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400:
+            response.set_cookie(replicas.PIN_COOKIE, '1', max_age=replicas.PIN_SECONDS, httponly=True, samesite='Lax')
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if replicas.wants_replica(request, view_func):
+            request.replica_token = replicas.route_reads()
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        if replicas.wants_replica(request, view_func):
+            request.replica_token = replicas.route_reads()
+
+
+class AsyncViewsMiddleware:
+    """
+    Resolves requests to the ASGI application against GASTRO_ASGI_URLCONF, which
+    serves the busiest read endpoints with the native async views in
+    gastro.async_views. WSGI requests keep ROOT_URLCONF.
+    """
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.urlconf = getattr(settings, 'GASTRO_ASGI_URLCONF', None)
+        if not self.urlconf or not iscoroutinefunction(get_response):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        markcoroutinefunction(self)
+
+    async def __call__(self, request):
+        request.urlconf = self.urlconf
+        return await self.get_response(request)
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gastro', '0002_delete_address_remove_product_promotions_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='tablereservation',
+            index=models.Index(fields=['table', 'date_time_from', 'date_time_to'], name='gastro_tabl_table_i_59fb06_idx'),
+        ),
+    ]
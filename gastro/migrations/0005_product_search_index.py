@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:20
+
+from django.db import migrations
+
+# The SQL is frozen here rather than imported from gastro.search, so later changes to
+# that module can't change what this migration does.
+CREATE_INDEX = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS gastro_product_fts "
+    "USING fts5(title, description, scope, tokenize='unicode61 remove_diacritics 2')"
+)
+FILL_INDEX = (
+    "INSERT INTO gastro_product_fts (rowid, title, description, scope) "
+    "SELECT id, title, COALESCE(description, ''), 'r' || restaurant_id FROM gastro_product"
+)
+DROP_INDEX = 'DROP TABLE IF EXISTS gastro_product_fts'
+
+
+def create_search_index(apps, schema_editor):
+    # FTS5 is SQLite's; other databases use the LIKE search fallback.
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(CREATE_INDEX)
+        schema_editor.execute('DELETE FROM gastro_product_fts')
+        schema_editor.execute(FILL_INDEX)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(DROP_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gastro', '0004_last_update'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
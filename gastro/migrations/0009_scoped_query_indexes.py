@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gastro', '0008_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='collection',
+            index=models.Index(fields=['restaurant', 'title'], name='gastro_coll_restaur_5a2701_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['restaurant', 'placed_at', 'id'], name='gastro_orde_restaur_4f30da_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['customer', 'placed_at', 'id'], name='gastro_orde_custome_f51f9e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['table', 'payment_status'], name='gastro_orde_table_i_aebb10_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['restaurant', 'title'], name='gastro_prod_restaur_85ddf4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['restaurant', 'collection', 'unit_price'], name='gastro_prod_restaur_8b5549_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='restauranttable',
+            index=models.Index(fields=['restaurant', 'row', 'column'], name='gastro_rest_restaur_5649aa_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tablereservation',
+            index=models.Index(fields=['customer', 'date_time_from'], name='gastro_tabl_custome_08df84_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:51
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gastro', '0009_scoped_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='last_activity',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+        # Existing carts were last active no later than they were created.
+        migrations.RunSQL(
+            'UPDATE gastro_cart SET last_activity = created_at',
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gastro', '0010_cart_last_activity'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='order',
+            name='gastro_orde_restaur_a044f3_idx',
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['restaurant', 'payment_status', '-rush', 'placed_at', 'table'], name='gastro_orde_restaur_06323f_idx'),
+        ),
+    ]
@@ -1,7 +1,8 @@
-from django.db import models
+from django.db import models, router, transaction
 from django.contrib.postgres.fields import ArrayField
 from django.core.validators import MinValueValidator
 from django.conf import settings
+from django.utils import timezone
 from uuid import uuid4
 from django.contrib import admin
 
@@ -43,6 +44,13 @@ class RestaurantTable(models.Model):
     ]
 
     table_status = models.CharField(max_length=1,choices=TABLE_STATUSES, default=TABLE_EMPTY)
+    last_update = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Floor plan order and the one-table-per-cell check.
+            models.Index(fields=['restaurant', 'row', 'column']),
+        ]
 
 
 class Customer(models.Model):
@@ -105,6 +113,14 @@ class TableReservation(models.Model):
     table = models.ForeignKey(RestaurantTable,on_delete=models.CASCADE,related_name='reservations')
     date_time_from = models.DateTimeField()
     date_time_to = models.DateTimeField()
+    last_update = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['table', 'date_time_from', 'date_time_to']),
+            # A customer's reservations, in keyset order.
+            models.Index(fields=['customer', 'date_time_from']),
+        ]
 ######################################################################
 ######################################################################        
 ######################################################################
@@ -119,10 +135,14 @@ class Collection(models.Model):
     title = models.CharField(max_length=255)
     restaurant = models.ForeignKey(Restaurant,on_delete=models.CASCADE,related_name='collections')
     featured_product = models.ForeignKey('Product',on_delete=models.SET_NULL,null=True,blank=True,related_name="+")
+    last_update = models.DateTimeField(auto_now=True)
     def __str__(self) -> str :
         return self.title
     class Meta:
         ordering = ['title']    
+        indexes = [
+            models.Index(fields=['restaurant', 'title']),
+        ]
 
 class Product(models.Model):
     title = models.CharField(max_length=255)
@@ -138,6 +158,11 @@ class Product(models.Model):
         return self.title
     class Meta:
         ordering = ['title']   
+        indexes = [
+            # A restaurant's menu in title order, and the collection / price filters.
+            models.Index(fields=['restaurant', 'title']),
+            models.Index(fields=['restaurant', 'collection', 'unit_price']),
+        ]
 
 class Order(models.Model):
     ORDER_PENDING = 'P'
@@ -157,6 +182,30 @@ class Order(models.Model):
     placed_at = models.DateTimeField(auto_now_add=True)
     payment_status = models.CharField(max_length=1,choices=ORDER_STATUSES,default=ORDER_PENDING)
     customer = models.ForeignKey(Customer,on_delete=models.PROTECT)    
+    last_update = models.DateTimeField(auto_now=True)
+    # Denormalized from the order items at checkout (see gastro.totals).
+    subtotal = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    item_count = models.PositiveIntegerField(default=0)
+    # Kitchen display state (see gastro.kitchen).
+    rush = models.BooleanField(default=False)
+    acknowledged_at = models.DateTimeField(null=True, blank=True)
+    bumped_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # The kitchen queue, in ticket order (gastro.kitchen.TICKET_ORDERING).
+            models.Index(fields=['restaurant', 'payment_status', '-rush', 'placed_at', 'table']),
+            # Newest-first order lists of a restaurant and of a customer.
+            models.Index(fields=['restaurant', 'placed_at', 'id']),
+            models.Index(fields=['customer', 'placed_at', 'id']),
+            # Open orders per table on the floor plan.
+            models.Index(fields=['table', 'payment_status']),
+        ]
+
+    def save(self, *args, **kwargs):
+        # The sales rollups follow payment status changes from post_save (gastro.signals), in the same transaction.
+        with transaction.atomic(using=kwargs.get('using') or router.db_for_write(Order, instance=self)):
+            super().save(*args, **kwargs)
 
 
 class OrderItem(models.Model):
@@ -171,6 +220,8 @@ class OrderItem(models.Model):
 class Cart(models.Model):
     id= models.UUIDField(primary_key=True, default=uuid4)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Bumped by every change to the cart's items; carts expire GASTRO_CARTS TTL after it.
+    last_activity = models.DateTimeField(default=timezone.now, db_index=True)
 
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart,on_delete= models.CASCADE, related_name='items')
@@ -183,6 +234,49 @@ class CartItem(models.Model):
         unique_together = [['cart','product']]
 
 
+# Daily sales rollups, maintained incrementally by gastro.rollups. ``gross`` counts every
+# order that has not failed, ``paid`` only completed ones. Signed counters, so a delta
+# applied to a row the rebuild has not produced yet cannot violate a constraint.
+class DailyRestaurantSales(models.Model):
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name='+')
+    date = models.DateField()
+    orders = models.IntegerField(default=0)
+    items = models.IntegerField(default=0)
+    gross = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    paid = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = [['restaurant', 'date']]
+
+class DailyProductSales(models.Model):
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name='+')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    date = models.DateField()
+    quantity = models.IntegerField(default=0)
+    gross = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    paid = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = [['product', 'date']]
+        indexes = [
+            models.Index(fields=['restaurant', 'date']),
+        ]
+
+class DailyTableSales(models.Model):
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name='+')
+    table = models.ForeignKey(RestaurantTable, on_delete=models.CASCADE, related_name='+')
+    date = models.DateField()
+    orders = models.IntegerField(default=0)
+    gross = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    paid = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = [['table', 'date']]
+        indexes = [
+            models.Index(fields=['restaurant', 'date']),
+        ]
+
+
 ################################################################################
 ################################################################################
 ################################################################################
@@ -0,0 +1,47 @@
+import csv
+import datetime
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from .menu_io import Echo
+from .models import OrderItem
+
+FIELDS = ['order', 'placed_at', 'table', 'customer', 'payment_status',
+          'product', 'product_title', 'quantity', 'unit_price', 'line_total']
+CHUNK_SIZE = 2000
+
+
+def day_bounds(date_from, date_to):
+    # [start of date_from, start of the day after date_to) in the current time zone.
+    start = timezone.make_aware(datetime.datetime.combine(date_from, datetime.time.min))
+    end = timezone.make_aware(datetime.datetime.combine(date_to + datetime.timedelta(days=1), datetime.time.min))
+    return start, end
+
+
+def export_rows(restaurant_id, date_from, date_to):
+    """One flattened row per order item, read with a server-side cursor in chunks."""
+    start, end = day_bounds(date_from, date_to)
+    items = OrderItem.objects \
+        .filter(order__restaurant_id=restaurant_id, order__placed_at__gte=start, order__placed_at__lt=end) \
+        .order_by('order__placed_at', 'order_id', 'id') \
+        .values_list('order_id', 'order__placed_at', 'order__table_id', 'order__customer_id',
+                     'order__payment_status', 'product_id', 'product__title', 'quantity', 'unit_price')
+    for values in items.iterator(chunk_size=CHUNK_SIZE):
+        row = dict(zip(FIELDS, values))
+        row['placed_at'] = row['placed_at'].isoformat()
+        row['line_total'] = row['quantity'] * row['unit_price']
+        yield row
+
+
+def stream_csv(restaurant_id, date_from, date_to):
+    writer = csv.DictWriter(Echo(), fieldnames=FIELDS)
+    yield writer.writeheader()
+    for row in export_rows(restaurant_id, date_from, date_to):
+        yield writer.writerow(row)
+
+
+def stream_ndjson(restaurant_id, date_from, date_to):
+    for row in export_rows(restaurant_id, date_from, date_to):
+        yield json.dumps(row, cls=DjangoJSONEncoder) + '\n'
@@ -1,4 +1,203 @@
-from rest_framework.pagination import PageNumberPagination
+import datetime
+import hashlib
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 class DefaultPagination(PageNumberPagination):
-  page_size = 10
\ No newline at end of file
+  page_size = 10
+
+
+class CursorEncoder(DjangoJSONEncoder):
+  # DjangoJSONEncoder truncates datetimes to milliseconds, which would make the seek skip rows.
+  def default(self, o):
+    if isinstance(o, (datetime.datetime, datetime.time)):
+      return o.isoformat()
+    return super().default(o)
+
+
+class KeysetPagination(BasePagination):
+  """
+  Keyset (seek) pagination over a composite, unique ordering.
+
+  The ordering comes from the queryset (e.g. OrderingFilter), the view's
+  ``keyset_ordering`` or the model's Meta.ordering, with the primary key
+  appended as a tiebreaker. Pages are fetched with a WHERE on the last seen
+  key instead of OFFSET, and the total count is only computed on request
+  (``?include_count=1``) and then cached for a short while.
+
+  With ``fields``, the page is ``values(*fields)`` rows rather than model
+  instances; the keys of the ordering are fetched along with them.
+  """
+  page_size = 10
+  page_size_query_param = 'page_size'
+  max_page_size = 100
+  cursor_query_param = 'cursor'
+  count_query_param = 'include_count'
+  count_cache_timeout = 60
+  invalid_cursor_message = 'Invalid cursor'
+
+  def paginate_queryset(self, queryset, request, view=None, fields=None):
+    page, values, reverse = self.get_page_queryset(queryset, request, view, fields)
+    self.count = self.get_count(queryset) if self.wants_count(request) else None
+    return self.set_page(list(page), values, reverse)
+
+  async def apaginate_queryset(self, queryset, request, view=None, fields=None):
+    # For async views: the same page, fetched with the async ORM.
+    page, values, reverse = self.get_page_queryset(queryset, request, view, fields)
+    self.count = await self.aget_count(queryset) if self.wants_count(request) else None
+    return self.set_page([row async for row in page], values, reverse)
+
+  def get_page_queryset(self, queryset, request, view, fields=None):
+    self.request = request
+    self.page_size = self.get_page_size(request)
+    self.ordering = self.get_ordering(queryset, view)
+
+    values, reverse = self.decode_cursor(request)
+    ordering = [self.reverse_field(field) for field in self.ordering] if reverse else self.ordering
+    queryset = queryset.order_by(*ordering)
+    if values is not None:
+      queryset = queryset.filter(self.seek_filter(ordering, values))
+    if fields is not None:
+      keys = [field.lstrip('-') for field in self.ordering]
+      queryset = queryset.values(*fields, *(key for key in keys if key not in fields))
+    return queryset[:self.page_size + 1], values, reverse
+
+  def wants_count(self, request):
+    return request.query_params.get(self.count_query_param) in ('1', 'true', 'True')
+
+  def set_page(self, rows, values, reverse):
+    has_more = len(rows) > self.page_size
+    rows = rows[:self.page_size]
+    if reverse:
+      rows.reverse()
+      self.has_next, self.has_previous = True, has_more
+    else:
+      self.has_next, self.has_previous = has_more, values is not None
+
+    self.page = rows
+    return rows
+
+  def get_page_size(self, request):
+    try:
+      page_size = int(request.query_params[self.page_size_query_param])
+    except (KeyError, ValueError):
+      return self.page_size
+    if page_size <= 0:
+      return self.page_size
+    return min(page_size, self.max_page_size)
+
+  def get_ordering(self, queryset, view):
+    ordering = [field for field in queryset.query.order_by if isinstance(field, str)]
+    if not ordering:
+      ordering = list(getattr(view, 'keyset_ordering', None) or queryset.model._meta.ordering or [])
+    ordering = ['-pk' if field == '-id' else 'pk' if field == 'id' else field for field in ordering]
+    if 'pk' not in ordering and '-pk' not in ordering:
+      ordering.append('-pk' if ordering and ordering[0].startswith('-') else 'pk')
+    return ordering
+
+  @staticmethod
+  def reverse_field(field):
+    return field[1:] if field.startswith('-') else '-' + field
+
+  @staticmethod
+  def seek_filter(ordering, values):
+    # (a, b, c) > (x, y, z)  ==  a > x OR (a = x AND b > y) OR (a = x AND b = y AND c > z)
+    condition = Q()
+    equal = {}
+    for field, value in zip(ordering, values):
+      name = field.lstrip('-')
+      lookup = 'lt' if field.startswith('-') else 'gt'
+      condition |= Q(**equal, **{f'{name}__{lookup}': value})
+      equal[name] = value
+    return condition
+
+  @staticmethod
+  def get_value(obj, field):
+    if isinstance(obj, dict):
+      return obj[field.lstrip('-')]
+    for attr in field.lstrip('-').split('__'):
+      obj = getattr(obj, attr)
+    return obj
+
+  @staticmethod
+  def count_cache_key(queryset):
+    return 'gastro:count:' + hashlib.md5(str(queryset.order_by().query).encode()).hexdigest()
+
+  def get_count(self, queryset):
+    key = self.count_cache_key(queryset)
+    count = cache.get(key)
+    if count is None:
+      count = queryset.order_by().count()
+      cache.set(key, count, self.count_cache_timeout)
+    return count
+
+  async def aget_count(self, queryset):
+    key = self.count_cache_key(queryset)
+    count = await cache.aget(key)
+    if count is None:
+      count = await queryset.order_by().acount()
+      await cache.aset(key, count, self.count_cache_timeout)
+    return count
+
+  def encode_cursor(self, obj, reverse):
+    payload = {'o': self.ordering, 'v': [self.get_value(obj, field) for field in self.ordering], 'r': reverse}
+    return urlsafe_b64encode(json.dumps(payload, cls=CursorEncoder).encode()).decode()
+
+  def decode_cursor(self, request):
+    encoded = request.query_params.get(self.cursor_query_param)
+    if not encoded:
+      return None, False
+    try:
+      payload = json.loads(urlsafe_b64decode(encoded.encode()))
+      values, reverse = payload['v'], bool(payload['r'])
+    except (TypeError, ValueError, KeyError):
+      raise NotFound(self.invalid_cursor_message)
+    if payload.get('o') != self.ordering or len(values) != len(self.ordering):
+      raise NotFound(self.invalid_cursor_message)
+    return values, reverse
+
+  def get_link(self, obj, reverse):
+    url = self.request.build_absolute_uri()
+    return replace_query_param(url, self.cursor_query_param, self.encode_cursor(obj, reverse))
+
+  def get_next_link(self):
+    if not self.has_next or not self.page:
+      return None
+    return self.get_link(self.page[-1], reverse=False)
+
+  def get_previous_link(self):
+    if not self.has_previous:
+      return None
+    if not self.page:
+      return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+    return self.get_link(self.page[0], reverse=True)
+
+  def get_paginated_data(self, data):
+    payload = {'next': self.get_next_link(), 'previous': self.get_previous_link()}
+    if self.count is not None:
+      payload['count'] = self.count
+    payload['results'] = data
+    return payload
+
+  def get_paginated_response(self, data):
+    return Response(self.get_paginated_data(data))
+
+  def get_paginated_response_schema(self, schema):
+    return {
+      'type': 'object',
+      'required': ['results'],
+      'properties': {
+        'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+        'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+        'count': {'type': 'integer'},
+        'results': schema,
+      },
+    }
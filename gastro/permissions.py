@@ -1,5 +1,4 @@
 from rest_framework import permissions
-from .models import Customer,Owner,Waiter
 ################################################################################## |
 #Túto časť robil Matej Turňa                                                       |  
 ################################################################################## V
@@ -13,30 +12,31 @@ class IsAdminOrReadOnly(permissions.BasePermission):
 
 class IsUserCustomer(permissions.BasePermission):
     def has_permission(self, request, view):        
-         try:            
-            customer = Customer.objects.get(user_id=request.user.id)
+        if request.role.is_customer:
             return True
-         except Customer.DoesNotExist:
-            return bool(request.user and request.user.is_staff)
+        return bool(request.user and request.user.is_staff)
 
         
        
 class IsUserOwner(permissions.BasePermission):
     def has_permission(self, request, view):       
-         try:            
-            owner = Owner.objects.get(user_id=request.user.id)
+        if request.role.is_owner:
             return True
-         except Owner.DoesNotExist:
-            return bool(request.user and request.user.is_staff)
+        return bool(request.user and request.user.is_staff)
 
        
 
 class IsUserWaiter(permissions.BasePermission):
     def has_permission(self, request, view):        
-         try:            
-            waiter = Waiter.objects.get(user_id=request.user.id)
+        if request.role.is_waiter:
             return True
-         except Waiter.DoesNotExist:
-            return bool(request.user and request.user.is_staff)
+        return bool(request.user and request.user.is_staff)
 
         
+
+
+class IsUserOwnerOrWaiter(permissions.BasePermission):
+    def has_permission(self, request, view):
+        if request.role.is_employee:
+            return True
+        return bool(request.user and request.user.is_staff)
@@ -0,0 +1,9 @@
+from decimal import Decimal
+
+TAX_RATE = Decimal('1.1')
+CENT = Decimal('0.01')
+
+
+def price_with_tax(unit_price):
+    # The one place a tax-inclusive price is computed: the menu document and every product endpoint agree.
+    return (unit_price * TAX_RATE).quantize(CENT)
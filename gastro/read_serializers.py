@@ -0,0 +1,102 @@
+"""
+Read-only list serialization from values() rows.
+
+Builds the same dicts as ProductSerializer, OrderSerializer and
+RestaurantTableSerializer would for a list, without model instances or DRF
+field objects per row: each list is one values() query (plus one for the items
+of a page of orders), turned into plain dicts in a single pass. The parity is
+covered by ReadSerializerParityTests.
+"""
+from django.db.models import F
+from rest_framework import serializers
+from rest_framework.response import Response
+
+from .models import OrderItem
+from .pricing import price_with_tax
+
+PRODUCT_FIELDS = ('id', 'title', 'restaurant_id', 'description', 'slug', 'unit_price', 'collection_id')
+TABLE_FIELDS = ('id', 'restaurant_id', 'seats', 'row', 'column', 'table_status')
+ORDER_FIELDS = ('id', 'restaurant_id', 'customer_id', 'table_id', 'placed_at', 'payment_status', 'subtotal', 'item_count')
+
+# OrderSerializer's placed_at: ISO 8601 in the current time zone.
+datetime_field = serializers.DateTimeField()
+
+
+def serialize_products(rows):
+    return [{
+        'id': row['id'],
+        'title': row['title'],
+        'restaurant': row['restaurant_id'],
+        'description': row['description'],
+        'slug': row['slug'],
+        'unit_price': row['unit_price'],
+        'price_with_tax': price_with_tax(row['unit_price']),
+        'collection': row['collection_id'],
+    } for row in rows]
+
+
+def serialize_tables(rows):
+    return [{
+        'id': row['id'],
+        'restaurant': row['restaurant_id'],
+        'seats': row['seats'],
+        'row': row['row'],
+        'column': row['column'],
+        'table_status': row['table_status'],
+    } for row in rows]
+
+
+def order_item_rows(order_ids):
+    # The rows prefetch_related('items__product') would give, in one query.
+    return OrderItem.objects.filter(order_id__in=order_ids).order_by('order_id', 'id').values(
+        'id', 'order_id', 'unit_price', 'quantity', 'product_id',
+        product_title=F('product__title'), product_unit_price=F('product__unit_price'))
+
+
+def serialize_orders(rows, item_rows):
+    items = {}
+    for item in item_rows:
+        items.setdefault(item['order_id'], []).append({
+            'id': item['id'],
+            'product': {
+                'id': item['product_id'],
+                'title': item['product_title'],
+                'unit_price': item['product_unit_price'],
+            },
+            'unit_price': item['unit_price'],
+            'quantity': item['quantity'],
+        })
+    return [{
+        'id': row['id'],
+        'restaurant': row['restaurant_id'],
+        'customer': row['customer_id'],
+        'table': row['table_id'],
+        'placed_at': datetime_field.to_representation(row['placed_at']),
+        'payment_status': row['payment_status'],
+        'subtotal': row['subtotal'],
+        'item_count': row['item_count'],
+        'items': items.get(row['id'], []),
+    } for row in rows]
+
+
+class ValuesListMixin:
+    """
+    list() from ``list_fields`` values() rows, turned into the serializer's output
+    by ``serialize_rows``. Other actions keep the serializer.
+    """
+    list_fields = None
+
+    def serialize_rows(self, rows):
+        raise NotImplementedError
+
+    def get_list_queryset(self):
+        return self.filter_queryset(self.get_queryset())
+
+    def list(self, request, *args, **kwargs):
+        return self.list_rows(self.get_list_queryset())
+
+    def list_rows(self, queryset):
+        if self.paginator is None:
+            return Response(self.serialize_rows(queryset.values(*self.list_fields)))
+        page = self.paginator.paginate_queryset(queryset, self.request, view=self, fields=self.list_fields)
+        return self.get_paginated_response(self.serialize_rows(page))
@@ -0,0 +1,102 @@
+"""
+Read replicas for the gastro API.
+
+The ReplicaRouter sends reads to the alias set for the current request and every
+write to the primary. ReplicaRoutingMiddleware sets that alias only for safe-method
+requests to gastro views, so writes, and reads made while handling a write (such as
+the response after checkout) or inside atomic(), stay on the primary. A client that
+has just written is pinned to the primary for GASTRO_REPLICA_PIN_SECONDS through a
+cookie, so it reads its own writes despite replication lag. A request can also pin
+itself with the ``X-Read-Primary`` header, and code with ``primary()``.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+READ_REPLICAS = getattr(settings, 'GASTRO_READ_REPLICAS', [])
+PIN_SECONDS = getattr(settings, 'GASTRO_REPLICA_PIN_SECONDS', 5)
+PIN_COOKIE = 'gastro_primary'
+PIN_HEADER = 'HTTP_X_READ_PRIMARY'
+
+# The alias reads go to, or None for the primary.
+_read_alias = ContextVar('gastro_read_alias', default=None)
+
+
+def read_alias():
+    return _read_alias.get()
+
+
+def route_reads(alias=None):
+    """Sends subsequent reads to ``alias`` (a random replica by default); returns a token for reset_reads()."""
+    if alias is None and READ_REPLICAS:
+        alias = random.choice(READ_REPLICAS)
+    return _read_alias.set(alias)
+
+
+def reset_reads(token):
+    _read_alias.reset(token)
+
+
+@contextmanager
+def use_replica(alias=None):
+    token = route_reads(alias)
+    try:
+        yield _read_alias.get()
+    finally:
+        reset_reads(token)
+
+
+@contextmanager
+def primary():
+    """
+    Sends reads in the block to the primary: for reads that feed a long-lived cache
+    entry or a write decision, where replication lag would stick.
+    """
+    token = _read_alias.set(None)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def wants_replica(request, view_func):
+    if not READ_REPLICAS or request.method not in ('GET', 'HEAD', 'OPTIONS'):
+        return False
+    if request.COOKIES.get(PIN_COOKIE) or request.META.get(PIN_HEADER):
+        return False
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None or not view_class.__module__.startswith('gastro.'):
+        return False
+    return getattr(view_class, 'replica_reads', True)
+
+
+def in_transaction():
+    # TestCase's own atomic blocks don't count, so tests are routed as requests are.
+    return any(not block._from_testcase for block in connections[DEFAULT_DB_ALIAS].atomic_blocks)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        # Reads inside a transaction on the primary must see its uncommitted writes.
+        if in_transaction():
+            return None
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        # Explicit, so instances read from a replica are still saved to the primary.
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *READ_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas are copies of the primary, never migrated on their own.
+        if db in READ_REPLICAS:
+            return False
+        return None
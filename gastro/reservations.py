@@ -0,0 +1,23 @@
+from django.db.models import Exists, OuterRef
+
+from .models import RestaurantTable, TableReservation
+
+
+def overlapping(queryset, date_time_from, date_time_to):
+    # Reservations are half-open intervals [from, to), so back-to-back bookings don't clash.
+    return queryset.filter(date_time_from__lt=date_time_to, date_time_to__gt=date_time_from)
+
+
+def find_conflict(table_id, date_time_from, date_time_to, exclude_id=None):
+    queryset = overlapping(TableReservation.objects.filter(table_id=table_id), date_time_from, date_time_to)
+    if exclude_id is not None:
+        queryset = queryset.exclude(pk=exclude_id)
+    return queryset.first()
+
+
+def available_tables(restaurant_id, date_time_from, date_time_to, seats=None):
+    busy = overlapping(TableReservation.objects.filter(table_id=OuterRef('pk')), date_time_from, date_time_to)
+    queryset = RestaurantTable.objects.filter(restaurant_id=restaurant_id).exclude(Exists(busy))
+    if seats:
+        queryset = queryset.filter(seats__gte=seats)
+    return queryset.order_by('seats', 'row', 'column', 'id')
@@ -0,0 +1,124 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+
+from .replicas import primary
+
+ROLE_CACHE_TIMEOUT = getattr(settings, 'GASTRO_ROLE_CACHE_TIMEOUT', 60 * 15)
+
+
+class RoleContext:
+    __slots__ = ['user_id', 'owner_id', 'owner_restaurant_id', 'waiter_id', 'waiter_restaurant_id', 'customer_id']
+
+    def __init__(self, user_id=None, owner_id=None, owner_restaurant_id=None,
+                 waiter_id=None, waiter_restaurant_id=None, customer_id=None):
+        self.user_id = user_id
+        self.owner_id = owner_id
+        self.owner_restaurant_id = owner_restaurant_id
+        self.waiter_id = waiter_id
+        self.waiter_restaurant_id = waiter_restaurant_id
+        self.customer_id = customer_id
+
+    @property
+    def is_owner(self):
+        return self.owner_id is not None
+
+    @property
+    def is_waiter(self):
+        return self.waiter_id is not None
+
+    @property
+    def is_customer(self):
+        return self.customer_id is not None
+
+    @property
+    def is_employee(self):
+        return self.is_owner or self.is_waiter
+
+    @property
+    def restaurant_id(self):
+        # Owners take precedence over waiters, same as the old Owner -> Waiter lookup chain.
+        if self.owner_restaurant_id is not None:
+            return self.owner_restaurant_id
+        return self.waiter_restaurant_id
+
+    @property
+    def restaurant_ids(self):
+        return {pk for pk in (self.owner_restaurant_id, self.waiter_restaurant_id) if pk is not None}
+
+    def works_at(self, restaurant_id):
+        return restaurant_id is not None and restaurant_id in self.restaurant_ids
+
+    def __repr__(self):
+        return f'<RoleContext user={self.user_id} owner={self.owner_id} waiter={self.waiter_id} customer={self.customer_id}>'
+
+
+def role_cache_key(user_id):
+    return f'gastro:role:{user_id}'
+
+
+def role_cache_value(role):
+    return (role.owner_id, role.owner_restaurant_id, role.waiter_id, role.waiter_restaurant_id, role.customer_id)
+
+
+def role_row(user_id, *fields):
+    # The RoleContext fields after user_id, then ``fields`` of the user.
+    return get_user_model().objects.filter(pk=user_id).values_list(
+        'owner__id', 'owner__restaurant_id',
+        'waiter__id', 'waiter__restaurant_id',
+        'customer__id',
+        *fields,
+    )
+
+
+def load_role_context(user_id):
+    # Cached for ROLE_CACHE_TIMEOUT, and decides what the user may write: read it from the primary.
+    with primary():
+        row = role_row(user_id).first()
+    return RoleContext(user_id, *row) if row else RoleContext(user_id)
+
+
+async def aload_role_context(user_id):
+    with primary():
+        row = await role_row(user_id).afirst()
+    return RoleContext(user_id, *row) if row else RoleContext(user_id)
+
+
+def get_role_context(user):
+    if getattr(user, 'role', None) is not None:
+        # A token user (gastro.authentication.RoleTokenUser): the role is in the token's claims.
+        return user.role
+    user_id = getattr(user, 'id', None)
+    if user_id is None:
+        return RoleContext()
+
+    key = role_cache_key(user_id)
+    cached = cache.get(key)
+    if cached is not None:
+        return RoleContext(user_id, *cached)
+
+    role = load_role_context(user_id)
+    cache.set(key, role_cache_value(role), ROLE_CACHE_TIMEOUT)
+    return role
+
+
+async def aget_role_context(user):
+    # get_role_context() for async views.
+    if getattr(user, 'role', None) is not None:
+        return user.role
+    user_id = getattr(user, 'id', None)
+    if user_id is None:
+        return RoleContext()
+
+    key = role_cache_key(user_id)
+    cached = await cache.aget(key)
+    if cached is not None:
+        return RoleContext(user_id, *cached)
+
+    role = await aload_role_context(user_id)
+    await cache.aset(key, role_cache_value(role), ROLE_CACHE_TIMEOUT)
+    return role
+
+
+def invalidate_role_context(user_id):
+    cache.delete(role_cache_key(user_id))
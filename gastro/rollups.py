@@ -0,0 +1,189 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Count, DecimalField, F, Q, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .models import DailyProductSales, DailyRestaurantSales, DailyTableSales, Order, OrderItem
+
+MONEY = DecimalField(max_digits=12, decimal_places=2)
+ZERO = Decimal('0')
+
+COUNTED = ~Q(payment_status=Order.ORDER_FAILED)
+PAID = Q(payment_status=Order.ORDER_COMPLETE)
+
+
+def increment_rows(model, key_fields, rows, using=connection):
+    """
+    Adds each row's counters to the matching rollup row in one INSERT ... ON CONFLICT
+    statement, creating rows that don't exist yet. ``rows`` are dicts keyed by attname.
+    """
+    if not rows:
+        return
+    qn = using.ops.quote_name
+    fields = [model._meta.get_field(name) for name in rows[0]]
+    columns = [qn(field.column) for field in fields]
+    keys = {model._meta.get_field(name).column for name in key_fields}
+    counters = [qn(field.column) for field in fields if field.column not in keys and not field.is_relation]
+
+    params = []
+    for row in rows:
+        params += [field.get_db_prep_save(row[field.attname], using) for field in fields]
+    placeholders = '(' + ', '.join(['%s'] * len(fields)) + ')'
+    table = qn(model._meta.db_table)
+
+    sql = f'INSERT INTO {table} ({", ".join(columns)}) VALUES {", ".join([placeholders] * len(rows))} '
+    if using.vendor == 'mysql':
+        sql += 'ON DUPLICATE KEY UPDATE ' + ', '.join(f'{c} = {c} + VALUES({c})' for c in counters)
+    else:
+        conflict = ', '.join(qn(column) for column in sorted(keys))
+        sql += f'ON CONFLICT ({conflict}) DO UPDATE SET ' + ', '.join(f'{c} = {table}.{c} + excluded.{c}' for c in counters)
+
+    with using.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def contribution(payment_status):
+    # (counted, paid) weights of an order in the rollups.
+    return (int(payment_status != Order.ORDER_FAILED), int(payment_status == Order.ORDER_COMPLETE))
+
+
+def apply_order(order, items, counted, paid):
+    """
+    Adds ``counted``/``paid`` (each -1, 0 or 1) times the order to its rollup rows.
+    ``items`` are (product_id, quantity, unit_price) tuples.
+    """
+    if not counted and not paid:
+        return
+    day = timezone.localdate(order.placed_at)
+    subtotal = order.subtotal
+    increment_rows(DailyRestaurantSales, ['restaurant', 'date'], [{
+        'restaurant_id': order.restaurant_id, 'date': day,
+        'orders': counted, 'items': counted * order.item_count,
+        'gross': counted * subtotal, 'paid': paid * subtotal,
+    }])
+    increment_rows(DailyTableSales, ['table', 'date'], [{
+        'restaurant_id': order.restaurant_id, 'table_id': order.table_id, 'date': day,
+        'orders': counted, 'gross': counted * subtotal, 'paid': paid * subtotal,
+    }])
+    increment_rows(DailyProductSales, ['product', 'date'], [{
+        'restaurant_id': order.restaurant_id, 'product_id': product_id, 'date': day,
+        'quantity': counted * quantity,
+        'gross': counted * quantity * unit_price, 'paid': paid * quantity * unit_price,
+    } for product_id, quantity, unit_price in items])
+
+
+def record_order(order, order_items):
+    """Called at checkout, inside the transaction that creates the order."""
+    counted, paid = contribution(order.payment_status)
+    apply_order(order, [(item.product_id, item.quantity, item.unit_price) for item in order_items], counted, paid)
+
+
+def record_payment_status_change(order, previous_status):
+    old_counted, old_paid = contribution(previous_status)
+    new_counted, new_paid = contribution(order.payment_status)
+    if (old_counted, old_paid) == (new_counted, new_paid):
+        return
+    items = OrderItem.objects.filter(order_id=order.pk).values_list('product_id', 'quantity', 'unit_price')
+    apply_order(order, list(items), new_counted - old_counted, new_paid - old_paid)
+
+
+def record_order_deletion(order):
+    # The order's items are gone already (OrderItem.order is PROTECT), each subtracted by record_item_deletion.
+    counted, paid = contribution(order._loaded_payment_status or order.payment_status)
+    apply_order(order, [], -counted, -paid)
+
+
+def record_item_deletion(item, order):
+    counted, paid = contribution(order.payment_status)
+    if not counted and not paid:
+        return
+    increment_rows(DailyProductSales, ['product', 'date'], [{
+        'restaurant_id': order.restaurant_id, 'product_id': item.product_id, 'date': timezone.localdate(order.placed_at),
+        'quantity': -counted * item.quantity,
+        'gross': -counted * item.quantity * item.unit_price, 'paid': -paid * item.quantity * item.unit_price,
+    }])
+
+
+def rebuild_rollups(restaurant_id=None, date_from=None, date_to=None, batch_size=1000):
+    """Recomputes the rollup rows of the given restaurant and day range from the orders."""
+    orders = Order.objects.annotate(date=TruncDate('placed_at')).order_by()
+    items = OrderItem.objects.annotate(date=TruncDate('order__placed_at'), line_total=F('quantity') * F('unit_price')).order_by()
+    day_filter = {key: value for key, value in (('date__gte', date_from), ('date__lte', date_to)) if value is not None}
+    orders = orders.filter(**day_filter)
+    items = items.filter(**day_filter)
+    rollup_filter = Q(**day_filter)
+    if restaurant_id is not None:
+        orders = orders.filter(restaurant_id=restaurant_id)
+        items = items.filter(order__restaurant_id=restaurant_id)
+        rollup_filter &= Q(restaurant_id=restaurant_id)
+
+    def money(expression, condition):
+        return Coalesce(Sum(expression, filter=condition, output_field=MONEY), ZERO, output_field=MONEY)
+
+    item_counted = ~Q(order__payment_status=Order.ORDER_FAILED)
+    item_paid = Q(order__payment_status=Order.ORDER_COMPLETE)
+
+    restaurant_rows = orders.values('restaurant_id', 'date').annotate(
+        orders=Count('pk', filter=COUNTED),
+        items=Coalesce(Sum('item_count', filter=COUNTED), 0),
+        gross=money('subtotal', COUNTED),
+        paid=money('subtotal', PAID))
+    table_rows = orders.values('restaurant_id', 'table_id', 'date').annotate(
+        orders=Count('pk', filter=COUNTED),
+        gross=money('subtotal', COUNTED),
+        paid=money('subtotal', PAID))
+    product_rows = items.values('order__restaurant_id', 'product_id', 'date').annotate(
+        quantity=Coalesce(Sum('quantity', filter=item_counted), 0),
+        gross=money('line_total', item_counted),
+        paid=money('line_total', item_paid))
+
+    with transaction.atomic():
+        for model in (DailyRestaurantSales, DailyTableSales, DailyProductSales):
+            model.objects.filter(rollup_filter).delete()
+        DailyRestaurantSales.objects.bulk_create(
+            (DailyRestaurantSales(**row) for row in restaurant_rows.iterator()), batch_size=batch_size)
+        DailyTableSales.objects.bulk_create(
+            (DailyTableSales(**row) for row in table_rows.iterator()), batch_size=batch_size)
+        DailyProductSales.objects.bulk_create(
+            (DailyProductSales(restaurant_id=row.pop('order__restaurant_id'), **row) for row in product_rows.iterator()),
+            batch_size=batch_size)
+
+
+def default_range(date_from=None, date_to=None):
+    date_to = date_to or timezone.localdate()
+    date_from = date_from or date_to - timedelta(days=29)
+    return date_from, date_to
+
+
+def sales_report(restaurant_id, date_from, date_to, group_by='day'):
+    """Reads the rollups only; never touches Order or OrderItem."""
+    days = {'restaurant_id': restaurant_id, 'date__gte': date_from, 'date__lte': date_to}
+    if group_by == 'product':
+        rows = DailyProductSales.objects.filter(**days).values('product_id', 'product__title') \
+            .annotate(quantity=Sum('quantity'), gross=Sum('gross'), paid=Sum('paid')) \
+            .order_by('-gross', 'product_id')
+        rows = [{'product': row['product_id'], 'title': row['product__title'], 'quantity': row['quantity'],
+                 'gross': row['gross'], 'paid': row['paid']} for row in rows]
+    elif group_by == 'table':
+        rows = DailyTableSales.objects.filter(**days).values('table_id') \
+            .annotate(orders=Sum('orders'), gross=Sum('gross'), paid=Sum('paid')) \
+            .order_by('-gross', 'table_id')
+        rows = [{'table': row.pop('table_id'), **row} for row in rows]
+    else:
+        rows = list(DailyRestaurantSales.objects.filter(**days).order_by('date')
+            .values('date', 'orders', 'items', 'gross', 'paid'))
+
+    totals = DailyRestaurantSales.objects.filter(**days).aggregate(
+        orders=Coalesce(Sum('orders'), 0), items=Coalesce(Sum('items'), 0),
+        gross=Coalesce(Sum('gross'), ZERO, output_field=MONEY), paid=Coalesce(Sum('paid'), ZERO, output_field=MONEY))
+    return {
+        'restaurant': restaurant_id,
+        'date_from': date_from,
+        'date_to': date_to,
+        'group_by': group_by,
+        'totals': totals,
+        'results': rows,
+    }
@@ -0,0 +1,108 @@
+import re
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from rest_framework.filters import SearchFilter
+
+FTS_TABLE = 'gastro_product_fts'
+PRODUCT_TABLE = 'gastro_product'
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+# Title matches weigh more than description matches; the scope column only filters.
+RANK_SQL = f'SELECT bm25({FTS_TABLE}, 10.0, 2.0, 0.0) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s AND rowid = "{PRODUCT_TABLE}"."id"'
+MATCH_SQL = f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s'
+
+
+def is_supported(using=connection):
+    return using.vendor == 'sqlite'
+
+
+def create_index(schema_connection):
+    with schema_connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+            f"USING fts5(title, description, scope, tokenize='unicode61 remove_diacritics 2')")
+
+
+def scope_token(restaurant_id):
+    return f'r{restaurant_id}'
+
+
+def rebuild_index(using=connection):
+    if not is_supported(using):
+        return
+    with using.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, title, description, scope) "
+            f"SELECT id, title, COALESCE(description, ''), 'r' || restaurant_id FROM {PRODUCT_TABLE}")
+
+
+def index_product(product, using=connection):
+    if not is_supported(using):
+        return
+    with using.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [product.pk])
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, title, description, scope) VALUES (%s, %s, %s, %s)',
+            [product.pk, product.title, product.description or '', scope_token(product.restaurant_id)])
+
+
+def reindex_products(product_ids, using=connection):
+    # Set-based variant of index_product for bulk writes, which don't send post_save.
+    if not is_supported(using) or not product_ids:
+        return
+    with using.cursor() as cursor:
+        for start in range(0, len(product_ids), 500):
+            batch = product_ids[start:start + 500]
+            placeholders = ', '.join(['%s'] * len(batch))
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', batch)
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE} (rowid, title, description, scope) "
+                f"SELECT id, title, COALESCE(description, ''), 'r' || restaurant_id FROM {PRODUCT_TABLE} "
+                f"WHERE id IN ({placeholders})", batch)
+
+
+def unindex_product(product_id, using=connection):
+    if not is_supported(using):
+        return
+    with using.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [product_id])
+
+
+def build_match(term, restaurant_id=None):
+    # Every word is quoted (so FTS operators in user input are inert) and prefix-matched for typeahead.
+    words = WORD_RE.findall(term)
+    if not words:
+        return None
+    match = ' '.join(f'"{word}"*' for word in words)
+    if restaurant_id is not None:
+        match = f'scope:"{scope_token(restaurant_id)}" {match}'
+    return match
+
+
+def search_products(queryset, term, restaurant_id=None):
+    match = build_match(term, restaurant_id)
+    if match is None:
+        return queryset
+    return queryset \
+        .filter(pk__in=RawSQL(MATCH_SQL, (match,))) \
+        .annotate(search_rank=RawSQL(RANK_SQL, (match,))) \
+        .order_by('search_rank', 'pk')
+
+
+class ProductSearchFilter(SearchFilter):
+    """
+    ``?search=`` for products backed by the FTS5 index, ranked by bm25 with
+    prefix matching. The view's ``get_restaurant_scope()`` narrows the match
+    inside the index. Falls back to DRF's LIKE search on other databases.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        term = request.query_params.get(self.search_param, '')
+        if not term.strip() or not is_supported(connection):
+            return super().filter_queryset(request, queryset, view)
+
+        get_scope = getattr(view, 'get_restaurant_scope', None)
+        restaurant_id = get_scope() if get_scope else None
+        return search_products(queryset, term, restaurant_id)
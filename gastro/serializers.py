@@ -1,8 +1,12 @@
 from rest_framework import serializers
-from .models import Cart, CartItem,Product,Customer,Waiter,Collection,OrderItem,Order,RestaurantTable, TableReservation,Owner,Restaurant
-from decimal import Decimal
+from .models import Cart, CartItem,Product,Customer,Waiter,Collection,OrderItem,Order,RestaurantTable, TableReservation,Restaurant
 from core.models import User
 from django.db import transaction
+from .reservations import find_conflict
+from .carts import get_cart_store, set_prefetched
+from . import rollups
+from .pricing import price_with_tax
+
 ################################################################################## |
 #Túto časť robil Adam Turčan                                                       |  
 ################################################################################## V
@@ -23,12 +27,30 @@ class ProductSerializer(serializers.ModelSerializer):
         method_name='calculate_tax')
 
     def calculate_tax(self, product: Product):
-        return product.unit_price * Decimal(1.1)
+        return price_with_tax(product.unit_price)
     
+class MenuImportRowSerializer(serializers.Serializer):
+    collection = serializers.CharField(max_length=255)
+    title = serializers.CharField(max_length=255)
+    slug = serializers.SlugField()
+    description = serializers.CharField(allow_blank=True, allow_null=True, required=False, default=None)
+    unit_price = serializers.DecimalField(max_digits=6, decimal_places=2, min_value=1)
+
+class MenuImportSerializer(serializers.Serializer):
+    products = MenuImportRowSerializer(many=True, allow_empty=False)
+
+    def validate_products(self, rows):
+        seen = set()
+        duplicates = sorted({row['slug'] for row in rows if row['slug'] in seen or seen.add(row['slug'])})
+        if duplicates:
+            raise serializers.ValidationError(f'Duplicate slugs in the import: {duplicates}')
+        return rows
+
 class CollectionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Collection
         fields = ['id', 'restaurant','title', 'products_count']
+        read_only_fields = ['restaurant']
 
     products_count = serializers.IntegerField(read_only=True)
 
@@ -49,6 +71,10 @@ class CartSerializer(serializers.ModelSerializer):
     total_price = serializers.SerializerMethodField()
 
     def get_total_price(self,cart):
+        # Annotated by the cart store where it can be computed in the database.
+        total_price = getattr(cart, 'total_price', None)
+        if total_price is not None:
+            return total_price
         return sum([item.quantity * item.product.unit_price for item in cart.items.all()])
 
     class Meta:
@@ -67,19 +93,36 @@ class AddCartItemSerializer(serializers.ModelSerializer):
         product_id = self.validated_data['product_id']
         quantity = self.validated_data['quantity']
 
-        try:
-            cart_item = CartItem.objects.get(cart_id =  cart_id,product_id = product_id)
-            cart_item.quantity += quantity
-            cart_item.save()
-            self.instance = cart_item
-        except CartItem.DoesNotExist:
-            self.instance =    CartItem.objects.create(cart_id = cart_id,**self.validated_data)    
+        items = get_cart_store().add_items(cart_id, {product_id: quantity})
+        self.instance = items[0] if items else None
         return self.instance
 
     class Meta:
         model = CartItem
         fields = ['id','product_id','quantity']
 
+class CartItemEntrySerializer(serializers.Serializer):
+    product_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1, max_value=32767)
+
+class BulkAddCartItemSerializer(serializers.Serializer):
+    items = CartItemEntrySerializer(many=True, allow_empty=False)
+
+    def validate_items(self, items):
+        product_ids = {item['product_id'] for item in items}
+        found = set(Product.objects.filter(pk__in=product_ids).values_list('id', flat=True))
+        missing = sorted(product_ids - found)
+        if missing:
+            raise serializers.ValidationError(f'No products with the given Ids were found: {missing}')
+        return items
+
+    def save(self, **kwargs):
+        quantities = {}
+        for item in self.validated_data['items']:
+            quantities[item['product_id']] = quantities.get(item['product_id'], 0) + item['quantity']
+
+        return get_cart_store().add_items(self.context['cart_id'], quantities)
+
 class UpdateCartItemSerializer(serializers.ModelSerializer):
     class Meta:
         model =  CartItem
@@ -98,7 +141,7 @@ class OrderSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Order
-        fields = ['id', 'restaurant', 'customer','table', 'placed_at', 'payment_status', 'items']
+        fields = ['id', 'restaurant', 'customer','table', 'placed_at', 'payment_status', 'subtotal', 'item_count', 'items']
 
 class UpdateOrderSerializer(serializers.ModelSerializer):
     class Meta:
@@ -108,26 +151,35 @@ class UpdateOrderSerializer(serializers.ModelSerializer):
 class CreateOrderSerializer(serializers.Serializer):
     cart_id = serializers.UUIDField()    
 
-    def validate_cart_id(self, cart_id):
-        if not Cart.objects.filter(pk=cart_id).exists():
-            raise serializers.ValidationError(
-                'No cart with the given ID was found.')
-        if CartItem.objects.filter(cart_id=cart_id).count() == 0:
-            raise serializers.ValidationError('The cart is empty.')
-        return cart_id
+    def check_items(self, items):
+        if items is None:
+            raise serializers.ValidationError({'cart_id': ['No cart with the given ID was found.']})
+        if not items:
+            raise serializers.ValidationError({'cart_id': ['The cart is empty.']})
+        table = self.context['table']
+        if any(item.product.restaurant_id != table.restaurant_id for item in items):
+            raise serializers.ValidationError('All products in the cart must belong to the restaurant of the table.')
+
+    def validate(self, attrs):
+        # Fails early; save() checks the items again as claimed.
+        self.check_items(get_cart_store().get_items(attrs['cart_id']))
+        return attrs
 
     def save(self, **kwargs):
-        with transaction.atomic():
-            cart_id = self.validated_data['cart_id']
-            restaurant = self.context.get('restaurant')
-            table = self.context.get('table')
-            customer = Customer.objects.get(
-                user_id=self.context['user_id'])
-            order = Order.objects.create(customer=customer,restaurant=restaurant,table=table)
-
-            cart_items = CartItem.objects \
-                .select_related('product') \
-                .filter(cart_id=cart_id)
+        cart_id = self.validated_data['cart_id']
+        table = self.context['table']
+
+        # The order is built from the items as claimed, not as validated: the cart may have changed since.
+        with transaction.atomic(), get_cart_store().checkout(cart_id) as cart_items:
+            self.check_items(cart_items)
+
+            order = Order.objects.create(
+                customer_id=self.context['customer_id'],
+                restaurant_id=table.restaurant_id,
+                table=table,
+                subtotal=sum(item.quantity * item.product.unit_price for item in cart_items),
+                item_count=sum(item.quantity for item in cart_items),
+            )
             order_items = [
                 OrderItem(
                     order=order,
@@ -137,10 +189,11 @@ class CreateOrderSerializer(serializers.Serializer):
                 ) for item in cart_items
             ]
             OrderItem.objects.bulk_create(order_items)
+            rollups.record_order(order, order_items)
 
-            Cart.objects.filter(pk=cart_id).delete()
-           
-            return order
+        # Serializing the new order needs no further queries.
+        set_prefetched(order, 'items', order_items)
+        return order
 #################################################################################
 #################################################################################
 #################################################################################
@@ -193,10 +246,11 @@ class WaiterSerializer(serializers.ModelSerializer):
         if Waiter.objects.filter(user=user).exists():
             raise serializers.ValidationError("Waiter with the provided email already exists.")
         
-        owner = Owner.objects.get(user=self.context['request'].user)
-        restaurant = owner.restaurant
+        restaurant_id = self.context['request'].role.owner_restaurant_id
+        if restaurant_id is None:
+            raise serializers.ValidationError("Only restaurant owners can add waiters.")
 
-        waiter = Waiter.objects.create(user=user, restaurant=restaurant)
+        waiter = Waiter.objects.create(user=user, restaurant_id=restaurant_id)
         return waiter
     def to_representation(self, instance):######
         data = super().to_representation(instance)
@@ -212,10 +266,10 @@ class RestaurantTableSerializer(serializers.ModelSerializer):
         read_only_fields = ['restaurant']
 
     def create(self, validated_data):
-        restaurant = validated_data.get('restaurant')
+        restaurant_id = validated_data.get('restaurant_id')
         
-        if restaurant:
-            existing_table = RestaurantTable.objects.filter(restaurant=restaurant, row=validated_data['row'], column=validated_data['column']).first()
+        if restaurant_id:
+            existing_table = RestaurantTable.objects.filter(restaurant_id=restaurant_id, row=validated_data['row'], column=validated_data['column']).first()
             if existing_table:
                 raise serializers.ValidationError("A table with the same restaurant, row, and column already exists.")
         
@@ -226,17 +280,75 @@ class TableReservationSerializer(serializers.ModelSerializer):
         model = TableReservation
         fields = ['id', 'customer', 'table', 'date_time_from', 'date_time_to']
         read_only_fields=['customer']
+
+    def validate(self, attrs):
+        date_time_from = attrs.get('date_time_from', getattr(self.instance, 'date_time_from', None))
+        date_time_to = attrs.get('date_time_to', getattr(self.instance, 'date_time_to', None))
+        if date_time_from and date_time_to and date_time_from >= date_time_to:
+            raise serializers.ValidationError("date_time_to must be later than date_time_from.")
+        return attrs
+
+    def check_table_is_free(self, table, date_time_from, date_time_to):
+        # Lock the table row (a no-op on SQLite, whose writes are already serialized) so two
+        # concurrent bookings for the same table cannot both pass the overlap check.
+        RestaurantTable.objects.select_for_update().filter(pk=table.pk).first()
+        exclude_id = self.instance.pk if self.instance else None
+        if find_conflict(table.pk, date_time_from, date_time_to, exclude_id=exclude_id):
+            raise serializers.ValidationError("The table is already reserved for an overlapping time.")
+
     def create(self, validated_data):
-        
-        table_id = validated_data.get('table').id
-        date_time_from = validated_data.get('date_time_from')
-        date_time_to = validated_data.get('date_time_to')
-        
-        existing_reservation = TableReservation.objects.filter(table_id=table_id, date_time_from=date_time_from, date_time_to=date_time_to).first()
-        if existing_reservation:
-            raise serializers.ValidationError("A reservation with the same table and time already exists.")
+        with transaction.atomic():
+            self.check_table_is_free(validated_data['table'], validated_data['date_time_from'], validated_data['date_time_to'])
+            return super().create(validated_data)
+
+    def update(self, instance, validated_data):
+        with transaction.atomic():
+            self.check_table_is_free(
+                validated_data.get('table', instance.table),
+                validated_data.get('date_time_from', instance.date_time_from),
+                validated_data.get('date_time_to', instance.date_time_to))
+            return super().update(instance, validated_data)
+
+class AvailabilitySerializer(serializers.Serializer):
+    date_time_from = serializers.DateTimeField()
+    date_time_to = serializers.DateTimeField()
+    seats = serializers.IntegerField(min_value=1, required=False)
+
+    def validate(self, attrs):
+        if attrs['date_time_from'] >= attrs['date_time_to']:
+            raise serializers.ValidationError("date_time_to must be later than date_time_from.")
+        return attrs
+
+
+class KitchenTicketBatchSerializer(serializers.Serializer):
+    orders = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=500)
+
+
+class KitchenRushSerializer(KitchenTicketBatchSerializer):
+    rush = serializers.BooleanField(default=True)
+
+
+class OrderExportSerializer(serializers.Serializer):
+    date_from = serializers.DateField()
+    date_to = serializers.DateField()
+    file_format = serializers.ChoiceField(choices=['csv', 'ndjson'], default='csv')
+
+    def validate(self, attrs):
+        if attrs['date_from'] > attrs['date_to']:
+            raise serializers.ValidationError("date_to must not be earlier than date_from.")
+        return attrs
+
+
+class SalesReportSerializer(serializers.Serializer):
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    group_by = serializers.ChoiceField(choices=['day', 'product', 'table'], default='day')
 
-        return super().create(validated_data)        
+    def validate(self, attrs):
+        attrs['date_from'], attrs['date_to'] = rollups.default_range(attrs.get('date_from'), attrs.get('date_to'))
+        if attrs['date_from'] > attrs['date_to']:
+            raise serializers.ValidationError("date_to must not be earlier than date_from.")
+        return attrs
 
 
 #################################################################################
@@ -0,0 +1,179 @@
+from django.conf import settings
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from . import events
+from .authentication import schedule_revocation
+from .conditional import mark_deleted
+from .floorplan import invalidate_floor_plan
+from .menu import schedule_menu_rebuild
+from .models import Collection, Customer, Order, OrderItem, Owner, Product, Restaurant, RestaurantTable, TableReservation, Waiter
+from .roles import invalidate_role_context
+from .rollups import record_item_deletion, record_order_deletion, record_payment_status_change
+from .search import index_product, unindex_product
+
+
+@receiver([post_save, post_delete], sender=Owner)
+@receiver([post_save, post_delete], sender=Waiter)
+@receiver([post_save, post_delete], sender=Customer)
+def clear_role_context(sender, instance, **kwargs):
+    invalidate_role_context(instance.user_id)
+    schedule_revocation(instance.user_id)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def revoke_user_claims(sender, instance, created, update_fields=None, **kwargs):
+    # is_staff and is_active are claims too. A new user has no tokens, and a login only sets last_login.
+    if not created and update_fields != frozenset(['last_login']):
+        schedule_revocation(instance.pk)
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def revoke_deleted_user_claims(sender, instance, **kwargs):
+    schedule_revocation(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Restaurant)
+def clear_restaurant_floor_plan(sender, instance, **kwargs):
+    invalidate_floor_plan(instance.pk)
+    schedule_menu_rebuild(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=Collection)
+def rebuild_menu(sender, instance, **kwargs):
+    schedule_menu_rebuild(instance.restaurant_id)
+
+
+@receiver([post_save, post_delete], sender=RestaurantTable)
+@receiver([post_save, post_delete], sender=Order)
+def clear_floor_plan(sender, instance, **kwargs):
+    invalidate_floor_plan(instance.restaurant_id)
+
+
+@receiver([post_save, post_delete], sender=OrderItem)
+def clear_order_item_floor_plan(sender, instance, **kwargs):
+    try:
+        invalidate_floor_plan(instance.order.restaurant_id)
+    except Order.DoesNotExist:
+        pass
+
+
+@receiver([post_save, post_delete], sender=TableReservation)
+def clear_reservation_floor_plan(sender, instance, **kwargs):
+    try:
+        invalidate_floor_plan(instance.table.restaurant_id)
+    except RestaurantTable.DoesNotExist:
+        pass
+
+
+@receiver(post_init, sender=Order)
+def remember_payment_status(sender, instance, **kwargs):
+    # Read through __dict__ so instances loaded with only()/defer() don't trigger a query.
+    instance._loaded_payment_status = instance.__dict__.get('payment_status')
+
+
+@receiver(post_init, sender=RestaurantTable)
+def remember_table_status(sender, instance, **kwargs):
+    instance._loaded_table_status = instance.__dict__.get('table_status')
+
+
+@receiver(post_save, sender=Order)
+def order_saved(sender, instance, created, **kwargs):
+    previous = instance._loaded_payment_status
+    instance._loaded_payment_status = instance.payment_status
+    publish_order_event(instance, created, previous)
+    if not created and previous is not None and previous != instance.payment_status:
+        record_payment_status_change(instance, previous)
+
+
+@receiver(post_delete, sender=Order)
+def order_deleted(sender, instance, **kwargs):
+    # Deletes run in a transaction (the Collector's), as saves do (Order.save).
+    record_order_deletion(instance)
+
+
+@receiver(post_delete, sender=OrderItem)
+def order_item_deleted(sender, instance, **kwargs):
+    try:
+        order = instance.order
+    except Order.DoesNotExist:
+        return
+    record_item_deletion(instance, order)
+
+
+def publish_order_event(instance, created, previous):
+    data = {
+        'id': instance.id,
+        'restaurant': instance.restaurant_id,
+        'table': instance.table_id,
+        'customer': instance.customer_id,
+        'payment_status': instance.payment_status,
+        'placed_at': instance.placed_at,
+    }
+    if created:
+        event_type = events.ORDER_CREATED
+    elif previous is not None and previous != instance.payment_status:
+        event_type = events.ORDER_PAYMENT_STATUS_CHANGED
+        data['previous_payment_status'] = previous
+    else:
+        return
+    events.publish_event(event_type, data, restaurant_id=instance.restaurant_id, customer_id=instance.customer_id)
+
+
+@receiver(post_save, sender=RestaurantTable)
+def publish_table_event(sender, instance, created, **kwargs):
+    previous = instance._loaded_table_status
+    instance._loaded_table_status = instance.table_status
+    if created or previous is None or previous == instance.table_status:
+        return
+    events.publish_event(events.TABLE_STATUS_CHANGED, {
+        'id': instance.id,
+        'restaurant': instance.restaurant_id,
+        'table_status': instance.table_status,
+        'previous_table_status': previous,
+    }, restaurant_id=instance.restaurant_id)
+
+
+def publish_reservation_event(event_type, instance):
+    try:
+        restaurant_id = instance.table.restaurant_id
+    except RestaurantTable.DoesNotExist:
+        return
+    events.publish_event(event_type, {
+        'id': instance.id,
+        'table': instance.table_id,
+        'customer': instance.customer_id,
+        'date_time_from': instance.date_time_from,
+        'date_time_to': instance.date_time_to,
+    }, restaurant_id=restaurant_id, customer_id=instance.customer_id)
+
+
+@receiver(post_save, sender=TableReservation)
+def publish_reservation_created(sender, instance, created, **kwargs):
+    if created:
+        publish_reservation_event(events.RESERVATION_CREATED, instance)
+
+
+@receiver(post_delete, sender=TableReservation)
+def publish_reservation_cancelled(sender, instance, **kwargs):
+    publish_reservation_event(events.RESERVATION_CANCELLED, instance)
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Collection)
+@receiver(post_delete, sender=RestaurantTable)
+@receiver(post_delete, sender=Order)
+@receiver(post_delete, sender=TableReservation)
+def remember_deletion(sender, instance, **kwargs):
+    mark_deleted(sender)
+
+
+@receiver(post_save, sender=Product)
+def update_search_index(sender, instance, **kwargs):
+    index_product(instance)
+
+
+@receiver(post_delete, sender=Product)
+def remove_from_search_index(sender, instance, **kwargs):
+    unindex_product(instance.pk)
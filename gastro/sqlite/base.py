@@ -0,0 +1,22 @@
+"""
+SQLite backend of the production profile (GASTRO_SQLITE_PRODUCTION), for any Django
+version: the init_command and transaction_mode OPTIONS only exist from Django 5.1,
+and older versions pass them on to sqlite3.connect(), which rejects them.
+"""
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.backends.sqlite3 import base
+from django.dispatch import receiver
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def _start_transaction_under_autocommit(self):
+        # BEGIN IMMEDIATE takes the write lock up front (see settings.GASTRO_SQLITE_PRODUCTION).
+        self.cursor().execute('BEGIN IMMEDIATE')
+
+
+@receiver(connection_created, sender=DatabaseWrapper)
+def apply_pragmas(sender, connection, **kwargs):
+    with connection.cursor() as cursor:
+        for name, value in getattr(settings, 'GASTRO_SQLITE_PRAGMAS', {}).items():
+            cursor.execute(f'PRAGMA {name}={value}')
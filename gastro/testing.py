@@ -0,0 +1,86 @@
+import re
+from urllib.parse import urlsplit
+
+from django.db import connection
+from django.urls import resolve
+
+from .instrumentation import QueryRecorder, view_query_budget
+
+# Every SCAN in SQLite's EXPLAIN QUERY PLAN walks a whole table or index; only SEARCH
+# narrows the rows through an index. FTS5 MATCH lookups are the exception: SQLite shows
+# them as a virtual table scan with an M (MATCH) constraint in the index string.
+FULL_SCAN_RE = re.compile(r'^SCAN (?!\S+ VIRTUAL TABLE INDEX \d+:\S*M)')
+INDEX_SCAN_RE = re.compile(r'^SCAN (\S+) USING (?:COVERING )?INDEX ')
+TEMP_SORT_RE = re.compile(r'^USE TEMP B-TREE FOR (?:RIGHT PART OF |LAST TERM OF )?ORDER BY')
+
+
+class QueryBudgetTestMixin:
+    """
+    TestCase helpers that fail when a gastro endpoint runs more queries than the
+    ``query_budget`` of its view, or repeats one query shape like an N+1 would.
+    """
+
+    def assertWithinQueryBudget(self, client, method, path, data=None, budget=None, **extra):
+        view_func = resolve(urlsplit(path).path).func
+        if budget is None:
+            budget = view_query_budget(view_func, method)
+        if budget is None:
+            self.fail(f'{getattr(view_func, "cls", view_func).__name__} declares no query_budget for {method} {path}')
+
+        recorder = QueryRecorder()
+        with recorder.record():
+            response = getattr(client, method.lower())(path, data, **extra)
+        self.assertLess(response.status_code, 400, response.content)
+
+        queries = '\n'.join(f'  {sql}' for sql, _ in recorder.queries)
+        self.assertLessEqual(
+            recorder.count, budget,
+            f'{method} {path} ran {recorder.count} queries, over its budget of {budget}:\n{queries}')
+        self.assertEqual(recorder.repeated(), {}, f'{method} {path} repeats queries (N+1?):\n{queries}')
+        return response
+
+
+class QueryPlanTestMixin:
+    """
+    TestCase helpers that run EXPLAIN QUERY PLAN on every SELECT an endpoint issues
+    and fail when one of them falls back to a full table scan. SQLite only.
+    """
+
+    def explain_request(self, client, method, path, data=None, **extra):
+        statements = []
+
+        def capture(execute, sql, params, many, context):
+            if sql.lstrip().upper().startswith('SELECT'):
+                statements.append((sql, params))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(capture):
+            response = getattr(client, method.lower())(path, data, **extra)
+        self.assertLess(response.status_code, 400, response.content)
+
+        plans = []
+        with connection.cursor() as cursor:
+            for sql, params in statements:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+                plans.append((sql, [row[-1] for row in cursor.fetchall()]))
+        return plans
+
+    def assertNoFullScans(self, client, method, path, data=None, index_scans=(), **extra):
+        """
+        ``index_scans`` names the tables an unfiltered list may walk in index order,
+        stopping after a page; a bare table scan always fails.
+        """
+        def expected(detail):
+            match = INDEX_SCAN_RE.match(detail)
+            return match is not None and match[1] in index_scans
+
+        plans = self.explain_request(client, method, path, data, **extra)
+        scans = [f'  {detail}\n    in {sql}' for sql, plan in plans for detail in plan
+                 if FULL_SCAN_RE.match(detail) and not expected(detail)]
+        self.assertEqual(scans, [], f'{method} {path} scans whole tables:\n' + '\n'.join(scans))
+
+    def assertIndexOrdered(self, client, method, path, data=None, **extra):
+        # Every ORDER BY is read off an index rather than sorted in a temporary B-tree.
+        plans = self.explain_request(client, method, path, data, **extra)
+        sorts = [f'  {detail}\n    in {sql}' for sql, plan in plans for detail in plan if TEMP_SORT_RE.match(detail)]
+        self.assertEqual(sorts, [], f'{method} {path} sorts rows outside an index:\n' + '\n'.join(sorts))
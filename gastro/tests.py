@@ -1,3 +1,1503 @@
-from django.test import TestCase
+import asyncio
+import base64
+import csv
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipIf, skipUnless
+from urllib.parse import parse_qs, urlsplit
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DatabaseError, connection, connections, router, transaction
+from django.db.utils import load_backend
+from django.test import AsyncClient, AsyncRequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken, UntypedToken
+
+from core.models import User
+
+from . import carts, events, replicas, views
+from .authentication import RoleAccessToken, revocation_key
+from .carts import CacheCartStore, CartBusy, DatabaseCartStore
+from .checks import check_cart_cache, check_revocation_cache
+from .floorplan import floor_plan_cache_key, get_floor_plan
+from .instrumentation import QueryRecorder, sql_shape
+from .models import (Cart, CartItem, Collection, Customer, DailyProductSales, DailyRestaurantSales, DailyTableSales,
+                     Order, OrderItem, Owner, Product, Restaurant, RestaurantTable, TableReservation, Waiter)
+from .pagination import KeysetPagination
+from .roles import get_role_context, role_cache_key
+from .rollups import rebuild_rollups
+from .serializers import CreateOrderSerializer, OrderSerializer, ProductSerializer, RestaurantTableSerializer
+from .testing import FULL_SCAN_RE, QueryBudgetTestMixin, QueryPlanTestMixin
+
+
+class GastroTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.restaurant = Restaurant.objects.create(table_grid_width=4, table_grid_height=4, restaurant_title='Bistro')
+        self.owner_user = User.objects.create(username='owner', email='owner@example.com')
+        self.waiter_user = User.objects.create(username='waiter', email='waiter@example.com')
+        self.customer_user = User.objects.create(username='customer', email='customer@example.com')
+        self.admin_user = User.objects.create(username='admin', email='admin@example.com', is_staff=True)
+        Owner.objects.create(user=self.owner_user, restaurant=self.restaurant)
+        for i in range(3):
+            user = User.objects.create(username=f'waiter{i}', email=f'waiter{i}@example.com')
+            Waiter.objects.create(user=user, restaurant=self.restaurant)
+        Waiter.objects.create(user=self.waiter_user, restaurant=self.restaurant)
+        self.customer = Customer.objects.create(user=self.customer_user, phone='1')
+
+        self.table = RestaurantTable.objects.create(restaurant=self.restaurant, seats=4, row=0, column=0)
+        self.collection = Collection.objects.create(title='Food', restaurant=self.restaurant)
+        self.products = [
+            Product.objects.create(title=f'Dish {i}', slug=f'dish-{i}', unit_price=Decimal('5.00'),
+                                   collection=self.collection, restaurant=self.restaurant)
+            for i in range(3)
+        ]
+        for _ in range(3):
+            order = Order.objects.create(restaurant=self.restaurant, table=self.table, customer=self.customer)
+            OrderItem.objects.bulk_create(
+                OrderItem(order=order, product=product, quantity=1, unit_price=product.unit_price)
+                for product in self.products)
+        self.order = order
+        TableReservation.objects.create(table=self.table, customer=self.customer,
+                                        date_time_from='2030-01-01T18:00Z', date_time_to='2030-01-01T20:00Z')
+        cache.clear()
+
+    def client_for(self, user):
+        # A real token, with the role claims the API issues, rather than force_authenticate.
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'JWT {RoleAccessToken.for_user(user)}')
+        return client
+
+
+class SqlShapeTests(TestCase):
+    def test_literals_and_parameter_lists_collapse(self):
+        self.assertEqual(
+            sql_shape("SELECT * FROM t WHERE id IN (%s, %s, %s) AND name = 'x' LIMIT 21"),
+            sql_shape("SELECT * FROM t WHERE id IN (%s, %s)  AND name = 'y' LIMIT 10"))
+
+    def test_repeated_queries_are_reported(self):
+        recorder = QueryRecorder()
+        with recorder.record():
+            list(Product.objects.all())
+            for pk in (1, 2, 3):
+                list(Product.objects.filter(pk=pk))
+        self.assertEqual(list(recorder.repeated().values()), [3])
+
+
+class ProductionDatabaseProfileTests(SimpleTestCase):
+    """GASTRO_SQLITE_PRODUCTION on a real file, through the backend it names."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'production.sqlite3')
+        profile = settings.GASTRO_SQLITE_PRODUCTION
+        self.connection = load_backend(profile['ENGINE']).DatabaseWrapper(
+            {**connections['default'].settings_dict, **profile, 'NAME': self.path}, 'production')
+        self.addCleanup(self.connection.close)
+
+    def pragma(self, name):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas_apply_to_new_connections(self):
+        self.assertEqual(self.pragma('journal_mode'), 'wal')
+        self.assertEqual(self.pragma('busy_timeout'), 5000)
+        self.assertEqual(self.pragma('synchronous'), 1)  # NORMAL
+
+    def test_transactions_take_the_write_lock_up_front(self):
+        connections['production'] = self.connection
+        self.addCleanup(connections.__delitem__, 'production')
+        other = sqlite3.connect(self.path, timeout=0)
+        self.addCleanup(other.close)
+        with transaction.atomic(using='production'):
+            # No write yet, but BEGIN IMMEDIATE already holds the lock another writer needs.
+            with self.assertRaisesRegex(sqlite3.OperationalError, 'locked'):
+                other.execute('BEGIN IMMEDIATE')
+
+
+class FullScanPatternTests(TestCase):
+    def test_only_search_and_fts_match_pass(self):
+        for detail in ('SCAN gastro_order', 'SCAN gastro_order USING INDEX gastro_orde_restaur_4f30da_idx',
+                       'SCAN gastro_order USING COVERING INDEX gastro_orde_restaur_4f30da_idx',
+                       'SCAN gastro_product_fts VIRTUAL TABLE INDEX 0:'):
+            self.assertTrue(FULL_SCAN_RE.match(detail), detail)
+        for detail in ('SEARCH gastro_order USING INDEX gastro_orde_restaur_4f30da_idx (restaurant_id=?)',
+                       'SEARCH gastro_order USING INTEGER PRIMARY KEY (rowid=?)',
+                       'SCAN gastro_product_fts VIRTUAL TABLE INDEX 0:M3'):
+            self.assertFalse(FULL_SCAN_RE.match(detail), detail)
+
+
+class QueryBudgetTests(QueryBudgetTestMixin, GastroTestCase):
+    def test_catalog(self):
+        owner = self.client_for(self.owner_user)
+        self.assertWithinQueryBudget(owner, 'GET', '/api/products/')
+        self.assertWithinQueryBudget(owner, 'GET', f'/api/products/{self.products[0].id}/')
+        self.assertWithinQueryBudget(owner, 'GET', '/api/collections/')
+        self.assertWithinQueryBudget(owner, 'GET', f'/api/collections/{self.collection.id}/')
+
+    def test_carts(self):
+        customer = self.client_for(self.customer_user)
+        cart = customer.post('/api/carts/').json()['id']
+        customer.post(f'/api/carts/{cart}/items/bulk/', {
+            'items': [{'product_id': product.id, 'quantity': 1} for product in self.products]}, format='json')
+        cache.clear()
+        self.assertWithinQueryBudget(customer, 'GET', f'/api/carts/{cart}/')
+        self.assertWithinQueryBudget(customer, 'GET', f'/api/carts/{cart}/items/')
+
+    def test_orders(self):
+        customer = self.client_for(self.customer_user)
+        self.assertWithinQueryBudget(customer, 'GET', '/api/orders/')
+        self.assertWithinQueryBudget(customer, 'GET', f'/api/orders/{self.order.id}/')
+        self.assertWithinQueryBudget(customer, 'GET', '/api/orders/me/')
+
+    def test_staff_order_list(self):
+        response = self.assertWithinQueryBudget(self.client_for(self.waiter_user), 'GET', '/api/orders/')
+        self.assertEqual(len(response.json()['results']), 3)
+
+    def test_staff(self):
+        self.assertWithinQueryBudget(self.client_for(self.owner_user), 'GET', '/api/waiters/')
+        self.assertWithinQueryBudget(self.client_for(self.owner_user), 'GET', '/api/tables/')
+        self.assertWithinQueryBudget(self.client_for(self.owner_user), 'GET', '/api/reservations/')
+        self.assertWithinQueryBudget(self.client_for(self.customer_user), 'GET', '/api/reservations/me/')
+        self.assertWithinQueryBudget(self.client_for(self.admin_user), 'GET', '/api/customers/')
+
+    def test_restaurant(self):
+        owner = self.client_for(self.owner_user)
+        restaurant_url = f'/api/restaurants/{self.restaurant.id}/'
+        self.assertWithinQueryBudget(owner, 'GET', '/api/restaurants/')
+        self.assertWithinQueryBudget(owner, 'GET', restaurant_url)
+        self.assertWithinQueryBudget(owner, 'GET', restaurant_url + 'availability/', {
+            'date_time_from': '2030-01-01T18:00Z', 'date_time_to': '2030-01-01T19:00Z'})
+        self.assertWithinQueryBudget(owner, 'GET', restaurant_url + 'menu/')
+        self.assertWithinQueryBudget(owner, 'GET', restaurant_url + 'floor-plan/')
+        self.assertWithinQueryBudget(owner, 'GET', restaurant_url + 'sales/')
+        self.assertWithinQueryBudget(self.client_for(self.waiter_user), 'GET', restaurant_url + 'kitchen-queue/')
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN is SQLite syntax')
+class QueryPlanTests(QueryPlanTestMixin, GastroTestCase):
+    def test_catalog(self):
+        customer = self.client_for(self.customer_user)
+        restaurant = self.restaurant.id
+        self.assertNoFullScans(customer, 'GET', f'/api/products/?restaurant={restaurant}')
+        self.assertNoFullScans(customer, 'GET', f'/api/products/?restaurant={restaurant}&collection_id={self.collection.id}'
+                                                '&unit_price__gt=1&unit_price__lt=50')
+        self.assertNoFullScans(customer, 'GET', f'/api/products/?restaurant={restaurant}&ordering=unit_price')
+        self.assertNoFullScans(customer, 'GET', f'/api/products/?restaurant={restaurant}&search=dish')
+        self.assertNoFullScans(customer, 'GET', f'/api/products/{self.products[0].id}/?restaurant={restaurant}')
+        self.assertNoFullScans(customer, 'GET', f'/api/collections/?restaurant={restaurant}')
+
+    def test_orders(self):
+        self.assertNoFullScans(self.client_for(self.customer_user), 'GET', '/api/orders/')
+        self.assertNoFullScans(self.client_for(self.customer_user), 'GET', '/api/orders/me/')
+        self.assertNoFullScans(self.client_for(self.waiter_user), 'GET', '/api/orders/')
+        self.assertNoFullScans(self.client_for(self.owner_user), 'GET', f'/api/orders/{self.order.id}/')
+
+    def test_staff_and_reservations(self):
+        owner = self.client_for(self.owner_user)
+        self.assertNoFullScans(owner, 'GET', '/api/waiters/')
+        self.assertNoFullScans(owner, 'GET', '/api/tables/')
+        self.assertNoFullScans(owner, 'GET', '/api/reservations/')
+        self.assertNoFullScans(self.client_for(self.customer_user), 'GET', '/api/reservations/')
+        self.assertNoFullScans(self.client_for(self.customer_user), 'GET', '/api/reservations/me/')
+        # All customers, a page at a time in name order.
+        self.assertNoFullScans(self.client_for(self.admin_user), 'GET', '/api/customers/', index_scans=['core_user'])
+
+    def test_restaurant(self):
+        owner = self.client_for(self.owner_user)
+        restaurant_url = f'/api/restaurants/{self.restaurant.id}/'
+        self.assertNoFullScans(owner, 'GET', restaurant_url + 'availability/', {
+            'date_time_from': '2030-01-01T18:00Z', 'date_time_to': '2030-01-01T19:00Z'})
+        self.assertNoFullScans(owner, 'GET', restaurant_url + 'menu/')
+        self.assertNoFullScans(owner, 'GET', restaurant_url + 'floor-plan/')
+        self.assertNoFullScans(owner, 'GET', restaurant_url + 'sales/')
+        self.assertNoFullScans(self.client_for(self.waiter_user), 'GET', restaurant_url + 'kitchen-queue/')
+
+    def test_kitchen_queue(self):
+        Order.objects.filter(pk=self.order.pk).update(rush=True)
+        waiter = self.client_for(self.waiter_user)
+        url = f'/api/restaurants/{self.restaurant.id}/kitchen-queue/'
+        self.assertEqual(waiter.get(url).json()[0]['id'], self.order.id)
+        self.assertNoFullScans(waiter, 'GET', url)
+        self.assertIndexOrdered(waiter, 'GET', url)
+
+
+class RoleContextCacheTests(GastroTestCase):
+    """get_role_context resolves a user's roles in one query and caches them until a role row changes."""
+
+    def test_one_query_then_cached(self):
+        with self.assertNumQueries(1):
+            role = get_role_context(self.owner_user)
+        self.assertEqual((role.is_owner, role.restaurant_id), (True, self.restaurant.id))
+        with self.assertNumQueries(0):
+            self.assertEqual(get_role_context(self.owner_user).restaurant_id, self.restaurant.id)
+
+    def test_saving_a_role_row_invalidates(self):
+        self.assertFalse(get_role_context(self.customer_user).is_waiter)
+        waiter = Waiter.objects.create(user=self.customer_user, restaurant=self.restaurant)
+        role = get_role_context(self.customer_user)
+        self.assertEqual((role.waiter_id, role.restaurant_id, role.customer_id),
+                         (waiter.id, self.restaurant.id, self.customer.id))
+
+        other = Restaurant.objects.create(table_grid_width=1, table_grid_height=1, restaurant_title='Grill')
+        waiter.restaurant = other
+        waiter.save()
+        self.assertEqual(get_role_context(self.customer_user).restaurant_id, other.id)
+
+    def test_deleting_a_role_row_invalidates(self):
+        self.assertTrue(get_role_context(self.owner_user).is_owner)
+        Owner.objects.filter(user=self.owner_user).get().delete()
+        role = get_role_context(self.owner_user)
+        self.assertFalse(role.is_owner)
+        self.assertIsNone(role.restaurant_id)
+
+    def test_anonymous(self):
+        with self.assertNumQueries(0):
+            self.assertIsNone(get_role_context(AnonymousUser()).restaurant_id)
+
+
+class ReservationOverlapTests(GastroTestCase):
+    """Reservations are half-open intervals; the setUp one holds the table 18:00-20:00."""
+
+    def setUp(self):
+        super().setUp()
+        self.small_table = RestaurantTable.objects.create(restaurant=self.restaurant, seats=2, row=0, column=1)
+        self.customer_client = self.client_for(self.customer_user)
+
+    def reserve(self, start, end, table=None):
+        return self.customer_client.post('/api/reservations/', {
+            'table': (table or self.table).id,
+            'date_time_from': f'2030-01-01T{start}Z', 'date_time_to': f'2030-01-01T{end}Z'})
+
+    def available(self, start, end, **params):
+        response = self.client.get(f'/api/restaurants/{self.restaurant.id}/availability/', {
+            'date_time_from': f'2030-01-01T{start}Z', 'date_time_to': f'2030-01-01T{end}Z', **params})
+        self.assertEqual(response.status_code, 200)
+        return [table['id'] for table in response.json()]
+
+    def test_overlaps_are_rejected(self):
+        for start, end in (('19:00', '21:00'), ('17:00', '18:30'), ('17:00', '21:00'), ('18:30', '19:00')):
+            self.assertEqual(self.reserve(start, end).status_code, 400, (start, end))
+        self.assertEqual(self.reserve('19:00', '21:00', self.small_table).status_code, 201)
+
+    def test_back_to_back_is_allowed(self):
+        self.assertEqual(self.reserve('20:00', '22:00').status_code, 201)
+        self.assertEqual(self.reserve('16:00', '18:00').status_code, 201)
+
+    def test_empty_interval_is_rejected(self):
+        self.assertEqual(self.reserve('19:00', '19:00').status_code, 400)
+
+    def test_update_checks_other_reservations_only(self):
+        reservation = self.reserve('21:00', '22:00').json()
+        url = f'/api/reservations/{reservation["id"]}/'
+        self.assertEqual(self.customer_client.patch(url, {'date_time_to': '2030-01-01T23:00Z'}).status_code, 200)
+        self.assertEqual(self.customer_client.patch(url, {'date_time_from': '2030-01-01T19:30Z'}).status_code, 400)
+
+    def test_availability(self):
+        self.assertEqual(self.available('18:00', '19:00'), [self.small_table.id])
+        self.assertEqual(self.available('20:00', '21:00'), [self.small_table.id, self.table.id])
+        self.assertEqual(self.available('20:00', '21:00', seats=3), [self.table.id])
+        self.assertEqual(self.available('17:00', '18:00', seats=5), [])
+
+    def test_availability_runs_a_constant_number_of_queries(self):
+        for column in range(2, 4):
+            RestaurantTable.objects.create(restaurant=self.restaurant, seats=4, row=1, column=column)
+        with self.assertNumQueries(2):
+            self.assertEqual(len(self.available('18:00', '19:00')), 3)
+
+
+class RecordingBroadcaster(events.BaseBroadcaster):
+    def __init__(self):
+        self.published = []
+
+    def publish(self, channel, message):
+        self.published.append((channel, message['type']))
+
+
+class EventPublicationTests(GastroTestCase):
+    """Events go out once the change commits, to the restaurant's and the customer's channels."""
+
+    def setUp(self):
+        super().setUp()
+        self.broadcaster = RecordingBroadcaster()
+        patcher = mock.patch('gastro.events.get_broadcaster', return_value=self.broadcaster)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.staff = events.restaurant_channel(self.restaurant.id)
+        self.customer_channel = events.customer_channel(self.customer.id)
+
+    def test_order_created_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            Order.objects.create(restaurant=self.restaurant, table=self.table, customer=self.customer)
+            self.assertEqual(self.broadcaster.published, [])
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.broadcaster.published, [
+            (self.staff, events.ORDER_CREATED), (self.customer_channel, events.ORDER_CREATED)])
+
+    def test_rolled_back_changes_are_not_published(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(DatabaseError), transaction.atomic():
+                self.order.payment_status = Order.ORDER_COMPLETE
+                self.order.save()
+                raise DatabaseError
+        self.assertEqual(self.broadcaster.published, [])
+
+    def test_payment_status_change(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.order.save()
+            self.order.payment_status = Order.ORDER_COMPLETE
+            self.order.save()
+        self.assertEqual(self.broadcaster.published, [
+            (self.staff, events.ORDER_PAYMENT_STATUS_CHANGED), (self.customer_channel, events.ORDER_PAYMENT_STATUS_CHANGED)])
+
+    def test_table_status_change_goes_to_staff_only(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.table.table_status = RestaurantTable.TABLE_FULL
+            self.table.save()
+        self.assertEqual(self.broadcaster.published, [(self.staff, events.TABLE_STATUS_CHANGED)])
+
+    def test_reservation_created_and_cancelled(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            reservation = TableReservation.objects.create(
+                table=self.table, customer=self.customer,
+                date_time_from='2030-01-02T18:00Z', date_time_to='2030-01-02T20:00Z')
+            reservation.delete()
+        self.assertEqual(self.broadcaster.published, [
+            (self.staff, events.RESERVATION_CREATED), (self.customer_channel, events.RESERVATION_CREATED),
+            (self.staff, events.RESERVATION_CANCELLED), (self.customer_channel, events.RESERVATION_CANCELLED)])
+
+    def test_in_process_subscribers_get_their_channels_only(self):
+        async def receive():
+            broadcaster = events.InProcessBroadcaster()
+            staff = broadcaster.subscribe([self.staff])
+            other = broadcaster.subscribe([events.restaurant_channel(self.restaurant.id + 1)])
+            broadcaster.publish(self.staff, {'type': events.ORDER_CREATED})
+            received = (await staff.get(timeout=1), await other.get(timeout=0.01))
+            await staff.close()
+            await other.close()
+            return received
+        self.assertEqual(async_to_sync(receive)(), ({'type': events.ORDER_CREATED}, None))
+
+
+@mock.patch('gastro.views.STREAM_KEEPALIVE_SECONDS', 0.05)
+class EventStreamTests(GastroTestCase):
+    """The stream ends once the token behind it stops being valid."""
+
+    def read_stream(self, token, on_keepalive=lambda: None):
+        async def read():
+            request = AsyncRequestFactory().get('/api/events/', headers={'Authorization': f'JWT {token}'})
+            response = await views.event_stream(request)
+            chunks = []
+            async for chunk in response.streaming_content:
+                chunks.append(chunk)
+                if chunk == b': keepalive\n\n' and chunks.count(chunk) == 1:
+                    on_keepalive()
+            return chunks
+
+        async def read_or_time_out():
+            return await asyncio.wait_for(read(), timeout=5)
+        return async_to_sync(read_or_time_out)()
+
+    def test_expired_token_ends_the_stream(self):
+        token = RoleAccessToken.for_user(self.waiter_user)
+        token.set_exp(lifetime=timedelta(seconds=1))
+        chunks = self.read_stream(token)
+        self.assertEqual(chunks[0], b'retry: 3000\n\n')
+        self.assertGreaterEqual(time.time(), token['exp'])
+
+    def test_revoked_token_ends_the_stream(self):
+        token = RoleAccessToken.for_user(self.waiter_user)
+        chunks = self.read_stream(token, lambda: cache.set(revocation_key(self.waiter_user.id), False))
+        self.assertEqual(chunks, [b'retry: 3000\n\n', b': keepalive\n\n'])
+
+    def test_role_change_ends_a_stream_without_role_claims(self):
+        token = AccessToken.for_user(self.waiter_user)
+        chunks = self.read_stream(token, lambda: cache.set(role_cache_key(self.waiter_user.id), (None,) * 5))
+        self.assertEqual(chunks, [b'retry: 3000\n\n', b': keepalive\n\n'])
+
+
+class ConditionalGetTests(GastroTestCase):
+    """ETag / Last-Modified validators and the 304s they allow."""
+
+    def setUp(self):
+        super().setUp()
+        self.owner = self.client_for(self.owner_user)
+        self.hour_ago = timezone.now() - timedelta(hours=1)
+        Product.objects.update(last_update=self.hour_ago)
+
+    def test_list_not_modified(self):
+        response = self.owner.get('/api/products/')
+        self.assertEqual(response['Last-Modified'], http_date(int(self.hour_ago.timestamp())))
+        self.assertEqual(self.owner.get('/api/products/', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(self.owner.get('/api/products/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+        # The ETag is per user and per query string.
+        self.assertNotEqual(self.client_for(self.waiter_user).get('/api/products/')['ETag'], response['ETag'])
+        self.assertEqual(self.owner.get('/api/products/?page_size=1', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_list_modified(self):
+        etag = self.owner.get('/api/products/')['ETag']
+        product = self.products[0]
+        product.title = 'Soup'
+        product.save()
+        response = self.owner.get('/api/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_delete_changes_last_modified(self):
+        extra = Product.objects.create(title='Extra', slug='extra', unit_price=Decimal('1.00'),
+                                       collection=self.collection, restaurant=self.restaurant)
+        Product.objects.filter(pk=extra.pk).update(last_update=self.hour_ago - timedelta(hours=1))
+        last_modified = self.owner.get('/api/products/')['Last-Modified']
+        extra.delete()
+        # A row that was not the newest: only mark_deleted moves Last-Modified on.
+        response = self.owner.get('/api/products/', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['Last-Modified'], last_modified)
+
+    def test_retrieve_not_modified(self):
+        url = f'/api/products/{self.products[0].id}/'
+        etag = self.owner.get(url)['ETag']
+        not_modified = self.owner.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], etag)
+        self.assertEqual(not_modified.content, b'')
+        Product.objects.filter(pk=self.products[0].id).update(last_update=timezone.now())
+        self.assertEqual(self.owner.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_orders_follow_their_products(self):
+        Order.objects.update(last_update=self.hour_ago)
+        customer = self.client_for(self.customer_user)
+        requests = [(self.owner, '/api/orders/'), (self.owner, f'/api/orders/{self.order.id}/'), (customer, '/api/orders/me/')]
+        etags = [client.get(url)['ETag'] for client, url in requests]
+        product = self.products[0]
+        product.title = 'Soup'
+        product.save()
+        for (client, url), etag in zip(requests, etags):
+            response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertIn('Soup', response.content.decode())
+
+    def test_tracked_models(self):
+        for url in ('/api/collections/', '/api/tables/', '/api/orders/', '/api/reservations/'):
+            etag = self.owner.get(url)['ETag']
+            self.assertEqual(self.owner.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304, url)
+
+
+class MenuCacheTests(GastroTestCase):
+    """The menu document is served from the cache and rebuilt once a menu change commits."""
+
+    def setUp(self):
+        super().setUp()
+        self.client = self.client_for(self.customer_user)
+        self.url = f'/api/restaurants/{self.restaurant.id}/menu/'
+
+    def titles(self):
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        menu = response.json()
+        return {collection['title']: [product['title'] for product in collection['products']]
+                for collection in menu['collections']}
+
+    def test_warm_menu_runs_no_queries(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.assertEqual(self.titles(), {'Food': ['Dish 0', 'Dish 1', 'Dish 2']})
+
+    def test_product_changes_rebuild_after_commit(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            product = self.products[0]
+            product.title = 'Soup'
+            product.save()
+            self.assertEqual(self.titles(), {'Food': ['Dish 0', 'Dish 1', 'Dish 2']})
+        self.assertEqual(self.titles(), {'Food': ['Dish 1', 'Dish 2', 'Soup']})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(title='Bread', slug='bread', unit_price=Decimal('2.00'),
+                                   collection=self.collection, restaurant=self.restaurant)
+        self.assertEqual(self.titles(), {'Food': ['Bread', 'Dish 1', 'Dish 2', 'Soup']})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.get(title='Bread').delete()
+        self.assertEqual(self.titles(), {'Food': ['Dish 1', 'Dish 2', 'Soup']})
+
+    def test_collection_changes_rebuild_after_commit(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.collection.title = 'Mains'
+            self.collection.save()
+            drinks = Collection.objects.create(title='Drinks', restaurant=self.restaurant)
+        self.assertEqual(self.titles(), {'Drinks': [], 'Mains': ['Dish 0', 'Dish 1', 'Dish 2']})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            drinks.delete()
+        self.assertEqual(self.titles(), {'Mains': ['Dish 0', 'Dish 1', 'Dish 2']})
+
+
+class FloorPlanTests(GastroTestCase):
+    """The cached floor-plan snapshot, and the changes that drop it."""
+
+    def setUp(self):
+        super().setUp()
+        self.corner = RestaurantTable.objects.create(restaurant=self.restaurant, seats=2, row=1, column=3)
+        Order.objects.update(subtotal=Decimal('15.00'))
+        Order.objects.filter(pk=self.order.pk).update(payment_status=Order.ORDER_COMPLETE)
+        TableReservation.objects.create(table=self.corner, customer=self.customer,
+                                        date_time_from='2020-01-01T18:00Z', date_time_to='2020-01-01T20:00Z')
+        cache.clear()
+
+    def tables(self):
+        return {table['id']: table for table in get_floor_plan(self.restaurant.id)['tables']}
+
+    def test_snapshot(self):
+        response = self.client_for(self.waiter_user).get(f'/api/restaurants/{self.restaurant.id}/floor-plan/')
+        self.assertEqual(response.status_code, 200)
+        plan = response.json()
+        self.assertEqual(plan['restaurant']['table_grid_width'], 4)
+        self.assertEqual([table['id'] for table in plan['tables']], [self.table.id, self.corner.id])
+
+        table, corner = plan['tables']
+        self.assertEqual((table['open_orders'], float(table['open_total'])), (2, 30.0))
+        reservation = TableReservation.objects.get(table=self.table)
+        self.assertEqual(table['next_reservation']['id'], reservation.id)
+        self.assertEqual((corner['open_orders'], float(corner['open_total'])), (0, 0.0))
+        # Reservations that have ended are not "next".
+        self.assertIsNone(corner['next_reservation'])
+
+    def test_snapshot_is_cached(self):
+        self.tables()
+        with self.assertNumQueries(0):
+            self.tables()
+        self.assertIsNone(get_floor_plan(0))
+
+    def test_table_changes_invalidate(self):
+        self.tables()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.corner.table_status = RestaurantTable.TABLE_FULL
+            self.corner.save()
+        self.assertEqual(self.tables()[self.corner.id]['table_status'], RestaurantTable.TABLE_FULL)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.corner.delete()
+        self.assertNotIn(self.corner.id, self.tables())
+
+    def test_order_changes_invalidate(self):
+        self.tables()
+        with self.captureOnCommitCallbacks(execute=True):
+            order = Order.objects.get(pk=self.order.pk)
+            order.payment_status = Order.ORDER_PENDING
+            order.save()
+        self.assertEqual(self.tables()[self.table.id]['open_orders'], 3)
+
+    def test_reservation_changes_invalidate(self):
+        self.tables()
+        with self.captureOnCommitCallbacks(execute=True):
+            reservation = TableReservation.objects.create(
+                table=self.corner, customer=self.customer,
+                date_time_from='2030-01-02T18:00Z', date_time_to='2030-01-02T20:00Z')
+        self.assertEqual(self.tables()[self.corner.id]['next_reservation']['id'], reservation.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            reservation.delete()
+        self.assertIsNone(self.tables()[self.corner.id]['next_reservation'])
+
+    def test_snapshot_taken_mid_transaction_is_dropped_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Order.objects.create(restaurant=self.restaurant, table=self.corner, customer=self.customer)
+            self.tables()
+            self.assertIsNotNone(cache.get(floor_plan_cache_key(self.restaurant.id)))
+        self.assertIsNone(cache.get(floor_plan_cache_key(self.restaurant.id)))
+
+
+class KitchenQueueTests(GastroTestCase):
+    """Batch ack / bump / rush only touch this restaurant's queued tickets."""
+
+    def setUp(self):
+        super().setUp()
+        self.orders = list(Order.objects.filter(restaurant=self.restaurant).order_by('placed_at', 'id').values_list('id', flat=True))
+        other = Restaurant.objects.create(table_grid_width=1, table_grid_height=1, restaurant_title='Other')
+        self.foreign = Order.objects.create(
+            restaurant=other, customer=self.customer,
+            table=RestaurantTable.objects.create(restaurant=other, seats=2, row=0, column=0)).id
+        self.waiter = self.client_for(self.waiter_user)
+        self.url = f'/api/restaurants/{self.restaurant.id}/kitchen-queue/'
+
+    def post(self, action, orders, **data):
+        response = self.waiter.post(f'{self.url}{action}/', {'orders': orders, **data}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['updated']
+
+    def queue(self):
+        return [ticket['id'] for ticket in self.waiter.get(self.url).json()]
+
+    def test_partial_batches_skip_bumped_and_foreign_tickets(self):
+        first, second, third = self.orders
+        self.assertEqual(self.post('bump', [first, self.foreign, 0]), [first])
+        self.assertEqual(sorted(self.post('ack', [first, second, self.foreign])), [second])
+        acknowledged_at = Order.objects.get(pk=second).acknowledged_at
+        # Acknowledging again keeps the first time.
+        self.assertEqual(self.post('ack', [second, third]), [third])
+        self.assertEqual(Order.objects.get(pk=second).acknowledged_at, acknowledged_at)
+        self.assertIsNone(Order.objects.get(pk=first).acknowledged_at)
+
+        self.assertEqual(self.post('bump', [first, second]), [second])
+        self.assertEqual(self.post('rush', [first, second]), [])
+        self.assertEqual(self.queue(), [third])
+        foreign = Order.objects.get(pk=self.foreign)
+        self.assertEqual((foreign.acknowledged_at, foreign.bumped_at, foreign.rush), (None, None, False))
+
+    def test_other_restaurants_queue_is_forbidden(self):
+        url = f'/api/restaurants/{Order.objects.get(pk=self.foreign).restaurant_id}/kitchen-queue/'
+        self.assertEqual(self.waiter.get(url).status_code, 403)
+        for action in ('ack', 'bump', 'rush'):
+            self.assertEqual(self.waiter.post(f'{url}{action}/', {'orders': [self.foreign]}, format='json').status_code, 403)
+        self.assertIsNone(Order.objects.get(pk=self.foreign).bumped_at)
+
+    def test_rush_tickets_jump_the_queue(self):
+        first, second, third = self.orders
+        self.assertEqual(self.queue(), [first, second, third])
+        self.assertEqual(self.post('rush', [third]), [third])
+        self.assertEqual(self.queue(), [third, first, second])
+        self.assertEqual(sorted(self.post('rush', [second, third], rush=False)), [second, third])
+        self.assertEqual(self.queue(), [first, second, third])
+
+    def test_invalid_batches(self):
+        for data in ({'orders': []}, {'orders': ['x']}, {'orders': list(range(501))}, {}):
+            self.assertEqual(self.waiter.post(f'{self.url}bump/', data, format='json').status_code, 400)
+
+
+class KeysetPaginationTests(GastroTestCase):
+    def setUp(self):
+        super().setUp()
+        Product.objects.bulk_create(
+            Product(title=f'Side {i}', slug=f'side-{i}', unit_price=Decimal('3.00') if i % 2 else Decimal('5.00'),
+                    collection=self.collection, restaurant=self.restaurant)
+            for i in range(10))
+        self.client = self.client_for(self.owner_user)
+        self.by_price = list(Product.objects.order_by('unit_price', 'pk').values_list('pk', flat=True))
+
+    def ids(self, page):
+        return [product['id'] for product in page['results']]
+
+    def test_next_and_previous_across_tied_keys(self):
+        pages = [self.client.get('/api/products/?ordering=unit_price&page_size=4').json()]
+        while pages[-1]['next']:
+            pages.append(self.client.get(pages[-1]['next']).json())
+        self.assertEqual([len(page['results']) for page in pages], [4, 4, 4, 1])
+        self.assertEqual(sum((self.ids(page) for page in pages), []), self.by_price)
+        self.assertIsNone(pages[0]['previous'])
+
+        page = pages[-1]
+        for expected in reversed(pages[:-1]):
+            page = self.client.get(page['previous']).json()
+            self.assertEqual(self.ids(page), self.ids(expected))
+        self.assertIsNotNone(page['next'])
+
+    def test_page_size_is_capped(self):
+        with mock.patch.object(KeysetPagination, 'max_page_size', 5):
+            self.assertEqual(len(self.client.get('/api/products/?page_size=100').json()['results']), 5)
+        self.assertEqual(len(self.client.get('/api/products/?page_size=0').json()['results']), 10)
+        self.assertEqual(len(self.client.get('/api/products/?page_size=many').json()['results']), 10)
+
+    def test_count_only_on_request(self):
+        self.assertNotIn('count', self.client.get('/api/products/').json())
+        self.assertEqual(self.client.get('/api/products/?include_count=1').json()['count'], 13)
+        Product.objects.create(title='Dessert', slug='dessert', unit_price=Decimal('4.00'),
+                               collection=self.collection, restaurant=self.restaurant)
+        # Cached for count_cache_timeout.
+        self.assertEqual(self.client.get('/api/products/?include_count=true').json()['count'], 13)
+
+    def test_malformed_or_tampered_cursor(self):
+        next_link = self.client.get('/api/products/?ordering=unit_price&page_size=4').json()['next']
+        cursor = parse_qs(urlsplit(next_link).query)['cursor'][0]
+        payload = json.loads(base64.urlsafe_b64decode(cursor))
+        tampered = [
+            'not-a-cursor',
+            base64.urlsafe_b64encode(b'[]').decode(),
+            base64.urlsafe_b64encode(json.dumps({**payload, 'o': ['pk']}).encode()).decode(),
+            base64.urlsafe_b64encode(json.dumps({**payload, 'v': payload['v'][:1]}).encode()).decode(),
+        ]
+        for cursor in tampered:
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.client.get(f'/api/products/?ordering=unit_price&cursor={cursor}').status_code, 404)
+        # A valid cursor does not carry over to another ordering.
+        self.assertEqual(self.client.get(next_link.replace('ordering=unit_price', 'ordering=-last_update')).status_code, 404)
+
+
+def fts5_available():
+    try:
+        sqlite3.connect(':memory:').execute('CREATE VIRTUAL TABLE probe USING fts5(body)')
+    except sqlite3.OperationalError:
+        return False
+    return True
+
+
+@skipUnless(connection.vendor == 'sqlite' and fts5_available(), 'Needs SQLite with FTS5.')
+class ProductSearchTests(GastroTestCase):
+    def setUp(self):
+        super().setUp()
+        self.bread = self.product('Garlic bread', 'Baked daily.')
+        self.pasta = self.product('Pasta aglio', 'Spaghetti with garlic and chili.')
+        other = Restaurant.objects.create(table_grid_width=1, table_grid_height=1, restaurant_title='Other')
+        self.foreign = Product.objects.create(
+            title='Garlic prawns', slug='garlic-prawns', unit_price=Decimal('9.00'),
+            collection=Collection.objects.create(title='Sea', restaurant=other), restaurant=other)
+        self.client = self.client_for(self.owner_user)
+
+    def product(self, title, description=''):
+        return Product.objects.create(title=title, slug=title.lower().replace(' ', '-'), description=description,
+                                      unit_price=Decimal('6.00'), collection=self.collection, restaurant=self.restaurant)
+
+    def search(self, term, **params):
+        response = self.client.get('/api/products/', {'search': term, **params})
+        self.assertEqual(response.status_code, 200)
+        return [product['id'] for product in response.json()['results']]
+
+    def test_title_matches_rank_first(self):
+        self.assertEqual(self.search('garlic'), [self.bread.id, self.pasta.id])
+
+    def test_prefix_matching(self):
+        self.assertEqual(self.search('garl'), [self.bread.id, self.pasta.id])
+        self.assertEqual(self.search('spag chil'), [self.pasta.id])
+        # Operators in the input are plain words, not FTS syntax.
+        self.assertEqual(self.search('garlic OR prawns'), [])
+
+    def test_results_are_limited_to_the_restaurant(self):
+        self.assertNotIn(self.foreign.id, self.search('prawns garlic'))
+        self.assertEqual(self.search('garlic', restaurant=self.foreign.restaurant_id), [self.foreign.id])
+
+    def test_index_follows_product_changes(self):
+        soup = self.product('Onion soup')
+        self.assertEqual(self.search('onion'), [soup.id])
+
+        soup.title = 'Tomato soup'
+        soup.save()
+        self.assertEqual(self.search('onion'), [])
+        self.assertEqual(self.search('tomato'), [soup.id])
+
+        soup.delete()
+        self.assertEqual(self.search('soup'), [])
+
+
+class ReplicaRoutingTests(GastroTestCase):
+    """
+    A copy of the test database made before any test data, registered as the
+    'replica' alias, stands in for a replica that has not caught up yet.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        # Before TestCase opens its transaction, which the backup would wait on.
+        handle, cls.replica_path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(handle)
+        primary = connections['default']
+        primary.ensure_connection()
+        target = sqlite3.connect(cls.replica_path)
+        primary.connection.backup(target)
+        target.close()
+        connections['replica'] = type(primary)({**primary.settings_dict, 'NAME': cls.replica_path}, 'replica')
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['replica'].close()
+        del connections['replica']
+        os.remove(cls.replica_path)
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch('gastro.replicas.READ_REPLICAS', ['replica'])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = self.client_for(self.owner_user)
+
+    def product_ids(self, **headers):
+        with CaptureQueriesContext(connections['replica']) as replica_queries:
+            response = self.client.get('/api/products/', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        return {product['id'] for product in response.json()['results']}, len(replica_queries)
+
+    def test_safe_reads_go_to_the_replica(self):
+        ids, replica_queries = self.product_ids()
+        self.assertEqual(ids, set())
+        self.assertGreater(replica_queries, 0)
+        self.assertIsNone(replicas.read_alias())
+
+    def test_writes_go_to_the_primary_and_pin_the_client(self):
+        with CaptureQueriesContext(connections['replica']) as replica_queries:
+            response = self.client.post('/api/products/', {
+                'title': 'Soup', 'slug': 'soup', 'unit_price': '4.00', 'collection': self.collection.id})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(replica_queries), 0)
+
+        self.assertIn(replicas.PIN_COOKIE, response.cookies)
+        ids, replica_queries = self.product_ids()
+        self.assertIn(response.json()['id'], ids)
+        self.assertEqual(replica_queries, 0)
+
+    def test_header_reads_from_the_primary(self):
+        ids, replica_queries = self.product_ids(**{'X-Read-Primary': '1'})
+        self.assertEqual(ids, {product.id for product in self.products})
+        self.assertEqual(replica_queries, 0)
+
+    def test_reads_inside_atomic_go_to_the_primary(self):
+        with replicas.use_replica('replica'):
+            self.assertEqual(router.db_for_read(Product), 'replica')
+            with transaction.atomic():
+                self.assertEqual(router.db_for_read(Product), 'default')
+                self.assertTrue(Product.objects.exists())
+            self.assertFalse(Product.objects.exists())
+        self.assertIsNone(replicas.read_alias())
+
+
+class CheckoutTests(GastroTestCase):
+    def setUp(self):
+        super().setUp()
+        self.customer_client = self.client_for(self.customer_user)
+        other_restaurant = Restaurant.objects.create(table_grid_width=1, table_grid_height=1, restaurant_title='Grill')
+        self.other_table = RestaurantTable.objects.create(restaurant=other_restaurant, seats=2, row=0, column=0)
+        self.foreign_product = Product.objects.create(
+            title='Steak', slug='steak', unit_price=Decimal('20.00'),
+            collection=Collection.objects.create(title='Grill', restaurant=other_restaurant), restaurant=other_restaurant)
+
+    def cart_with(self, *products):
+        cart = self.customer_client.post('/api/carts/').json()['id']
+        if products:
+            self.customer_client.post(f'/api/carts/{cart}/items/bulk/', {
+                'items': [{'product_id': product.id, 'quantity': 2} for product in products]}, format='json')
+        return cart
+
+    def checkout(self, cart, table=None):
+        table = table or self.table
+        return self.customer_client.post('/api/orders/', {
+            'restaurant_id': table.restaurant_id, 'table_id': table.id, 'cart_id': cart})
+
+    def test_order_from_the_cart(self):
+        cart = self.cart_with(*self.products[:2])
+        response = self.checkout(cart)
+        self.assertEqual(response.status_code, 200)
+        order = response.json()
+        self.assertEqual((order['subtotal'], order['item_count']), (20.0, 4))
+        self.assertEqual(sorted(item['product']['id'] for item in order['items']), [p.id for p in self.products[:2]])
+        self.assertEqual(self.customer_client.get(f'/api/carts/{cart}/').status_code, 404)
+        self.assertEqual(self.checkout(cart).status_code, 400)
+
+    def test_cross_restaurant_products_are_rejected(self):
+        cart = self.cart_with(self.products[0], self.foreign_product)
+        orders = Order.objects.count()
+        response = self.checkout(cart)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('restaurant', str(response.json()))
+        self.assertEqual(Order.objects.count(), orders)
+        self.assertEqual(len(self.customer_client.get(f'/api/carts/{cart}/items/').json()), 2)
+
+    def test_table_of_another_restaurant_is_rejected(self):
+        response = self.customer_client.post('/api/orders/', {
+            'restaurant_id': self.restaurant.id, 'table_id': self.other_table.id, 'cart_id': self.cart_with(self.products[0])})
+        self.assertEqual(response.status_code, 400)
+
+    def test_missing_or_empty_cart(self):
+        self.assertEqual(self.checkout('00000000-0000-0000-0000-000000000000').status_code, 400)
+        self.assertEqual(self.checkout(self.cart_with()).status_code, 400)
+
+    def test_items_added_after_validation_are_ordered(self):
+        validate = CreateOrderSerializer.validate
+        for store in (DatabaseCartStore(), CacheCartStore()):
+            with self.subTest(store=type(store).__name__), mock.patch('gastro.carts._store', store):
+                cart = self.cart_with(self.products[0])
+
+                def validate_then_add(serializer, attrs):
+                    attrs = validate(serializer, attrs)
+                    store.add_items(cart, {self.products[1].id: 1})
+                    return attrs
+                with mock.patch.object(CreateOrderSerializer, 'validate', validate_then_add):
+                    response = self.checkout(cart)
+                self.assertEqual(response.status_code, 200)
+                order = response.json()
+                self.assertEqual((order['subtotal'], order['item_count']), (15.0, 3))
+                self.assertEqual(sorted(item['product']['id'] for item in order['items']), [p.id for p in self.products[:2]])
+
+    def test_query_count_does_not_grow_with_the_cart(self):
+        counts = []
+        for products in (self.products[:1], self.products):
+            cart = self.cart_with(*products)
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.checkout(cart).status_code, 200)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+class TotalsTests(GastroTestCase):
+    def test_backfill_order_totals(self):
+        # The setUp orders were created without their totals.
+        empty = Order.objects.create(restaurant=self.restaurant, table=self.table, customer=self.customer,
+                                     subtotal=Decimal('9.99'), item_count=9)
+        out = StringIO()
+        call_command('backfill_order_totals', batch_size=2, stdout=out)
+        self.assertIn('Updated totals of 4 orders.', out.getvalue())
+        self.assertEqual(set(Order.objects.exclude(pk=empty.pk).values_list('subtotal', 'item_count')), {(Decimal('15.00'), 3)})
+        empty.refresh_from_db()
+        self.assertEqual((empty.subtotal, empty.item_count), (Decimal('0'), 0))
+
+    def test_cart_total_is_computed_by_the_database(self):
+        customer = self.client_for(self.customer_user)
+        cart = customer.post('/api/carts/').json()['id']
+        customer.post(f'/api/carts/{cart}/items/bulk/', {'items': [
+            {'product_id': self.products[0].id, 'quantity': 2}, {'product_id': self.products[1].id, 'quantity': 3}]},
+            format='json')
+        response = customer.get(f'/api/carts/{cart}/').json()
+        self.assertEqual(Decimal(str(response['total_price'])), Decimal('25.00'))
+        self.assertEqual(sorted(item['total_price'] for item in response['items']), [10.0, 15.0])
+
+
+class MenuImportExportTests(GastroTestCase):
+    def setUp(self):
+        super().setUp()
+        self.grill = Restaurant.objects.create(table_grid_width=1, table_grid_height=1, restaurant_title='Grill')
+        self.grill_owner = User.objects.create(username='grill-owner', email='grill-owner@example.com')
+        Owner.objects.create(user=self.grill_owner, restaurant=self.grill)
+        self.products[1].description = 'With "quotes", commas\nand lines'
+        self.products[1].save()
+
+    def export(self, restaurant, file_format='csv'):
+        response = self.client_for(self.owner_user).get(
+            '/api/products/export/', {'restaurant': restaurant.id, 'file_format': file_format})
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_round_trip(self):
+        exported = self.export(self.restaurant)
+        response = self.client_for(self.grill_owner).post(
+            '/api/products/import/', {'file': SimpleUploadedFile('menu.csv', exported.encode())}, format='multipart')
+        self.assertEqual(response.json(), {'created': 3, 'updated': 0, 'collections_created': 1})
+        self.assertEqual(self.export(self.grill), exported)
+
+    def test_json_round_trip_through_the_command(self):
+        exported = self.export(self.restaurant, 'json')
+        self.assertEqual(len(json.loads(exported)), 3)
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+            f.write(exported)
+        self.addCleanup(os.unlink, f.name)
+        call_command('import_menu', self.grill.id, f.name, stdout=StringIO())
+        self.assertEqual(self.export(self.grill, 'json'), exported)
+
+    def test_reimport_updates_by_slug(self):
+        rows = json.loads(self.export(self.restaurant, 'json'))
+        rows[0]['unit_price'] = '7.50'
+        rows.append({'collection': 'Drinks', 'title': 'Tea', 'slug': 'tea', 'unit_price': '2.00'})
+        response = self.client_for(self.owner_user).post('/api/products/import/', {'products': rows}, format='json')
+        self.assertEqual(response.json(), {'created': 1, 'updated': 3, 'collections_created': 1})
+        self.assertEqual(Product.objects.get(restaurant=self.restaurant, slug=rows[0]['slug']).unit_price, Decimal('7.50'))
+        self.assertEqual(Product.objects.filter(restaurant=self.restaurant).count(), 4)
+
+    def test_invalid_import_writes_nothing(self):
+        rows = [{'collection': 'Drinks', 'title': 'Tea', 'slug': 'tea', 'unit_price': '2.00'},
+                {'collection': 'Drinks', 'title': 'Green tea', 'slug': 'tea', 'unit_price': '2.50'}]
+        response = self.client_for(self.grill_owner).post('/api/products/import/', rows, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Product.objects.filter(restaurant=self.grill).exists())
+        self.assertFalse(Collection.objects.filter(restaurant=self.grill).exists())
+
+
+class OrderExportTests(GastroTestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = f'/api/restaurants/{self.restaurant.id}/orders/export/'
+        self.today = timezone.localdate().isoformat()
+
+    def export(self, user=None, **params):
+        return self.client_for(user or self.owner_user).get(
+            self.url, {'date_from': self.today, 'date_to': self.today, **params})
+
+    def test_csv_has_one_row_per_order_item(self):
+        response = self.export()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        rows = list(csv.DictReader(StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(len(rows), 9)
+        self.assertEqual(rows[-1]['order'], str(self.order.id))
+        self.assertEqual((rows[-1]['table'], rows[-1]['customer'], rows[-1]['payment_status']),
+                         (str(self.table.id), str(self.customer.id), Order.ORDER_PENDING))
+        self.assertEqual(Decimal(rows[-1]['line_total']), Decimal('5.00'))
+
+    def test_ndjson_and_the_date_range(self):
+        lines = b''.join(self.export(file_format='ndjson').streaming_content).decode().splitlines()
+        self.assertEqual({json.loads(line)['order'] for line in lines}, set(
+            Order.objects.filter(restaurant=self.restaurant).values_list('id', flat=True)))
+        yesterday = (timezone.localdate() - timedelta(days=1)).isoformat()
+        response = self.export(file_format='ndjson', date_from=yesterday, date_to=yesterday)
+        self.assertEqual(b''.join(response.streaming_content), b'')
+
+    def test_rows_are_read_while_streaming(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.export()
+        self.assertFalse(any('gastro_orderitem' in query['sql'] for query in queries))
+        with mock.patch('gastro.order_export.CHUNK_SIZE', 2):
+            self.assertEqual(len(list(response.streaming_content)), 10)
+
+    def test_only_the_restaurants_owner_may_export(self):
+        self.assertEqual(self.export(self.waiter_user).status_code, 403)
+        other = User.objects.create(username='grill-owner', email='grill-owner@example.com')
+        Owner.objects.create(user=other, restaurant=Restaurant.objects.create(
+            table_grid_width=1, table_grid_height=1, restaurant_title='Grill'))
+        self.assertEqual(self.export(other).status_code, 403)
+
+
+class OrderScopingTests(GastroTestCase):
+    """Any authenticated user may list and retrieve orders; get_queryset decides which."""
+
+    def setUp(self):
+        super().setUp()
+        self.other_restaurant = Restaurant.objects.create(table_grid_width=2, table_grid_height=2, restaurant_title='Grill')
+        other_table = RestaurantTable.objects.create(restaurant=self.other_restaurant, seats=2, row=0, column=0)
+        self.other_owner_user = User.objects.create(username='grill-owner', email='grill-owner@example.com')
+        Owner.objects.create(user=self.other_owner_user, restaurant=self.other_restaurant)
+        self.other_customer_user = User.objects.create(username='guest', email='guest@example.com')
+        other_customer = Customer.objects.create(user=self.other_customer_user, phone='2')
+        self.elsewhere = Order.objects.create(restaurant=self.other_restaurant, table=other_table, customer=self.customer)
+        self.guest_order = Order.objects.create(restaurant=self.restaurant, table=self.table, customer=other_customer)
+        self.bistro_orders = set(Order.objects.filter(restaurant=self.restaurant).values_list('id', flat=True))
+        self.customer_orders = set(Order.objects.filter(customer=self.customer).values_list('id', flat=True))
+
+    def order_ids(self, user):
+        return {order['id'] for order in self.client_for(user).get('/api/orders/?page_size=100').json()['results']}
+
+    def test_staff_see_their_restaurants_orders(self):
+        self.assertEqual(self.order_ids(self.owner_user), self.bistro_orders)
+        self.assertEqual(self.order_ids(self.waiter_user), self.bistro_orders)
+        self.assertEqual(self.order_ids(self.other_owner_user), {self.elsewhere.id})
+
+    def test_customers_see_their_own_orders(self):
+        self.assertEqual(self.order_ids(self.customer_user), self.customer_orders)
+        self.assertIn(self.elsewhere.id, self.customer_orders)
+        self.assertEqual(self.order_ids(self.other_customer_user), {self.guest_order.id})
+
+    def test_users_without_a_role_see_none(self):
+        nobody = User.objects.create(username='nobody', email='nobody@example.com')
+        for user in (nobody, self.admin_user):
+            self.assertEqual(self.order_ids(user), set())
+            self.assertEqual(self.client_for(user).get(f'/api/orders/{self.order.id}/').status_code, 404)
+        self.assertEqual(APIClient().get('/api/orders/').status_code, 401)
+        self.assertEqual(APIClient().get(f'/api/orders/{self.order.id}/').status_code, 401)
+
+    def test_retrieve_is_scoped(self):
+        self.assertEqual(self.client_for(self.owner_user).get(f'/api/orders/{self.guest_order.id}/').status_code, 200)
+        self.assertEqual(self.client_for(self.owner_user).get(f'/api/orders/{self.elsewhere.id}/').status_code, 404)
+        self.assertEqual(self.client_for(self.other_customer_user).get(f'/api/orders/{self.order.id}/').status_code, 404)
+        self.assertEqual(self.client_for(self.customer_user).get(f'/api/orders/{self.elsewhere.id}/').status_code, 200)
+
+    def test_staff_cannot_place_orders(self):
+        response = self.client_for(self.owner_user).post('/api/orders/', {
+            'restaurant_id': self.restaurant.id, 'table_id': self.table.id, 'cart_id': '00000000-0000-0000-0000-000000000000'})
+        self.assertEqual(response.status_code, 403)
+
+
+class CustomerOrdersConditionalTests(GastroTestCase):
+    """/api/orders/me/ sends the same validators from the sync view and the async one."""
+
+    def test_sync(self):
+        customer = self.client_for(self.customer_user)
+        etag = customer.get('/api/orders/me/')['ETag']
+        self.assertEqual(customer.get('/api/orders/me/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        Order.objects.filter(pk=self.order.pk).update(last_update=timezone.now() + timedelta(seconds=1))
+        self.assertEqual(customer.get('/api/orders/me/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_async_matches_sync(self):
+        etag = self.client_for(self.customer_user).get('/api/orders/me/')['ETag']
+        authorization = f'JWT {RoleAccessToken.for_user(self.customer_user)}'
+        get = async_to_sync(AsyncClient().get)
+        with override_settings(ROOT_URLCONF='gastroApi.asgi_urls'), \
+                mock.patch('gastro.async_views.delegate', side_effect=AssertionError('handed to the sync view')):
+            response = get('/api/orders/me/', headers={'Authorization': authorization})
+            self.assertEqual(response['ETag'], etag)
+            not_modified = get('/api/orders/me/', headers={'Authorization': authorization, 'If-None-Match': etag})
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], etag)
+
+        Product.objects.filter(pk=self.products[0].pk).update(title='Soup', last_update=timezone.now() + timedelta(seconds=1))
+        with override_settings(ROOT_URLCONF='gastroApi.asgi_urls'):
+            modified = get('/api/orders/me/', headers={'Authorization': authorization, 'If-None-Match': etag})
+        self.assertEqual(modified.status_code, 200)
+        self.assertEqual(modified['ETag'], self.client_for(self.customer_user).get('/api/orders/me/')['ETag'])
+
+
+class CartExpiryTests(GastroTestCase):
+    """Carts expire once idle for the TTL, however long ago they were created."""
+
+    def age(self, cart_id, seconds, field='last_activity'):
+        Cart.objects.filter(pk=cart_id).update(**{field: timezone.now() - timedelta(seconds=seconds)})
+
+    def later(self, seconds):
+        # The cache backends read expiry times from time.time().
+        return mock.patch('time.time', return_value=time.time() + seconds)
+
+    def test_database_store_counts_from_the_last_change(self):
+        store = DatabaseCartStore(ttl=60)
+        cart = store.create_cart()
+        self.age(cart.id, 3600, 'created_at')
+        self.age(cart.id, 50)
+        self.assertEqual(len(store.add_items(cart.id, {self.products[0].id: 2})), 1)
+        self.assertLess(timezone.now() - Cart.objects.get(pk=cart.id).last_activity, timedelta(seconds=10))
+        self.assertEqual(store.purge_expired(), 0)
+
+        item = store.get_items(cart.id)[0]
+        self.age(cart.id, 50)
+        self.assertEqual(store.update_item(cart.id, item.id, 3).quantity, 3)
+        self.age(cart.id, 50)
+        self.assertTrue(store.remove_item(cart.id, item.id))
+        self.assertEqual(store.get_items(cart.id), [])
+
+    def test_database_store_expires_idle_carts(self):
+        store = DatabaseCartStore(ttl=60)
+        cart = store.create_cart()
+        store.add_items(cart.id, {self.products[0].id: 1})
+        item = store.get_items(cart.id)[0]
+        self.age(cart.id, 61)
+        self.assertIsNone(store.get_cart(cart.id))
+        self.assertIsNone(store.get_items(cart.id))
+        self.assertIsNone(store.add_items(cart.id, {self.products[1].id: 1}))
+        self.assertIsNone(store.update_item(cart.id, item.id, 2))
+        self.assertFalse(store.remove_item(cart.id, item.id))
+        self.assertEqual(store.purge_expired(), 1)
+        self.assertFalse(Cart.objects.filter(pk=cart.id).exists())
+        self.assertFalse(CartItem.objects.filter(pk=item.id).exists())
+
+    def test_cache_store_counts_from_the_last_change(self):
+        store = CacheCartStore(ttl=60)
+        cart = store.create_cart()
+        with self.later(50):
+            store.add_items(cart.id, {self.products[0].id: 1})
+        with self.later(100):
+            self.assertEqual(len(store.get_items(cart.id)), 1)
+            store.update_item(cart.id, self.products[0].id, 2)
+        with self.later(150):
+            self.assertEqual(store.get_items(cart.id)[0].quantity, 2)
+        with self.later(161):
+            self.assertIsNone(store.get_items(cart.id))
+            self.assertIsNone(store.add_items(cart.id, {self.products[0].id: 1}))
+
+
+class CartConcurrencyTests(TransactionTestCase):
+    """Concurrent adds to one cart, from threads with connections of their own."""
+    threads = 8
+    adds = 5
+
+    def setUp(self):
+        cache.clear()
+        restaurant = Restaurant.objects.create(table_grid_width=1, table_grid_height=1, restaurant_title='Bistro')
+        collection = Collection.objects.create(title='Food', restaurant=restaurant)
+        self.product = Product.objects.create(title='Dish', slug='dish', unit_price=Decimal('5.00'),
+                                              collection=collection, restaurant=restaurant)
+
+    def add_concurrently(self, store, cart_id):
+        barrier = threading.Barrier(self.threads)
+        errors = []
+
+        def add():
+            try:
+                barrier.wait()
+                for _ in range(self.adds):
+                    store.add_items(cart_id, {self.product.id: 1})
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=add) for _ in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(store.get_items(cart_id)[0].quantity, self.threads * self.adds)
+
+    @skipIf(connection.vendor == 'sqlite', "SQLite's in-memory test database locks tables against concurrent writers")
+    def test_database_store(self):
+        store = DatabaseCartStore()
+        self.add_concurrently(store, store.create_cart().id)
+
+    def test_database_store_interleaved(self):
+        # Another add lands between this add's cart check and its insert.
+        store = DatabaseCartStore()
+        cart = store.create_cart()
+        touch = carts.touch_cart
+
+        def touch_then_add(*args, **kwargs):
+            touched = touch(*args, **kwargs)
+            with mock.patch('gastro.carts.touch_cart', touch):
+                store.add_items(cart.id, {self.product.id: 1})
+            return touched
+        with mock.patch('gastro.carts.touch_cart', touch_then_add):
+            store.add_items(cart.id, {self.product.id: 1})
+        self.assertEqual(store.get_items(cart.id)[0].quantity, 2)
+
+    def test_cache_store(self):
+        store = CacheCartStore()
+        cart = store.create_cart()
+        save = CacheCartStore.store
+
+        def slow_store(cart_store, cart_id, data):
+            time.sleep(0.002)  # a cache round trip between the read and the write
+            save(cart_store, cart_id, data)
+        with mock.patch.object(CacheCartStore, 'store', slow_store):
+            self.add_concurrently(store, cart.id)
+
+    def test_cache_store_checkout_holds_the_cart_until_commit(self):
+        store = CacheCartStore()
+        cart = store.create_cart()
+        with mock.patch.object(CacheCartStore, 'lock_wait', 0):
+            with transaction.atomic():
+                with store.checkout(cart.id) as claimed:
+                    self.assertEqual(claimed, [])
+                with self.assertRaises(CartBusy):
+                    store.add_items(cart.id, {self.product.id: 1})
+                with self.assertRaises(CartBusy):
+                    with store.checkout(cart.id):
+                        pass
+            self.assertIsNone(store.get_items(cart.id))
+
+            cart = store.create_cart()
+            with self.assertRaises(ValueError), transaction.atomic():
+                with store.checkout(cart.id):
+                    raise ValueError
+            self.assertEqual(store.get_items(cart.id), [])
+            self.assertEqual(len(store.add_items(cart.id, {self.product.id: 1})), 1)
+
+
+class SalesRollupTests(GastroTestCase):
+    """The incrementally maintained rollups always equal a rebuild_rollups from the orders."""
+
+    def setUp(self):
+        super().setUp()
+        rebuild_rollups()
+
+    def rollups(self):
+        # Rows an order's removal left at zero are as good as absent.
+        return {model.__name__: sorted(
+            row for row in model.objects.values_list(*[f.attname for f in model._meta.fields if f.name != 'id'])
+            if any(row[-3:])) for model in (DailyRestaurantSales, DailyTableSales, DailyProductSales)}
+
+    def assertMatchesRebuild(self):
+        incremental = self.rollups()
+        rebuild_rollups()
+        self.assertEqual(incremental, self.rollups())
+
+    def checkout(self):
+        customer = self.client_for(self.customer_user)
+        cart = customer.post('/api/carts/').json()['id']
+        customer.post(f'/api/carts/{cart}/items/bulk/', {'items': [
+            {'product_id': self.products[0].id, 'quantity': 2}, {'product_id': self.products[1].id, 'quantity': 1}]},
+            format='json')
+        response = customer.post('/api/orders/', {
+            'restaurant_id': self.restaurant.id, 'table_id': self.table.id, 'cart_id': cart})
+        self.assertEqual(response.status_code, 200)
+        return Order.objects.get(pk=response.json()['id'])
+
+    def test_create(self):
+        self.checkout()
+        self.assertEqual(DailyRestaurantSales.objects.get().orders, 4)
+        self.assertMatchesRebuild()
+
+    def test_payment_status_changes(self):
+        order = self.checkout()
+        for payment_status in (Order.ORDER_COMPLETE, Order.ORDER_FAILED, Order.ORDER_PENDING):
+            order.payment_status = payment_status
+            order.save()
+            self.assertMatchesRebuild()
+
+    def test_delete(self):
+        order = self.checkout()
+        order.payment_status = Order.ORDER_COMPLETE
+        order.save()
+        order.items.all().delete()
+        self.assertMatchesRebuild()
+        order.delete()
+        self.assertMatchesRebuild()
+
+    def test_status_change_rolls_back_with_its_rollup(self):
+        order = self.checkout()
+        before = self.rollups()
+        order.payment_status = Order.ORDER_COMPLETE
+        with mock.patch('gastro.rollups.increment_rows', side_effect=DatabaseError), self.assertRaises(DatabaseError):
+            order.save()
+        self.assertEqual(Order.objects.get(pk=order.pk).payment_status, Order.ORDER_PENDING)
+        self.assertEqual(self.rollups(), before)
+
+
+class ReadSerializerParityTests(GastroTestCase):
+    """The values()-based list endpoints answer exactly what the serializers would."""
+
+    def setUp(self):
+        super().setUp()
+        for i, price in enumerate(['1.00', '12.34', '999.99', '7.10']):
+            Product.objects.create(title=f'Extra {i}', slug=f'extra-{i}', unit_price=Decimal(price),
+                                   description='Spicy' if i % 2 else None,
+                                   collection=self.collection, restaurant=self.restaurant)
+        RestaurantTable.objects.create(restaurant=self.restaurant, seats=2, row=1, column=2,
+                                       table_status=RestaurantTable.TABLE_FULL)
+        Order.objects.create(restaurant=self.restaurant, table=self.table, customer=self.customer)
+
+    def assertListMatches(self, client, path, expected):
+        results, url = [], path
+        while url:
+            data = client.get(url).json()
+            if isinstance(data, list):
+                results, url = data, None
+            else:
+                results += data['results']
+                url = data['next']
+        self.assertEqual(JSONRenderer().render(results), JSONRenderer().render(expected))
+
+    def test_products(self):
+        client = self.client_for(self.customer_user)
+        products = Product.objects.filter(restaurant=self.restaurant)
+        self.assertListMatches(client, f'/api/products/?restaurant={self.restaurant.id}&page_size=3',
+                               ProductSerializer(products.order_by('title', 'pk'), many=True).data)
+        self.assertListMatches(client, f'/api/products/?restaurant={self.restaurant.id}&ordering=-unit_price&page_size=2',
+                               ProductSerializer(products.order_by('-unit_price', '-pk'), many=True).data)
+
+    def test_orders(self):
+        orders = Order.objects.filter(customer=self.customer).prefetch_related('items__product').order_by('-placed_at', '-pk')
+        expected = OrderSerializer(orders, many=True).data
+        self.assertListMatches(self.client_for(self.customer_user), '/api/orders/me/?page_size=2', expected)
+        self.assertListMatches(self.client_for(self.owner_user), '/api/orders/?page_size=3', expected)
+
+    def test_menu_and_product_endpoints_agree_on_prices(self):
+        client = self.client_for(self.customer_user)
+        menu = client.get(f'/api/restaurants/{self.restaurant.id}/menu/').json()
+        menu_prices = {product['id']: product['price_with_tax']
+                       for collection in menu['collections'] for product in collection['products']}
+        products = client.get(f'/api/products/?restaurant={self.restaurant.id}&page_size=100').json()['results']
+        self.assertEqual({product['id']: product['price_with_tax'] for product in products}, menu_prices)
+        extra = Product.objects.get(slug='extra-1')
+        detail = client.get(f'/api/products/{extra.id}/?restaurant={self.restaurant.id}').json()
+        self.assertEqual(detail['price_with_tax'], 13.57)
+        self.assertEqual(menu_prices[extra.id], 13.57)
+
+    def test_tables(self):
+        self.assertListMatches(self.client_for(self.owner_user), '/api/tables/',
+                               RestaurantTableSerializer(RestaurantTable.objects.filter(restaurant=self.restaurant), many=True).data)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class RoleClaimsAuthenticationTests(GastroTestCase):
+    def login(self, user):
+        user.set_password('correct-horse-1')
+        user.save()
+        response = APIClient().post('/auth/jwt/create/', {'username': user.username, 'password': 'correct-horse-1'})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def client_with(self, access):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'JWT {access}')
+        return client
+
+    def change_roles(self, change):
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+
+    def assertRevoked(self, response):
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()['code'], 'token_revoked')
+
+    def test_issued_tokens_carry_role_claims(self):
+        claims = UntypedToken(self.login(self.owner_user)['access']).payload
+        self.assertEqual(claims['roles'], ['owner'])
+        self.assertEqual(claims['restaurant_id'], self.restaurant.id)
+        self.assertIs(claims['is_staff'], False)
+
+    def test_gastro_views_authenticate_without_queries(self):
+        client = self.client_with(self.login(self.owner_user)['access'])
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(client.get('/api/tables/').status_code, 200)
+        tables = {'core_user', 'gastro_owner', 'gastro_waiter', 'gastro_customer'}
+        self.assertFalse([query['sql'] for query in queries
+                          if any(f'"{table}"' in query['sql'] for table in tables)])
+
+    def test_non_gastro_views_load_the_user(self):
+        client = self.client_with(self.login(self.customer_user)['access'])
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get('/auth/users/me/')
+        self.assertEqual(response.json()['email'], 'customer@example.com')
+        self.assertTrue(any('"core_user"' in query['sql'] for query in queries))
+        response = client.patch('/auth/users/me/', {'first_name': 'Ada'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(User.objects.get(pk=self.customer_user.pk).first_name, 'Ada')
+
+    def test_role_change_revokes_tokens_until_refresh(self):
+        tokens = self.login(self.owner_user)
+        client = self.client_with(tokens['access'])
+        self.change_roles(lambda: Customer.objects.create(user=self.owner_user, phone='2'))
+        self.assertRevoked(client.get('/api/tables/'))
+
+        response = APIClient().post('/auth/jwt/refresh/', {'refresh': tokens['refresh']})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(UntypedToken(response.data['access'])['roles'], ['owner', 'customer'])
+        client = self.client_with(response.data['access'])
+        self.assertEqual(client.get('/api/tables/').status_code, 200)
+        self.assertEqual(client.get('/api/orders/me/').status_code, 200)
+
+    def test_staff_flag_change_revokes_tokens(self):
+        client = self.client_with(self.login(self.waiter_user)['access'])
+
+        def promote():
+            self.waiter_user.is_staff = True
+            self.waiter_user.save()
+        self.change_roles(promote)
+        self.assertRevoked(client.get('/api/tables/'))
+
+    def test_deactivation_revokes_tokens_and_refresh(self):
+        tokens = self.login(self.owner_user)
+
+        def deactivate():
+            self.owner_user.is_active = False
+            self.owner_user.save()
+        self.change_roles(deactivate)
+        self.assertRevoked(self.client_with(tokens['access']).get('/api/tables/'))
+        self.assertEqual(APIClient().post('/auth/jwt/refresh/', {'refresh': tokens['refresh']}).status_code, 401)
+
+    def test_login_and_unrelated_changes_keep_tokens_valid(self):
+        access = self.login(self.customer_user)['access']
+        self.change_roles(lambda: self.login(self.customer_user))
+        self.change_roles(lambda: Customer.objects.filter(pk=self.customer.pk).update(phone='3'))
+        self.change_roles(lambda: self.owner_user.save())
+        self.assertEqual(self.client_with(access).get('/api/orders/me/').status_code, 200)
+
+    def test_tokens_without_role_claims_load_the_user(self):
+        client = self.client_with(AccessToken.for_user(self.waiter_user))
+        # The user and role lookups the budgets no longer leave room for.
+        with CaptureQueriesContext(connection) as queries, self.assertLogs('gastro.queries', 'WARNING'):
+            self.assertEqual(client.get('/api/tables/').status_code, 200)
+        self.assertTrue(any('"core_user"' in query['sql'] for query in queries))
+
+    def test_deploy_check_rejects_per_process_cache(self):
+        self.assertEqual([error.id for error in check_revocation_cache(None)], ['gastro.E001'])
+        redis = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://cache:6379'}}
+        with override_settings(CACHES=redis):
+            self.assertEqual(check_revocation_cache(None), [])
+
+    def test_deploy_check_rejects_cache_carts_in_a_per_process_cache(self):
+        self.assertEqual(check_cart_cache(None), [])
+        with override_settings(GASTRO_CARTS={'BACKEND': 'gastro.carts.CacheCartStore'}):
+            self.assertEqual([error.id for error in check_cart_cache(None)], ['gastro.E002'])
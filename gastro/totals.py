@@ -0,0 +1,31 @@
+from django.db.models import DecimalField, F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import Order, OrderItem
+
+MONEY = DecimalField(max_digits=10, decimal_places=2)
+
+
+def cart_total(items_prefix='items__'):
+    # Sum of quantity * unit_price over a cart's items, for use in .annotate().
+    return Coalesce(
+        Sum(F(f'{items_prefix}quantity') * F(f'{items_prefix}product__unit_price'), output_field=MONEY),
+        Value(0), output_field=MONEY)
+
+
+def order_totals():
+    # Correlated subqueries computing Order.subtotal / Order.item_count from the order's items.
+    items = OrderItem.objects.filter(order_id=OuterRef('pk')).order_by().values('order_id')
+    subtotal = items.annotate(total=Sum(F('quantity') * F('unit_price'), output_field=MONEY)).values('total')
+    item_count = items.annotate(count=Sum('quantity')).values('count')
+    return {
+        'subtotal': Coalesce(Subquery(subtotal, output_field=MONEY), Value(0), output_field=MONEY),
+        'item_count': Coalesce(Subquery(item_count, output_field=IntegerField()), Value(0)),
+    }
+
+
+def refresh_order_totals(queryset=None):
+    """Recomputes the denormalized totals of the given orders in one UPDATE."""
+    if queryset is None:
+        queryset = Order.objects.all()
+    return queryset.update(**order_totals())
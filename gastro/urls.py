@@ -21,4 +21,6 @@ carts_router = routers.NestedDefaultRouter(router,'carts',lookup='cart')
 carts_router.register('items',views.CartItemViewSet,basename='cart-items')
 
 
-urlpatterns = router.urls + carts_router.urls
\ No newline at end of file
+urlpatterns = router.urls + carts_router.urls + [
+    path('events/', views.event_stream, name='events'),
+]
\ No newline at end of file
@@ -3,18 +3,37 @@ from rest_framework.mixins import CreateModelMixin,RetrieveModelMixin,DestroyMod
 from rest_framework.viewsets import ModelViewSet,GenericViewSet, ReadOnlyModelViewSet
 from rest_framework.views import APIView
 from rest_framework.permissions import AllowAny, DjangoModelPermissions, DjangoModelPermissionsOrAnonReadOnly, IsAdminUser, IsAuthenticated
-from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.filters import OrderingFilter
 from rest_framework.response import Response
 from rest_framework.decorators import action, permission_classes
+from rest_framework.exceptions import AuthenticationFailed, PermissionDenied
+from rest_framework_simplejwt.exceptions import InvalidToken
 
+from .authentication import RoleClaimsAuthentication, ais_revoked, has_role_claims
+from .conditional import ConditionalGetMixin
 from .filters import ProductFilter
-from .pagination import DefaultPagination
-from .permissions import IsAdminOrReadOnly,IsUserCustomer,IsUserOwner,IsUserWaiter
-from .models import  Cart, CartItem,Customer,Product,Collection,Waiter,RestaurantTable,TableReservation,Owner,Restaurant,Order,OrderItem
+from .pagination import KeysetPagination
+from .read_serializers import (ORDER_FIELDS, PRODUCT_FIELDS, TABLE_FIELDS, ValuesListMixin, order_item_rows,
+                               serialize_orders, serialize_products, serialize_tables)
+from .permissions import IsAdminOrReadOnly,IsUserCustomer,IsUserOwner,IsUserWaiter,IsUserOwnerOrWaiter
+from .models import  Cart, CartItem,Customer,Product,Collection,Waiter,RestaurantTable,TableReservation,Restaurant,Order,OrderItem
 from .serializers import CartSerializer,CartItemSerializer,AddCartItemSerializer, UpdateCartItemSerializer,CustomerSerializer,ProductSerializer , \
-CollectionSerializer,CreateOrderSerializer,WaiterSerializer,RestaurantTableSerializer,TableReservationSerializer,RestaurantSerializer,OrderSerializer,UpdateOrderSerializer
-
+CollectionSerializer,CreateOrderSerializer,WaiterSerializer,RestaurantTableSerializer,TableReservationSerializer,RestaurantSerializer,OrderSerializer,UpdateOrderSerializer, \
+AvailabilitySerializer,BulkAddCartItemSerializer,KitchenTicketBatchSerializer,KitchenRushSerializer,SalesReportSerializer,MenuImportSerializer,OrderExportSerializer
+from .carts import get_cart_store
+from .reservations import available_tables
+from .floorplan import get_floor_plan
+from .menu import get_menu_document
+from .search import ProductSearchFilter
+from .roles import aget_role_context
+from . import events, kitchen, menu_io, order_export, rollups
+
+import time
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
+from django.db.models import Q
 from django.db.models.aggregates import Count
 
 
@@ -22,16 +41,20 @@ from django.db.models.aggregates import Count
 #Túto cast robil Adam Turčan                                                       |  
 ################################################################################## V
 
-class ProductViewSet(ModelViewSet):
+class ProductViewSet(ConditionalGetMixin, ValuesListMixin, ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    list_fields = PRODUCT_FIELDS
+    filter_backends = [DjangoFilterBackend, ProductSearchFilter, OrderingFilter]
     filterset_class = ProductFilter
-    pagination_class = DefaultPagination    
-    search_fields = ['title', 'description','restaurant']
+    pagination_class = KeysetPagination
+    search_fields = ['title', 'description']
     ordering_fields = ['unit_price', 'last_update']
     permission_classes = [IsAuthenticated] 
+    query_budget = {'list': 3, 'retrieve': 2}
 
+    def serialize_rows(self, rows):
+        return serialize_products(rows)
 
     def retrieve(self, request, *args, **kwargs):
         try:
@@ -41,66 +64,70 @@ class ProductViewSet(ModelViewSet):
         except Product.DoesNotExist:
             return Response({"error": "Product does not exist."}, status=status.HTTP_404_NOT_FOUND)
 
+    def get_restaurant_scope(self):
+        return self.request.query_params.get('restaurant', None) or self.request.role.restaurant_id
+
     def get_queryset(self):
-        search_query = self.request.query_params.get('restaurant', None)
-        try:
-            owner = Owner.objects.get(user=self.request.user)
-            restaurant = owner.restaurant
-            if search_query:
-                queryset = Product.objects.filter(restaurant_id=search_query)
-            else:
-                queryset = Product.objects.filter(restaurant=restaurant)
-        except Owner.DoesNotExist:
-            try:
-                waiter = Waiter.objects.get(user=self.request.user)
-                restaurant = waiter.restaurant
-
-                if search_query:
-                    queryset = Product.objects.filter(restaurant_id=search_query)
-                else:     
-                    queryset = Product.objects.filter(restaurant=restaurant)
-            except Waiter.DoesNotExist:                      
-                if search_query:
-                    queryset = Product.objects.filter(restaurant_id=search_query)
-                    
-                else:
-                    queryset = Product.objects.none()
-                              
+        restaurant_id = self.get_restaurant_scope()
+        if restaurant_id:
+            queryset = Product.objects.filter(restaurant_id=restaurant_id)
+        else:
+            queryset = Product.objects.none()
         return queryset
 
     def create(self,request,*args,**kwargs):
         try:
-                user = request.user
-                restaurant = None
-            
-                owner = Owner.objects.filter(user=user).first()
-                if owner:
-                    restaurant = owner.restaurant
-                else:
-            
-                    waiter = Waiter.objects.filter(user=user).first()
-                    if waiter:
-                        restaurant = waiter.restaurant
+                restaurant_id = request.role.restaurant_id
                 
-                if restaurant:
+                if restaurant_id:
                     serializer = self.get_serializer(data=request.data)
                     serializer.is_valid(raise_exception=True)
-                    serializer.save(restaurant=restaurant) 
+                    serializer.save(restaurant_id=restaurant_id) 
                     return Response(serializer.data, status=status.HTTP_201_CREATED)
                 else:
                     return Response({"error": "You are not associated with any restaurant. Unable to create product."}, status=status.HTTP_403_FORBIDDEN)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=['POST'], url_path='import')
+    def import_menu(self, request):
+        restaurant_id = request.role.restaurant_id
+        if not restaurant_id:
+            return Response({"error": "You are not associated with any restaurant. Unable to import products."}, status=status.HTTP_403_FORBIDDEN)
+
+        upload = request.FILES.get('file')
+        try:
+            rows = menu_io.parse_upload(upload) if upload else request.data
+        except (UnicodeDecodeError, ValueError) as e:
+            return Response({"error": f"Could not read the uploaded file: {e}"}, status=status.HTTP_400_BAD_REQUEST)
+        if isinstance(rows, list):
+            rows = {'products': rows}
+
+        serializer = MenuImportSerializer(data=rows)
+        serializer.is_valid(raise_exception=True)
+        return Response(menu_io.import_menu(restaurant_id, serializer.validated_data['products']))
+
+    @action(detail=False, methods=['GET'], url_path='export')
+    def export_menu(self, request):
+        restaurant_id = self.get_restaurant_scope()
+        if not restaurant_id:
+            return Response({"error": "restaurant is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # ?format= is taken by DRF's content negotiation.
+        if request.query_params.get('file_format', 'csv') == 'json':
+            response = StreamingHttpResponse(menu_io.stream_json(restaurant_id), content_type='application/json')
+            filename = f'menu-{restaurant_id}.json'
+        else:
+            response = StreamingHttpResponse(menu_io.stream_csv(restaurant_id), content_type='text/csv')
+            filename = f'menu-{restaurant_id}.csv'
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
     def destroy(self, request, *args, **kwargs):
         try:
             product = self.get_object()
-            user = request.user
-                        
-            owner = Owner.objects.filter(user=user, restaurant=product.restaurant).first()
-            waiter = Waiter.objects.filter(user=user, restaurant=product.restaurant).first()
                         
-            if owner or waiter:
+            if request.role.works_at(product.restaurant_id):
                 if OrderItem.objects.filter(product=product).exists():
                     return Response({'error': 'Product cannot be deleted because it is associated with an order item.'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
                 self.perform_destroy(product)
@@ -113,12 +140,8 @@ class ProductViewSet(ModelViewSet):
     def update(self, request, *args, **kwargs):
         try:
             instance = self.get_object()
-            user = request.user
                         
-            owner = Owner.objects.filter(user=user, restaurant=instance.restaurant).first()
-            waiter = Waiter.objects.filter(user=user, restaurant=instance.restaurant).first()
-                        
-            if owner or waiter:
+            if request.role.works_at(instance.restaurant_id):
                 serializer = self.get_serializer(instance, data=request.data)
                 serializer.is_valid(raise_exception=True)
                 serializer.save()
@@ -129,11 +152,12 @@ class ProductViewSet(ModelViewSet):
         except Product.DoesNotExist:
             return Response({"error": "Product does not exist."}, status=status.HTTP_404_NOT_FOUND)
    
-class CollectionViewSet(ModelViewSet):
+class CollectionViewSet(ConditionalGetMixin, ModelViewSet):
     queryset = Collection.objects.annotate(
         products_count=Count('products')).all()
     serializer_class = CollectionSerializer
     permission_classes = [IsAuthenticated] 
+    query_budget = {'list': 3, 'retrieve': 2}
 
     def retrieve(self, request, *args, **kwargs):
         try:
@@ -145,49 +169,23 @@ class CollectionViewSet(ModelViewSet):
 
     def get_queryset(self):
         search_query = self.request.query_params.get('restaurant', None)
-        try:
-            owner = Owner.objects.get(user=self.request.user)
-            restaurant = owner.restaurant
-            if search_query:
-                queryset = Collection.objects.filter(restaurant_id=search_query)
-            else:
-                queryset = Collection.objects.filter(restaurant=restaurant)
-        except Owner.DoesNotExist:
-            try:
-                waiter = Waiter.objects.get(user=self.request.user)
-                restaurant = waiter.restaurant
-
-                if search_query:
-                    queryset = Collection.objects.filter(restaurant_id=search_query)
-                else:     
-                    queryset = Collection.objects.filter(restaurant=restaurant)
-            except Waiter.DoesNotExist:                      
-                if search_query:
-                    queryset = Collection.objects.filter(restaurant_id=search_query)
-                    
-                else:
-                    queryset = Collection.objects.none()
-                              
+        restaurant_id = self.request.role.restaurant_id
+        if search_query:
+            queryset = Collection.objects.filter(restaurant_id=search_query)
+        elif restaurant_id:
+            queryset = Collection.objects.filter(restaurant_id=restaurant_id)
+        else:
+            queryset = Collection.objects.none()
         return queryset
 
     def create(self,request,*args,**kwargs):
         try:
-                user = request.user
-                restaurant = None
-            
-                owner = Owner.objects.filter(user=user).first()
-                if owner:
-                    restaurant = owner.restaurant
-                else:
-            
-                    waiter = Waiter.objects.filter(user=user).first()
-                    if waiter:
-                        restaurant = waiter.restaurant
+                restaurant_id = request.role.restaurant_id
             
-                if restaurant:
+                if restaurant_id:
                     serializer = self.get_serializer(data=request.data)
                     serializer.is_valid(raise_exception=True)
-                    serializer.save(restaurant=restaurant) 
+                    serializer.save(restaurant_id=restaurant_id) 
                     return Response(serializer.data, status=status.HTTP_201_CREATED)
                 else:
                     return Response({"error": "You are not associated with any restaurant. Unable to create collection."}, status=status.HTTP_403_FORBIDDEN)
@@ -197,12 +195,8 @@ class CollectionViewSet(ModelViewSet):
     def destroy(self, request, *args, **kwargs):
         try:
             collection = self.get_object()
-            user = request.user
                     
-            owner = Owner.objects.filter(user=user, restaurant=collection.restaurant).first()
-            waiter = Waiter.objects.filter(user=user, restaurant=collection.restaurant).first()
-                    
-            if owner or waiter:
+            if request.role.works_at(collection.restaurant_id):
                 if Product.objects.filter(collection_id=kwargs['pk']).exists():
                      return Response({'error': 'Collection cannot be deleted because it includes one or more products.'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
                 self.perform_destroy(collection)
@@ -215,12 +209,8 @@ class CollectionViewSet(ModelViewSet):
     def update(self, request, *args, **kwargs):
         try:
             instance = self.get_object()
-            user = request.user
-                        
-            owner = Owner.objects.filter(user=user, restaurant=instance.restaurant).first()
-            waiter = Waiter.objects.filter(user=user, restaurant=instance.restaurant).first()
                         
-            if owner or waiter:
+            if request.role.works_at(instance.restaurant_id):
                 serializer = self.get_serializer(instance, data=request.data)
                 serializer.is_valid(raise_exception=True)
                 serializer.save()
@@ -235,10 +225,30 @@ class CartViewSet(CreateModelMixin,RetrieveModelMixin, GenericViewSet, DestroyMo
     queryset = Cart.objects.prefetch_related('items__product').all()
     serializer_class = CartSerializer
     permission_classes = [IsUserCustomer]
+    query_budget = {'retrieve': 4}
+    # Carts are read right after every change; replication lag would lose items.
+    replica_reads = False
+
+    def create(self, request, *args, **kwargs):
+        cart = get_cart_store().create_cart()
+        return Response(CartSerializer(cart).data, status=status.HTTP_201_CREATED)
+
+    def retrieve(self, request, pk=None):
+        cart = get_cart_store().get_cart(pk)
+        if cart is None:
+            return Response({"error": "Cart does not exist."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(CartSerializer(cart).data)
+
+    def destroy(self, request, pk=None):
+        if not get_cart_store().delete_cart(pk):
+            return Response({"error": "Cart does not exist."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(status=status.HTTP_204_NO_CONTENT)
     
 class CartItemViewSet(ModelViewSet):
     http_method_names = ['get','post','patch','delete']
     permission_classes = [IsUserCustomer]
+    query_budget = {'list': 2, 'retrieve': 2}
+    replica_reads = False
 
     def get_serializer_class(self):
         if self.request.method   == 'POST':
@@ -253,10 +263,69 @@ class CartItemViewSet(ModelViewSet):
     def get_queryset(self):
         return CartItem.objects.filter(cart_id=self.kwargs['cart_pk']).select_related('product')
 
-class OrderViewSet(ModelViewSet):
+    # Items are read and written through the configured cart store, not the queryset.
+    def list(self, request, cart_pk=None):
+        items = get_cart_store().get_items(cart_pk)
+        if items is None:
+            return Response({"error": "Cart does not exist."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(CartItemSerializer(items, many=True).data)
+
+    def retrieve(self, request, pk=None, cart_pk=None):
+        item = get_cart_store().get_item(cart_pk, pk)
+        if item is None:
+            return Response({"error": "Cart item does not exist."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(CartItemSerializer(item).data)
+
+    def create(self, request, cart_pk=None):
+        serializer = AddCartItemSerializer(data=request.data, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        if serializer.save() is None:
+            return Response({"error": "Cart does not exist."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def partial_update(self, request, pk=None, cart_pk=None):
+        serializer = UpdateCartItemSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        item = get_cart_store().update_item(cart_pk, pk, serializer.validated_data['quantity'])
+        if item is None:
+            return Response({"error": "Cart item does not exist."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(UpdateCartItemSerializer(item).data)
+
+    def destroy(self, request, pk=None, cart_pk=None):
+        if not get_cart_store().remove_item(cart_pk, pk):
+            return Response({"error": "Cart item does not exist."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=False, methods=['POST'])
+    def bulk(self, request, cart_pk=None):
+        serializer = BulkAddCartItemSerializer(data=request.data, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        items = serializer.save()
+        if items is None:
+            return Response({"error": "Cart does not exist."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(CartItemSerializer(items, many=True).data)
+
+class OrderViewSet(ConditionalGetMixin, ValuesListMixin, ModelViewSet):
     http_method_names = ['get', 'post', 'patch', 'delete', 'head', 'options']
+    pagination_class = KeysetPagination
+    keyset_ordering = ['-placed_at', '-id']
+    list_fields = ORDER_FIELDS
+    query_budget = {'list': 5, 'retrieve': 4, 'me': 4}
+
+    def serialize_rows(self, rows):
+        return serialize_orders(rows, order_item_rows([row['id'] for row in rows]))
 
-    def get_permissions(self):        
+    @staticmethod
+    def conditional_related(queryset):
+        # Orders are served with their products' titles and prices. Products in use can't be deleted.
+        return Product.objects.filter(restaurant_id__in=queryset.values('restaurant_id'))
+
+    def get_permissions(self):
+        # Not IsUserCustomer: owners and waiters read their restaurant's orders too (the
+        # staff order list, the benchmarks). get_queryset scopes every role, and users
+        # without one get no orders.
+        if self.action in ('list', 'retrieve'):
+            return [IsAuthenticated()]
         return [IsUserCustomer()]
     
     def create(self, request, *args, **kwargs):
@@ -268,13 +337,13 @@ class OrderViewSet(ModelViewSet):
         if not table_id:
             return Response({"error": "table_id is required"}, status=status.HTTP_400_BAD_REQUEST)
         
-        try:
-            restaurant = Restaurant.objects.get(pk=restaurant_id)
-            table = RestaurantTable.objects.get(pk=table_id)
-        except (Restaurant.DoesNotExist, RestaurantTable.DoesNotExist):
+        table = RestaurantTable.objects.filter(pk=table_id).only('id', 'restaurant_id').first()
+        if table is None:
             return Response({"error": "Restaurant or Table with the provided ID does not exist"}, status=status.HTTP_404_NOT_FOUND)
+        if str(table.restaurant_id) != str(restaurant_id):
+            return Response({"error": "The table does not belong to the given restaurant."}, status=status.HTTP_400_BAD_REQUEST)
         
-        serializer = CreateOrderSerializer(data=request.data, context={'user_id': request.user.id, 'restaurant': restaurant, 'table': table})
+        serializer = CreateOrderSerializer(data=request.data, context={'customer_id': request.role.customer_id, 'table': table})
         serializer.is_valid(raise_exception=True)
 
         order = serializer.save()
@@ -290,14 +359,12 @@ class OrderViewSet(ModelViewSet):
         
     @action(detail=False, methods=['GET'], url_path='me')
     def me(self, request):
-        user = request.user
-        try:
-            customer = Customer.objects.get(user=user)
-            reservations = Order.objects.filter(customer=customer)
-            serializer = self.get_serializer(reservations, many=True)
-            return Response(serializer.data)
-        except Customer.DoesNotExist:
+        customer_id = request.role.customer_id
+        if customer_id is None:
             return Response({"error": "No Customer object associated with the request user."}, status=status.HTTP_400_BAD_REQUEST)
+        orders = Order.objects.filter(customer_id=customer_id)
+        self.check_list_not_modified(orders)
+        return self.list_rows(orders)
     
     def destroy(self, request, *args, **kwargs):
          return Response({"error": "Orders are not allowed to be deleted for safety purposes."}, status=status.HTTP_403_FORBIDDEN)
@@ -305,11 +372,8 @@ class OrderViewSet(ModelViewSet):
     def update(self, request, *args, **kwargs):
         try:
             instance = self.get_object()
-                        
-            user = request.user
-            restaurant = instance.restaurant
             
-            if Owner.objects.filter(user=user, restaurant=restaurant).exists() or Waiter.objects.filter(user=user, restaurant=restaurant).exists():
+            if request.role.works_at(instance.restaurant_id):
                 serializer = self.get_serializer(instance, data=request.data)
                 serializer.is_valid(raise_exception=True)
                 serializer.save()
@@ -321,21 +385,15 @@ class OrderViewSet(ModelViewSet):
             return Response({"error": "Order does not exist."}, status=status.HTTP_404_NOT_FOUND)
 
     def get_queryset(self):
-        user = self.request.user
-        try:
-            owner = Owner.objects.get(user=user)            
-            restaurant = owner.restaurant
-            queryset = Order.objects.filter(table__restaurant=restaurant)
-        except Owner.DoesNotExist:
-            try:
-                waiter = Waiter.objects.get(user=user)                
-                restaurant = waiter.restaurant
-                queryset = Order.objects.filter(table__restaurant=restaurant)
-            except Waiter.DoesNotExist: 
-                customer = Customer.objects.get(user=user)
-                queryset = Order.objects.filter(customer=customer)
-                    
-        return queryset 
+        role = self.request.role
+        if role.restaurant_id:
+            queryset = Order.objects.filter(restaurant_id=role.restaurant_id)
+        elif role.is_customer:
+            queryset = Order.objects.filter(customer_id=role.customer_id)
+        else:
+            queryset = Order.objects.none()
+        # OrderSerializer -> items -> SimpleProductSerializer
+        return queryset.prefetch_related('items__product')
 ##################################################################################
 ##################################################################################
 ##################################################################################
@@ -347,9 +405,11 @@ class OrderViewSet(ModelViewSet):
 #Túto časť robil Matej Turňa                                                       |  
 ################################################################################## V
 class CustomerViewSet(ModelViewSet):
-    queryset = Customer.objects.all()
+    queryset = Customer.objects.select_related('user').all()
     serializer_class = CustomerSerializer    
+    pagination_class = KeysetPagination
     permission_classes = [IsAdminUser]###
+    query_budget = {'list': 1}
   
     @action(detail=False, methods=['GET', 'PUT'], permission_classes=[IsAuthenticated])
     def me(self, request):
@@ -377,6 +437,7 @@ class WaiterViewSet(ModelViewSet):
     queryset = Waiter.objects.all()
     serializer_class = WaiterSerializer    
     permission_classes = [IsUserOwner]
+    query_budget = {'list': 2}
   
     @action(detail=False, methods=['GET', 'PUT'], permission_classes=[IsAuthenticated])
     def me(self, request):
@@ -391,13 +452,11 @@ class WaiterViewSet(ModelViewSet):
             return Response(serializer.data)
 
     def get_queryset(self):
-        
-        owner = Owner.objects.get(user=self.request.user)
-        
-        restaurant = owner.restaurant
-        
-        queryset = Waiter.objects.filter(restaurant=restaurant)
-        return queryset
+        restaurant_id = self.request.role.owner_restaurant_id
+        if restaurant_id is None:
+            return Waiter.objects.none()
+        # WaiterSerializer.to_representation reads instance.user on list.
+        return Waiter.objects.filter(restaurant_id=restaurant_id).select_related('user')
 
     def get_permissions(self):    
         if self.action == 'me':
@@ -405,12 +464,17 @@ class WaiterViewSet(ModelViewSet):
         else:
             return super().get_permissions()
 
-class RestaurantTableView(ModelViewSet):
+class RestaurantTableView(ConditionalGetMixin, ValuesListMixin, ModelViewSet):
     queryset = RestaurantTable.objects.all()
     serializer_class = RestaurantTableSerializer
     permission_classes = [IsAuthenticated]
     filter_backends = [filters.SearchFilter]
     search_fields = ['restaurant__id']
+    list_fields = TABLE_FIELDS
+    query_budget = {'list': 3}
+
+    def serialize_rows(self, rows):
+        return serialize_tables(rows)
 
     def retrieve(self, request, *args, **kwargs):
         try:
@@ -423,11 +487,8 @@ class RestaurantTableView(ModelViewSet):
     def destroy(self, request, *args, **kwargs):
         try:
             instance = self.get_object()
-            user = request.user
-            restaurant = instance.restaurant
             
-            if Owner.objects.filter(user=user, restaurant=restaurant).exists() or \
-               Waiter.objects.filter(user=user, restaurant=restaurant).exists():
+            if request.role.works_at(instance.restaurant_id):
                 self.perform_destroy(instance)
                 return Response(status=status.HTTP_204_NO_CONTENT)
             else:
@@ -439,11 +500,8 @@ class RestaurantTableView(ModelViewSet):
     def update(self, request, *args, **kwargs):
         try:
             instance = self.get_object()
-                        
-            user = request.user
-            restaurant = instance.restaurant
             
-            if Owner.objects.filter(user=user, restaurant=restaurant).exists() or Waiter.objects.filter(user=user, restaurant=restaurant).exists():
+            if request.role.works_at(instance.restaurant_id):
                 serializer = self.get_serializer(instance, data=request.data)
                 serializer.is_valid(raise_exception=True)
                 serializer.save()
@@ -456,22 +514,12 @@ class RestaurantTableView(ModelViewSet):
 
     def create(self, request, *args, **kwargs):
         try:
-            user = request.user
-            restaurant = None
+            restaurant_id = request.role.restaurant_id
             
-            owner = Owner.objects.filter(user=user).first()
-            if owner:
-                restaurant = owner.restaurant
-            else:
-            
-                waiter = Waiter.objects.filter(user=user).first()
-                if waiter:
-                    restaurant = waiter.restaurant
-            
-            if restaurant:
+            if restaurant_id:
                 serializer = self.get_serializer(data=request.data)
                 serializer.is_valid(raise_exception=True)
-                serializer.save(restaurant=restaurant) 
+                serializer.save(restaurant_id=restaurant_id) 
                 return Response(serializer.data, status=status.HTTP_201_CREATED)
             else:
                 return Response({"error": "You are not associated with any restaurant. Unable to create table."}, status=status.HTTP_403_FORBIDDEN)
@@ -480,89 +528,55 @@ class RestaurantTableView(ModelViewSet):
 
     def get_queryset(self):
         search_query = self.request.query_params.get('restaurant', None)
-        try:
-            owner = Owner.objects.get(user=self.request.user)
-            restaurant = owner.restaurant
-            if search_query:
-                queryset = RestaurantTable.objects.filter(restaurant_id=search_query)
-            else:
-                queryset = RestaurantTable.objects.filter(restaurant=restaurant)
-        except Owner.DoesNotExist:
-            try:
-                waiter = Waiter.objects.get(user=self.request.user)
-                restaurant = waiter.restaurant
-
-                if search_query:
-                    queryset = RestaurantTable.objects.filter(restaurant_id=search_query)
-                else:     
-                    queryset = RestaurantTable.objects.filter(restaurant=restaurant)
-            except Waiter.DoesNotExist:                      
-                if search_query:
-                    queryset = RestaurantTable.objects.filter(restaurant_id=search_query)
-                    
-                else:
-                    queryset = RestaurantTable.objects.none()
-                              
+        restaurant_id = self.request.role.restaurant_id
+        if search_query:
+            queryset = RestaurantTable.objects.filter(restaurant_id=search_query)
+        elif restaurant_id:
+            queryset = RestaurantTable.objects.filter(restaurant_id=restaurant_id)
+        else:
+            queryset = RestaurantTable.objects.none()
         return queryset
 
-class TableReservationView(ModelViewSet):
+class TableReservationView(ConditionalGetMixin, ModelViewSet):
     queryset = TableReservation.objects.all()
     serializer_class = TableReservationSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+    keyset_ordering = ['date_time_from', 'id']
+    query_budget = {'list': 3, 'me': 2}
 
     def get_queryset(self):
-        user = self.request.user
-        
-        
-        owner_reservations = TableReservation.objects.none()
-        waiter_reservations = TableReservation.objects.none()
-        customer_reservations = TableReservation.objects.none()
+        role = self.request.role
 
-        try:
-            owner = Owner.objects.get(user=user)            
-            restaurant = owner.restaurant
-            owner_reservations = TableReservation.objects.filter(table__restaurant=restaurant)
-        except Owner.DoesNotExist:
-            pass
-            
-        try:
-            waiter = Waiter.objects.get(user=user)                
-            restaurant = waiter.restaurant
-            waiter_reservations = TableReservation.objects.filter(table__restaurant=restaurant)
-        except Waiter.DoesNotExist: 
-            pass
+        scope = Q()
+        if role.restaurant_ids:
+            scope |= Q(table__restaurant_id__in=role.restaurant_ids)
+        if role.is_customer:
+            scope |= Q(customer_id=role.customer_id)
 
-        try:
-            customer = Customer.objects.get(user=user)
-            customer_reservations = TableReservation.objects.filter(customer=customer)
-        except Customer.DoesNotExist:
-            pass
-
-    
-        queryset = owner_reservations | waiter_reservations | customer_reservations
-        return queryset.distinct()
+        if not scope:
+            return TableReservation.objects.none()
+        return TableReservation.objects.filter(scope)
 
     @action(detail=False, methods=['GET'], url_path='me')
     def me(self, request):
-        user = request.user
-        try:
-            customer = Customer.objects.get(user=user)
-            reservations = TableReservation.objects.filter(customer=customer)
-            serializer = self.get_serializer(reservations, many=True)
-            return Response(serializer.data)
-        except Customer.DoesNotExist:
+        customer_id = request.role.customer_id
+        if customer_id is None:
             return Response({"error": "No Customer object associated with the request user."}, status=status.HTTP_400_BAD_REQUEST)
+        reservations = TableReservation.objects.filter(customer_id=customer_id)
+        serializer = self.get_serializer(reservations, many=True)
+        return Response(serializer.data)
 
     def update(self, request, *args, **kwargs):
         reservation = self.get_object()
-        user = request.user
-        restaurant = reservation.table.restaurant if reservation.table else None
+        role = request.role
+        restaurant_id = reservation.table.restaurant_id if reservation.table else None
 
-        if reservation.customer.user == user:
+        if role.is_customer and reservation.customer_id == role.customer_id:
             return super().update(request, *args, **kwargs)
 
-        if restaurant:
-            if Owner.objects.filter(user=user, restaurant=restaurant).exists() or Waiter.objects.filter(user=user, restaurant=restaurant).exists():
+        if restaurant_id:
+            if role.works_at(restaurant_id):
                 return super().update(request, *args, **kwargs)
             else:
                 return Response({"error": "You do not have permission to perform this action."}, status=status.HTTP_403_FORBIDDEN)
@@ -571,27 +585,146 @@ class TableReservationView(ModelViewSet):
 
     def destroy(self, request, *args, **kwargs):
         reservation = self.get_object()
-        user = request.user
-        restaurant = reservation.table.restaurant if reservation.table else None
+        role = request.role
+        restaurant_id = reservation.table.restaurant_id if reservation.table else None
 
-        if reservation.customer.user == user:
+        if role.is_customer and reservation.customer_id == role.customer_id:
             return super().destroy(request, *args, **kwargs)
 
-        if restaurant:
-            if Owner.objects.filter(user=user, restaurant=restaurant).exists() or Waiter.objects.filter(user=user, restaurant=restaurant).exists():
+        if restaurant_id:
+            if role.works_at(restaurant_id):
                 return super().destroy(request, *args, **kwargs)
             else:
                 return Response({"error": "You do not have permission to perform this action."}, status=status.HTTP_403_FORBIDDEN)
         else:
             return Response({"error": "No restaurant associated with the reservation's table."}, status=status.HTTP_400_BAD_REQUEST)
     def perform_create(self, serializer):
-        customer = Customer.objects.get(user=self.request.user)
-        serializer.save(customer=customer)
+        customer_id = self.request.role.customer_id
+        if customer_id is None:
+            raise PermissionDenied("Only customers can make reservations.")
+        serializer.save(customer_id=customer_id)
 
 class RestaurantViewSet(ReadOnlyModelViewSet):
     queryset = Restaurant.objects.all()
     serializer_class = RestaurantSerializer
     permission_classes = [AllowAny]
+    query_budget = {'list': 1, 'retrieve': 1, 'availability': 2, 'menu': 3, 'floor_plan': 4, 'kitchen_queue': 3, 'sales': 3}
+
+    @action(detail=True, methods=['GET'])
+    def availability(self, request, pk=None):
+        restaurant = self.get_object()
+        params = AvailabilitySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+
+        tables = available_tables(restaurant.pk, **params.validated_data)
+        serializer = RestaurantTableSerializer(tables, many=True)
+        return Response(serializer.data)
+
+    @action(detail=True, methods=['GET'])
+    def menu(self, request, pk=None):
+        try:
+            restaurant_id = int(pk)
+        except ValueError:
+            return Response({"error": "Restaurant does not exist."}, status=status.HTTP_404_NOT_FOUND)
+
+        document = get_menu_document(restaurant_id)
+        if document is None:
+            return Response({"error": "Restaurant does not exist."}, status=status.HTTP_404_NOT_FOUND)
+        return HttpResponse(document, content_type='application/json')
+
+    @action(detail=True, methods=['GET'], url_path='floor-plan', permission_classes=[IsUserOwnerOrWaiter])
+    def floor_plan(self, request, pk=None):
+        try:
+            restaurant_id = int(pk)
+        except ValueError:
+            return Response({"error": "Restaurant does not exist."}, status=status.HTTP_404_NOT_FOUND)
+
+        if not (request.role.works_at(restaurant_id) or request.user.is_staff):
+            return Response({"error": "You are not authorized to view this restaurant's floor plan."}, status=status.HTTP_403_FORBIDDEN)
+
+        snapshot = get_floor_plan(restaurant_id)
+        if snapshot is None:
+            return Response({"error": "Restaurant does not exist."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(snapshot)
+
+    def get_kitchen_restaurant_id(self, request, pk):
+        try:
+            restaurant_id = int(pk)
+        except ValueError:
+            return None
+        if not (request.role.works_at(restaurant_id) or request.user.is_staff):
+            self.permission_denied(request, message="You are not authorized to view this restaurant's kitchen queue.")
+        return restaurant_id
+
+    @action(detail=True, methods=['GET'], permission_classes=[IsUserOwner])
+    def sales(self, request, pk=None):
+        try:
+            restaurant_id = int(pk)
+        except ValueError:
+            return Response({"error": "Restaurant does not exist."}, status=status.HTTP_404_NOT_FOUND)
+
+        if not (request.role.owner_restaurant_id == restaurant_id or request.user.is_staff):
+            return Response({"error": "You are not authorized to view this restaurant's sales."}, status=status.HTTP_403_FORBIDDEN)
+
+        params = SalesReportSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        return Response(rollups.sales_report(restaurant_id, **params.validated_data))
+
+    @action(detail=True, methods=['GET'], url_path='orders/export', permission_classes=[IsUserOwner])
+    def export_orders(self, request, pk=None):
+        try:
+            restaurant_id = int(pk)
+        except ValueError:
+            return Response({"error": "Restaurant does not exist."}, status=status.HTTP_404_NOT_FOUND)
+
+        if not (request.role.owner_restaurant_id == restaurant_id or request.user.is_staff):
+            return Response({"error": "You are not authorized to export this restaurant's orders."}, status=status.HTTP_403_FORBIDDEN)
+
+        params = OrderExportSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        date_from, date_to = params.validated_data['date_from'], params.validated_data['date_to']
+        if params.validated_data['file_format'] == 'ndjson':
+            response = StreamingHttpResponse(order_export.stream_ndjson(restaurant_id, date_from, date_to), content_type='application/x-ndjson')
+        else:
+            response = StreamingHttpResponse(order_export.stream_csv(restaurant_id, date_from, date_to), content_type='text/csv')
+        extension = params.validated_data['file_format']
+        response['Content-Disposition'] = f'attachment; filename="orders-{restaurant_id}-{date_from}-{date_to}.{extension}"'
+        return response
+
+    @action(detail=True, methods=['GET'], url_path='kitchen-queue', permission_classes=[IsUserOwnerOrWaiter])
+    def kitchen_queue(self, request, pk=None):
+        restaurant_id = self.get_kitchen_restaurant_id(request, pk)
+        if restaurant_id is None:
+            return Response({"error": "Restaurant does not exist."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(kitchen.kitchen_queue(restaurant_id))
+
+    @action(detail=True, methods=['POST'], url_path='kitchen-queue/ack', permission_classes=[IsUserOwnerOrWaiter])
+    def kitchen_ack(self, request, pk=None):
+        restaurant_id = self.get_kitchen_restaurant_id(request, pk)
+        if restaurant_id is None:
+            return Response({"error": "Restaurant does not exist."}, status=status.HTTP_404_NOT_FOUND)
+        serializer = KitchenTicketBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response({'updated': kitchen.acknowledge_tickets(restaurant_id, serializer.validated_data['orders'])})
+
+    @action(detail=True, methods=['POST'], url_path='kitchen-queue/bump', permission_classes=[IsUserOwnerOrWaiter])
+    def kitchen_bump(self, request, pk=None):
+        restaurant_id = self.get_kitchen_restaurant_id(request, pk)
+        if restaurant_id is None:
+            return Response({"error": "Restaurant does not exist."}, status=status.HTTP_404_NOT_FOUND)
+        serializer = KitchenTicketBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response({'updated': kitchen.bump_tickets(restaurant_id, serializer.validated_data['orders'])})
+
+    @action(detail=True, methods=['POST'], url_path='kitchen-queue/rush', permission_classes=[IsUserOwnerOrWaiter])
+    def kitchen_rush(self, request, pk=None):
+        restaurant_id = self.get_kitchen_restaurant_id(request, pk)
+        if restaurant_id is None:
+            return Response({"error": "Restaurant does not exist."}, status=status.HTTP_404_NOT_FOUND)
+        serializer = KitchenRushSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        return Response({'updated': kitchen.set_rush(restaurant_id, data['orders'], data['rush'])})
 
     def update(self, request, *args, **kwargs):
         instance = self.get_object()
@@ -599,11 +732,7 @@ class RestaurantViewSet(ReadOnlyModelViewSet):
         if not request.user.is_authenticated:
             return Response({"error": "Authentication credentials were not provided."}, status=status.HTTP_401_UNAUTHORIZED)
         
-        user = request.user
-        owner_exists = Owner.objects.filter(user=user).exists()
-        waiter_exists = Waiter.objects.filter(user=user).exists()
-
-        if owner_exists or waiter_exists:
+        if request.role.is_employee:
             serializer = self.get_serializer(instance, data=request.data)
             serializer.is_valid(raise_exception=True)
             serializer.save()
@@ -615,3 +744,83 @@ class RestaurantViewSet(ReadOnlyModelViewSet):
 ##################################################################################
 
 
+
+
+
+STREAM_KEEPALIVE_SECONDS = 15
+
+
+def authenticate_event_stream(request):
+    # EventSource cannot set headers, so the access token may also be passed as ?token=.
+    authenticator = RoleClaimsAuthentication()
+    try:
+        header = authenticator.get_header(request)
+        raw_token = authenticator.get_raw_token(header) if header else request.GET.get('token', '').encode()
+        if not raw_token:
+            return None, None
+        token = authenticator.get_validated_token(raw_token)
+        return authenticator.get_user(token), token
+    except (InvalidToken, AuthenticationFailed):
+        return None, None
+
+
+def stream_channels(role):
+    channels = [events.restaurant_channel(restaurant_id) for restaurant_id in sorted(role.restaurant_ids)]
+    if role.is_customer:
+        channels.append(events.customer_channel(role.customer_id))
+    return channels
+
+
+async def event_stream(request):
+    """
+    Server-Sent Events feed of order, table and reservation changes.
+
+    Owners and waiters receive events for their restaurant, customers for their own
+    orders and reservations. Needs the ASGI application (gastroApi/asgi.py); a WSGI
+    worker would buffer the endless stream.
+
+    The stream ends when the access token expires, is revoked, or the user's roles
+    change; the client reconnects after `retry` and is authenticated again.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({"error": "The event stream is only served by the ASGI application."}, status=status.HTTP_501_NOT_IMPLEMENTED)
+
+    user, token = await sync_to_async(authenticate_event_stream)(request)
+    if user is None:
+        return JsonResponse({"error": "Authentication credentials were not provided."}, status=status.HTTP_401_UNAUTHORIZED)
+
+    channels = stream_channels(await aget_role_context(user))
+    if not channels:
+        return JsonResponse({"error": "You are not associated with any restaurant or customer."}, status=status.HTTP_403_FORBIDDEN)
+    expires_at = token['exp']
+
+    async def still_allowed():
+        if time.time() >= expires_at:
+            return False
+        if has_role_claims(token) and await ais_revoked(token):
+            return False
+        return stream_channels(await aget_role_context(user)) == channels
+
+    async def stream():
+        subscription = events.get_broadcaster().subscribe(channels)
+        try:
+            yield 'retry: 3000\n\n'
+            checked_at = time.monotonic()
+            while True:
+                message = await subscription.get(timeout=max(min(STREAM_KEEPALIVE_SECONDS, expires_at - time.time()), 0))
+                # On every keepalive, and at least as often while events keep arriving.
+                if message is None or time.monotonic() - checked_at >= STREAM_KEEPALIVE_SECONDS:
+                    if not await still_allowed():
+                        break
+                    checked_at = time.monotonic()
+                if message is None:
+                    yield ': keepalive\n\n'
+                else:
+                    yield events.format_sse(message)
+        finally:
+            await subscription.close()
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
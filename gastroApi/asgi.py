@@ -3,6 +3,31 @@ ASGI config for gastroApi project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The /api/events/ Server-Sent Events stream is only available through this
+application, e.g. ``uvicorn gastroApi.asgi:application``. It also serves the
+restaurant list/detail, menu, product list, table list and /api/orders/me/ GETs
+with the native async views in gastro.async_views (GASTRO_ASGI_URLCONF), so a
+request waiting on the database does not hold a thread; every other request goes
+through the same sync DRF views as under WSGI.
+
+Production, one event loop per core behind gunicorn:
+
+    GASTRO_DB_PROFILE=production gunicorn gastroApi.asgi:application \\
+        -k uvicorn.workers.UvicornWorker --workers 4 \\
+        --bind 0.0.0.0:8000 --timeout 30 --graceful-timeout 30 --keep-alive 5
+
+or uvicorn alone (``uvicorn gastroApi.asgi:application --workers 4 --loop uvloop
+--http httptools --no-access-log``). Each open SSE stream stays on its worker
+until the client disconnects. This module sets GASTRO_ASGI, which turns off
+persistent connections (see settings).
+
+Async views lift the cap a thread pool puts on requests in flight, but not the
+cost of a request: the async ORM still runs each query in a thread, and Django's
+sync middleware adds a thread hop per hook, so an ASGI request takes about twice
+the CPU of a WSGI one. Measure before moving API traffic off a threaded WSGI
+server (``gunicorn gastroApi.wsgi -k gthread --threads 8``) with
+``manage.py benchmark_concurrency``.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/4.1/howto/deployment/asgi/
 """
@@ -12,5 +37,6 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gastroApi.settings')
+os.environ.setdefault('GASTRO_ASGI', '1')
 
 application = get_asgi_application()
@@ -0,0 +1,11 @@
+"""
+URL configuration of the ASGI application (GASTRO_ASGI_URLCONF): the native async
+read endpoints in gastro.async_views ahead of gastroApi.urls, which serves the rest.
+"""
+from django.urls import path, include
+
+from . import urls
+
+urlpatterns = [
+    path('api/', include('gastro.async_urls')),
+] + urls.urlpatterns
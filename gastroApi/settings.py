@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 from datetime import timedelta
 
@@ -48,11 +49,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'gastro.middleware.QueryInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'gastro.middleware.RoleContextMiddleware',
+    'gastro.middleware.ReplicaRoutingMiddleware',
+    'gastro.middleware.AsyncViewsMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'corsheaders.middleware.CorsMiddleware'
@@ -91,6 +96,75 @@ DATABASES = {
     }
 }
 
+# Production SQLite profile, enabled with GASTRO_DB_PROFILE=production. Its backend
+# (gastro.sqlite) runs the pragmas on every new connection: WAL lets readers proceed
+# during a write and synchronous=NORMAL is durable in WAL mode except on power loss. It
+# also starts transactions with BEGIN IMMEDIATE, which takes the write lock up front, so
+# concurrent writers queue on busy_timeout instead of failing with "database is locked"
+# when a read lock can't be upgraded. Connections are kept for CONN_MAX_AGE seconds and
+# checked before reuse. Compare with `manage.py benchmark_database`.
+GASTRO_SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,  # KiB
+    'temp_store': 'MEMORY',
+}
+GASTRO_SQLITE_PRODUCTION = {
+    'ENGINE': 'gastro.sqlite',
+    'CONN_MAX_AGE': 600,
+    'CONN_HEALTH_CHECKS': True,
+}
+if os.environ.get('GASTRO_DB_PROFILE') == 'production':
+    DATABASES['default'].update(GASTRO_SQLITE_PRODUCTION)
+
+# Read replicas (gastro.replicas): safe-method requests to gastro views read from one of
+# GASTRO_READ_REPLICAS; clients that have just written read from the primary for
+# GASTRO_REPLICA_PIN_SECONDS. GASTRO_DB_REPLICA=<path> adds a local SQLite copy of the
+# primary, refreshed by `manage.py sync_replica`, as a stand-in for a real replica (leave
+# it unset for the test suite: SQLite's in-memory test database can't be mirrored).
+DATABASE_ROUTERS = ['gastro.replicas.ReplicaRouter']
+GASTRO_READ_REPLICAS = []
+GASTRO_REPLICA_PIN_SECONDS = 5
+if os.environ.get('GASTRO_DB_REPLICA'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.environ['GASTRO_DB_REPLICA'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    GASTRO_READ_REPLICAS = ['replica']
+
+# The ASGI application (gastroApi/asgi.py) serves the busiest read endpoints with the
+# native async views in gastro.async_views, routed by this URLconf. Under ASGI each
+# request runs its queries in a thread of its own, so persistent connections would pile
+# up with the threads: asgi.py sets GASTRO_ASGI and connections close after every request.
+GASTRO_ASGI_URLCONF = 'gastroApi.asgi_urls'
+if os.environ.get('GASTRO_ASGI'):
+    for database in DATABASES.values():
+        database['CONN_MAX_AGE'] = 0
+
+# Menu documents, floor plans, role contexts, count caches, cache-backed carts and the
+# access token revocation list (gastro.authentication) are kept in the default cache.
+# LocMemCache is per process: it is only correct with a single worker. Deployments with
+# several workers need a shared backend, e.g. GASTRO_REDIS_URL=redis://host:6379/0;
+# `manage.py check --deploy` reports a per-process cache (gastro.E001).
+if os.environ.get('GASTRO_REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['GASTRO_REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+# Upper bound on how long a worker serves a menu that was changed through another worker.
+GASTRO_MENU_CACHE_TIMEOUT = 60 * 5
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
@@ -138,7 +212,8 @@ AUTH_USER_MODEL = 'core.User'
 REST_FRAMEWORK = {
     'COERCE_DECIMAL_TO_STRING':False,    
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # Role claims in the access token: no User or role query per request (gastro.authentication).
+        'gastro.authentication.RoleClaimsAuthentication',
        
     ),    
 }
@@ -150,7 +225,33 @@ DJOSER={
     }
 }
 
+# Access tokens carry the user's roles; they are revoked through the cache when the
+# roles change, so multi-worker deployments need a shared cache (e.g. Redis).
 SIMPLE_JWT = {
-    'ACCESS_TOKEN_LIFETIME':timedelta(days=1),
-    'AUTH_HEADER_TYPES':('JWT')
-}
\ No newline at end of file
+    'ACCESS_TOKEN_LIFETIME':timedelta(minutes=15),
+    'AUTH_HEADER_TYPES':('JWT'),
+    'AUTH_TOKEN_CLASSES':('gastro.authentication.RoleAccessToken',),
+    'TOKEN_OBTAIN_SERIALIZER':'gastro.authentication.RoleTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER':'gastro.authentication.RoleTokenRefreshSerializer',
+}
+
+# Live order/table/reservation events (/api/events/, served under ASGI).
+# The in-process backend only reaches clients connected to the same worker;
+# use 'gastro.events.RedisBroadcaster' with OPTIONS {'url': ...} for multi-worker deployments.
+GASTRO_EVENTS = {
+    'BACKEND': 'gastro.events.InProcessBroadcaster',
+    'OPTIONS': {},
+}
+
+# Carts live in the database by default; 'gastro.carts.CacheCartStore' keeps them
+# in the cache instead (OPTIONS: cache_alias, a cache shared by all workers: see
+# gastro.E002 in manage.py check --deploy). Carts expire once idle for TTL seconds.
+GASTRO_CARTS = {
+    'BACKEND': 'gastro.carts.DatabaseCartStore',
+    'TTL': 60 * 60 * 24,
+    'OPTIONS': {},
+}
+
+# Per-request query counting, N+1 detection and query_budget checks (gastro.middleware).
+GASTRO_QUERY_INSTRUMENTATION = DEBUG
+GASTRO_N_PLUS_ONE_THRESHOLD = 3